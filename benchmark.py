@@ -0,0 +1,588 @@
+"""
+Offline performance benchmark for indexing, save/load and search.
+
+A synthetic corpus (topic-clustered paragraphs of made-up words) is written
+to a temporary knowledge base and indexed with build_index(), using a
+deterministic local embedder instead of the API. The built store is then
+saved, loaded and searched with every store backend (exact, IVF, int8,
+IVF+PQ, exact across shard worker processes) and retrieval mode.
+Throughput, latency percentiles, index size and peak RSS are written as
+JSON, and a run can be compared against a stored baseline to catch
+regressions. Cold-start costs (importing lib, creating a RAGSystem,
+opening the index) are timed in fresh interpreters.
+
+Usage:
+    python benchmark.py                                   # 1k and 100k chunks
+    python benchmark.py --sizes 1k,100k,1m --output results.json
+    python benchmark.py --baseline benchmark_baseline.json   # exit 1 on regressions
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from build_index import build_index
+from lib.embedders import Embedder, register_embedder
+from lib.vector_store import SimpleVectorStore
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+DEFAULT_SIZES = "1k,100k"
+DEFAULT_DIM = 256
+# Paragraphs come out at 240-290 characters: shorter than CHUNK_SIZE and
+# longer than half of it, so every paragraph becomes exactly one chunk
+CHUNK_SIZE = 400
+PARAGRAPH_WORDS = 60
+PARAGRAPHS_PER_DOC = 20
+COMMON_WORDS = 2000
+TOPIC_WORDS = 200
+CHUNKS_PER_TOPIC = 500
+TOP_K = 10
+BATCH_SIZE = 64
+
+BACKENDS = {
+    "exact": {"ann": False, "quant": None},
+    "ivf": {"ann": True, "quant": None},
+    "int8": {"ann": False, "quant": "int8"},
+    "ivf+pq": {"ann": True, "quant": "pq"},
+}
+
+# Metric name suffixes and which direction is better, for baseline comparison
+LOWER_IS_BETTER = ("seconds", "_ms", "_mb")
+HIGHER_IS_BETTER = ("_per_s", "qps", "recall")
+# Latency changes smaller than this are timer noise, whatever the ratio
+NOISE_FLOOR_MS = 0.5
+WARMUP_QUERIES = 5
+
+# Timed from the first statement of a fresh interpreter; {path} is the index
+STARTUP_SNIPPETS = {
+    "import_lib_ms": "import lib",
+    "import_rag_system_ms": "import lib.rag_system",
+    "rag_init_ms": "from lib.rag_system import RAGSystem; RAGSystem({path!r})",
+    # Importing benchmark registers the FakeEmbedder the index records
+    "store_open_ms": (
+        "import benchmark; from lib.rag_system import RAGSystem; RAGSystem({path!r}).load()"
+    ),
+}
+STARTUP_RUNS = 5
+# Shard worker processes for the sharded exact search (0 skips it)
+SHARDS = os.cpu_count() or 1
+
+
+def parse_size(text):
+    """'1k' -> 1000, '1m' -> 1000000, '2500' -> 2500."""
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def _word(i):
+    """Deterministic made-up word for vocabulary id ``i``."""
+    consonants, vowels = "bcdfghjklmnprstvz", "aeiou"
+    syllables = []
+    while True:
+        i, digit = divmod(i, len(consonants) * len(vowels))
+        syllables.append(consonants[digit // len(vowels)] + vowels[digit % len(vowels)])
+        if i == 0:
+            return "".join(syllables)
+        i -= 1
+
+
+@register_embedder
+class FakeEmbedder(Embedder):
+    """
+    Deterministic offline stand-in for the embedding API.
+
+    A text's vector is the sum of per-word random vectors (each seeded by a
+    hash of the word), so texts sharing words are similar and the same text
+    always gets the same vector, in any process. Indexes built with it
+    record it as their embedder; it is registered, so they load wherever
+    this module was imported.
+
+    Args:
+        dim: Embedding dimension
+    """
+
+    backend = "benchmark:FakeEmbedder"
+
+    def __init__(self, dim=DEFAULT_DIM):
+        self.dim = dim
+        self._vectors = {}
+
+    def _vector(self, word):
+        vector = self._vectors.get(word)
+        if vector is None:
+            seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest())
+            vector = np.random.default_rng(seed).standard_normal(self.dim, dtype=np.float32)
+            self._vectors[word] = vector
+        return vector
+
+    def embed(self, texts, batch_size=64):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = text.lower().split()
+            if words:
+                out[row] = np.sum([self._vector(w) for w in words], axis=0)
+        return out
+
+    def state(self):
+        return {"backend": self.backend, "dim": self.dim}, {}
+
+    @classmethod
+    def from_state(cls, params, arrays):
+        return cls(dim=params["dim"])
+
+
+def synthetic_paragraphs(n, seed=0):
+    """
+    ``n`` paragraphs of PARAGRAPH_WORDS words: half from a shared Zipf-like
+    vocabulary, half from the paragraph's topic vocabulary.
+
+    Returns:
+        (paragraphs, topics): list of str and the topic id of each
+    """
+    rng = np.random.default_rng(seed)
+    n_topics = max(1, n // CHUNKS_PER_TOPIC)
+    vocabulary = np.array([_word(i) for i in range(COMMON_WORDS + n_topics * TOPIC_WORDS)])
+    common_p = 1.0 / np.arange(1, COMMON_WORDS + 1)
+    common_p /= common_p.sum()
+    topic_p = 1.0 / np.arange(1, TOPIC_WORDS + 1)
+    topic_p /= topic_p.sum()
+
+    topics = rng.integers(0, n_topics, size=n)
+    half = PARAGRAPH_WORDS // 2
+    paragraphs = []
+    for start in range(0, n, 10_000):
+        block = topics[start : start + 10_000]
+        common = rng.choice(COMMON_WORDS, size=(len(block), half), p=common_p)
+        own = COMMON_WORDS + block[:, None] * TOPIC_WORDS
+        own = own + rng.choice(TOPIC_WORDS, size=(len(block), PARAGRAPH_WORDS - half), p=topic_p)
+        words = np.concatenate([common, own], axis=1)
+        rng.permuted(words, axis=1, out=words)
+        paragraphs.extend(" ".join(vocabulary[row]) + "." for row in words)
+    return paragraphs, topics
+
+
+def write_corpus(directory, paragraphs):
+    """Write the paragraphs as .txt documents of PARAGRAPHS_PER_DOC each."""
+    os.makedirs(directory, exist_ok=True)
+    for start in range(0, len(paragraphs), PARAGRAPHS_PER_DOC):
+        path = os.path.join(directory, document_name(start))
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(paragraphs[start : start + PARAGRAPHS_PER_DOC]))
+
+
+def sample_queries(paragraphs, count, words=8, seed=1):
+    """
+    Queries made of a few words of randomly chosen paragraphs.
+
+    Returns:
+        (queries, rows): the query strings and the paragraph each came from
+    """
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(paragraphs), size=min(count, len(paragraphs)), replace=False)
+    queries = []
+    for i in rows:
+        tokens = paragraphs[i].rstrip(".").split()
+        queries.append(" ".join(rng.choice(tokens, size=words, replace=False)))
+    return queries, [int(i) for i in rows]
+
+
+def document_name(row):
+    """File write_corpus() puts paragraph ``row`` in."""
+    return f"doc{row // PARAGRAPHS_PER_DOC:07d}.txt"
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (None if unknown)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+
+def directory_mb(path):
+    total = sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+    return round(total / (1 << 20), 2)
+
+
+def latency_stats(seconds):
+    """Percentiles (ms) and throughput of a list of per-call durations."""
+    ms = 1000 * np.asarray(seconds)
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "qps": round(len(ms) / max(ms.sum() / 1000, 1e-9), 1),
+    }
+
+
+def configure_backend(store, built, ann=False, quant=None):
+    """
+    Switch ``store`` to a backend, building its ANN index/codes on first use.
+
+    Args:
+        store: SimpleVectorStore to reconfigure
+        built: Dict caching what was built for this store (start with {})
+        ann: Use an IVF index
+        quant: None, "int8" or "pq"
+
+    Returns:
+        Seconds spent building (0 if everything was cached)
+    """
+    start = time.perf_counter()
+    if ann and "ann" not in built:
+        store.ann = None
+        store.build_ann()
+        built["ann"] = store.ann
+    if quant and quant not in built:
+        store.quantizer, store.codes = None, None
+        # PQ codebooks cannot have more centroids than there are vectors
+        options = {"ks": min(256, len(store))} if quant == "pq" else {}
+        store.quantize(quant, **options)
+        built[quant] = (store.quantizer, store.codes, store.rerank)
+    store.ann = built["ann"] if ann else None
+    store.quantizer, store.codes, store.rerank = built[quant] if quant else (None, None, 0)
+    return time.perf_counter() - start
+
+
+def _time_searches(store, queries, vectors, mode="dense"):
+    """(per-query durations, result ids) of single searches."""
+    for query, vector in zip(queries[:WARMUP_QUERIES], vectors):
+        store.search(query, top_k=TOP_K, mode=mode, query_vector=vector)
+    durations, ids = [], []
+    for query, vector in zip(queries, vectors):
+        start = time.perf_counter()
+        results = store.search(query, top_k=TOP_K, mode=mode, query_vector=vector)
+        durations.append(time.perf_counter() - start)
+        ids.append([r["id"] for r in results])
+    return durations, ids
+
+
+def _batch_qps(store, queries, vectors, mode="dense"):
+    start = time.perf_counter()
+    for i in range(0, len(queries), BATCH_SIZE):
+        store.search_batch(
+            queries[i : i + BATCH_SIZE],
+            top_k=TOP_K,
+            mode=mode,
+            query_vectors=vectors[i : i + BATCH_SIZE],
+        )
+    return round(len(queries) / max(time.perf_counter() - start, 1e-9), 1)
+
+
+def _recall(ids, exact_ids):
+    hits = sum(len(set(a) & set(b)) for a, b in zip(ids, exact_ids))
+    return round(hits / max(sum(len(b) for b in exact_ids), 1), 4)
+
+
+def run_size(
+    n_chunks,
+    workdir,
+    dim=DEFAULT_DIM,
+    n_queries=200,
+    verbose=False,
+    startup_runs=STARTUP_RUNS,
+    shards=SHARDS,
+):
+    """
+    Benchmark one corpus size.
+
+    Args:
+        n_chunks: Number of chunks (paragraphs) in the synthetic corpus
+        workdir: Directory for the corpus and indexes
+        dim: Fake embedding dimension
+        n_queries: Queries timed per backend and mode
+        verbose: Show the store's own progress output
+        startup_runs: Fresh interpreters per cold-start measurement (0 skips them)
+        shards: Worker processes for the sharded exact search (0 skips it)
+
+    Returns:
+        dict of metrics (see the README's Benchmarks section)
+    """
+    embedder = FakeEmbedder(dim)
+    quiet = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    report = {"chunks": n_chunks, "dim": dim}
+
+    start = time.perf_counter()
+    paragraphs, _ = synthetic_paragraphs(n_chunks)
+    kb = os.path.join(workdir, "kb")
+    write_corpus(kb, paragraphs)
+    report["corpus_seconds"] = round(time.perf_counter() - start, 3)
+
+    index_path = os.path.join(workdir, "index")
+    start = time.perf_counter()
+    with quiet:
+        store = build_index(
+            kb,
+            index_path,
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=0,
+            checkpoint_every=None,
+            resume=False,
+            embedder=embedder,
+        )
+    seconds = time.perf_counter() - start
+    report["build"] = {
+        "seconds": round(seconds, 3),
+        "chunks_per_s": round(len(store) / seconds, 1),
+        "index_mb": directory_mb(index_path),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    report["chunks"] = len(store)
+
+    save_path = os.path.join(workdir, "saved")
+    with quiet:
+        start = time.perf_counter()
+        store.save(save_path)
+        report["save"] = {"seconds": round(time.perf_counter() - start, 4)}
+        del store
+
+        start = time.perf_counter()
+        store = SimpleVectorStore(embedder=embedder)
+        store.load(save_path)
+        report["load"] = {"seconds": round(time.perf_counter() - start, 4)}
+
+    queries, _ = sample_queries(paragraphs, n_queries)
+    vectors = embedder.embed(queries)
+    start = time.perf_counter()
+    store.search(queries[0], top_k=TOP_K, query_vector=vectors[0])
+    report["load"]["first_search_ms"] = round(1000 * (time.perf_counter() - start), 4)
+    report["load"]["peak_rss_mb"] = peak_rss_mb()
+
+    search, built, exact_ids = {}, {}, None
+    with quiet:
+        for name, options in BACKENDS.items():
+            setup = configure_backend(store, built, **options)
+            durations, ids = _time_searches(store, queries, vectors)
+            stats = latency_stats(durations)
+            stats["batch_qps"] = _batch_qps(store, queries, vectors)
+            if name == "exact":
+                exact_ids = ids
+            else:
+                stats["recall"] = _recall(ids, exact_ids)
+                stats["setup_seconds"] = round(setup, 3)
+            search[name] = stats
+
+        configure_backend(store, built)
+        if shards:
+            store.shard(shards)
+            try:
+                durations, ids = _time_searches(store, queries, vectors)
+                stats = latency_stats(durations)
+                stats["batch_qps"] = _batch_qps(store, queries, vectors)
+                stats["recall"] = _recall(ids, exact_ids)
+                stats["shards"] = store.shards.shards
+            finally:
+                store.unshard()
+            search["sharded"] = stats
+        for mode in ("lexical", "hybrid"):
+            durations, ids = _time_searches(store, queries, vectors, mode)
+            stats = latency_stats(durations)
+            stats["batch_qps"] = _batch_qps(store, queries, vectors, mode)
+            search[mode] = stats
+    report["search"] = search
+    report["peak_rss_mb"] = peak_rss_mb()
+    if startup_runs:
+        report["startup"] = measure_startup(save_path, startup_runs)
+    return report
+
+
+def measure_startup(index_path, runs=STARTUP_RUNS):
+    """
+    Median cold-start costs, each measured in ``runs`` fresh interpreters.
+
+    OPENROUTER_API_KEY is removed from the children's environment: none of
+    these steps may need it. ``process_ms`` is the wall time of a whole
+    ``python -c "import lib"`` process, interpreter start-up included.
+
+    Returns:
+        dict of STARTUP_SNIPPETS names (plus ``process_ms``) -> milliseconds
+    """
+    env = {k: v for k, v in os.environ.items() if k != "OPENROUTER_API_KEY"}
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    timings = {name: [] for name in STARTUP_SNIPPETS}
+    timings["process_ms"] = []
+    for _ in range(runs):
+        for name, snippet in STARTUP_SNIPPETS.items():
+            code = (
+                "import time; _start = time.perf_counter(); "
+                f"{snippet.format(path=os.path.abspath(index_path))}; "
+                "print(1000 * (time.perf_counter() - _start))"
+            )
+            out = subprocess.run(
+                [sys.executable, "-c", code], env=env, cwd=cwd,
+                capture_output=True, text=True, check=True,
+            ).stdout
+            timings[name].append(float(out.split()[-1]))
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import lib"], env=env, cwd=cwd, check=True)
+        timings["process_ms"].append(1000 * (time.perf_counter() - start))
+    return {name: round(statistics.median(values), 3) for name, values in timings.items()}
+
+
+def _run_isolated(n_chunks, dim, n_queries, verbose, startup_runs, shards):
+    """Run one size in a fresh process so its peak RSS is its own."""
+    with tempfile.TemporaryDirectory(prefix="rag-bench-") as workdir:
+        return run_size(n_chunks, workdir, dim, n_queries, verbose, startup_runs, shards)
+
+
+def flatten(metrics, prefix=""):
+    """{"a": {"b": 1}} -> {"a.b": 1} (numeric leaves only)."""
+    flat = {}
+    for key, value in metrics.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Metrics that got worse than ``baseline`` by more than ``tolerance``.
+
+    Latencies, durations and sizes must not grow, throughput and recall
+    must not shrink, by more than the relative tolerance. Latencies also
+    have to grow by NOISE_FLOOR_MS. Metrics missing from either side are
+    ignored.
+
+    Returns:
+        List of (metric, baseline value, new value) tuples
+    """
+    new, old = flatten(results), flatten(baseline)
+    regressions = []
+    for name in sorted(new.keys() & old.keys()):
+        before, after = old[name], new[name]
+        if name.endswith(LOWER_IS_BETTER):
+            worse = after > before * (1 + tolerance)
+            if name.endswith("_ms"):
+                worse = worse and after - before > NOISE_FLOOR_MS
+        elif name.endswith(HIGHER_IS_BETTER):
+            worse = after < before * (1 - tolerance)
+        else:
+            continue
+        if worse:
+            regressions.append((name, before, after))
+    return regressions
+
+
+def print_summary(results):
+    for size, report in results.items():
+        build = report["build"]
+        print(
+            f"\n{size}: {report['chunks']} chunks, built in {build['seconds']}s "
+            f"({build['chunks_per_s']} chunks/s, {build['index_mb']} MB), "
+            f"load {report['load']['seconds']}s, peak RSS {report['peak_rss_mb']} MB"
+        )
+        if "startup" in report:
+            startup = report["startup"]
+            print(
+                f"  startup: import lib {startup['import_lib_ms']} ms "
+                f"({startup['process_ms']} ms whole process), "
+                f"import lib.rag_system {startup['import_rag_system_ms']} ms, "
+                f"RAGSystem() {startup['rag_init_ms']} ms, "
+                f"open index {startup['store_open_ms']} ms"
+            )
+        print(f"  {'backend':<8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+              f"{'qps':>9} {'batch qps':>10} {'recall':>7}")
+        for name, stats in report["search"].items():
+            print(
+                f"  {name:<8} {stats['p50_ms']:>9.3f} {stats['p95_ms']:>9.3f} "
+                f"{stats['p99_ms']:>9.3f} {stats['qps']:>9.1f} {stats['batch_qps']:>10.1f} "
+                f"{stats['recall'] if 'recall' in stats else '-':>7}"
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Corpus sizes, e.g. 1k,100k,1m")
+    parser.add_argument("--dim", type=int, default=DEFAULT_DIM, help="Fake embedding dimension")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per backend")
+    parser.add_argument(
+        "--startup-runs",
+        type=int,
+        default=STARTUP_RUNS,
+        help="Fresh interpreters per cold-start timing (0 to skip)",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=SHARDS,
+        help="Worker processes for sharded exact search (default: one per core, 0 to skip)",
+    )
+    parser.add_argument("--output", default="benchmark_results.json", help="Results JSON file")
+    parser.add_argument("--baseline", help="Results JSON to compare against")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25, help="Allowed relative regression"
+    )
+    parser.add_argument(
+        "--no-isolate", action="store_true", help="Run every size in this process"
+    )
+    parser.add_argument("--verbose", action="store_true", help="Show build/search output")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for label in args.sizes.split(","):
+        n_chunks = parse_size(label)
+        print(f"Benchmarking {label.strip()} chunks...")
+        job = (n_chunks, args.dim, args.queries, args.verbose, args.startup_runs, args.shards)
+        if args.no_isolate:
+            results[label.strip()] = _run_isolated(*job)
+        else:
+            # Not a multiprocessing.Pool: its daemonic workers cannot start shard workers
+            spawn = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(1, mp_context=spawn) as pool:
+                results[label.strip()] = pool.submit(_run_isolated, *job).result()
+
+    output = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2)
+    print_summary(results)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before} -> {after}")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
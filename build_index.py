@@ -1,57 +1,415 @@
 """
 Build the vector store from knowledge base documents.
-Run this once to create your searchable index.
+Run this once to create your searchable index, then with --incremental to
+re-embed only the documents that changed.
+
+Documents can be read and chunked in a process pool (--workers) while
+several embedding requests are in flight (--concurrency). Progress is
+checkpointed to ``<output>.partial`` so an interrupted build resumes
+where it stopped.
 """
 
+import argparse
+import collections
+import hashlib
 import os
-from dotenv import load_dotenv
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from lib.chunking import STRATEGIES, iter_chunks
+from lib.context import count_tokens
+from lib.embedders import (
+    DEFAULT_DIM,
+    EMBEDDERS,
+    HashingEmbedder,
+    PrecomputedEmbedder,
+    describe,
+    embedder_params,
+    make_embedder,
+    same_embedder,
+)
+from lib.embedding import get_embeddings
+from lib.index_format import is_index_dir
 from lib.vector_store import SimpleVectorStore
+from lib.wal import remove_log
 
-# Load environment variables from .env
-load_dotenv()
 
+def load_documents(directory, filenames=None):
+    """
+    Load .txt files from a directory.
 
-def load_documents(directory):
-    """Load all .txt files from a directory."""
+    Args:
+        directory: Folder to read
+        filenames: Optional subset of file names to load (default: all .txt)
+    """
     documents = []
 
-    for filename in sorted(os.listdir(directory)):
-        if filename.endswith(".txt"):
-            filepath = os.path.join(directory, filename)
-            with open(filepath, "r", encoding="utf-8") as f:
-                content = f.read().strip()
-                documents.append((filename, content))
+    for filename in sorted(filenames if filenames is not None else list_documents(directory)):
+        filepath = os.path.join(directory, filename)
+        with open(filepath, "r", encoding="utf-8") as f:
+            content = f.read().strip()
+            documents.append((filename, content))
 
     return documents
 
 
-def build_index(kb_directory="knowledge_base", output_file="rag_store.pkl"):
+def iter_documents(directory, filenames=None):
+    """
+    Lazily yield (filename, content) for .txt files, one file in memory at a time.
+
+    Content is not stripped, so chunk offsets refer to the file as stored.
+    """
+    for filename in sorted(filenames if filenames is not None else list_documents(directory)):
+        with open(os.path.join(directory, filename), "r", encoding="utf-8") as f:
+            yield filename, f.read()
+
+
+def list_documents(directory):
+    """Names of the .txt files in a directory, sorted."""
+    return sorted(f for f in os.listdir(directory) if f.endswith(".txt"))
+
+
+def _file_hash(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint_documents(directory, previous=None):
+    """
+    Fingerprint every document by size, mtime and content hash.
+
+    Files whose size and mtime match ``previous`` reuse the recorded hash
+    instead of being read again.
+
+    Returns:
+        dict: {filename: {"size": ..., "mtime_ns": ..., "sha256": ...}}
+    """
+    previous = previous or {}
+    fingerprints = {}
+
+    for filename in list_documents(directory):
+        stat = os.stat(os.path.join(directory, filename))
+        old = previous.get(filename)
+        if old and old["size"] == stat.st_size and old["mtime_ns"] == stat.st_mtime_ns:
+            sha256 = old["sha256"]
+        else:
+            sha256 = _file_hash(os.path.join(directory, filename))
+        fingerprints[filename] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": sha256,
+        }
+
+    return fingerprints
+
+
+def diff_fingerprints(old, new):
+    """
+    Compare two fingerprint maps.
+
+    Returns:
+        dict: Sorted file names under "added", "modified", "deleted" and
+        "unchanged"
+    """
+    return {
+        "added": sorted(set(new) - set(old)),
+        "modified": sorted(f for f in new if f in old and new[f]["sha256"] != old[f]["sha256"]),
+        "deleted": sorted(set(old) - set(new)),
+        "unchanged": sorted(f for f in new if f in old and new[f]["sha256"] == old[f]["sha256"]),
+    }
+
+
+def _read_and_chunk(job):
+    """Read and chunk one document; runs in a worker process."""
+    directory, filename, strategy, chunk_size, overlap = job
+    with open(os.path.join(directory, filename), "r", encoding="utf-8") as f:
+        text = f.read()
+    return filename, list(iter_chunks([(filename, text)], strategy, chunk_size, overlap))
+
+
+def _ordered_map(executor, fn, items, window):
+    """
+    Like ``executor.map`` but with at most ``window`` tasks in flight, so a
+    fast producer cannot run arbitrarily far ahead. Results keep input order.
+    Without an executor, ``fn`` runs inline.
+    """
+    if executor is None:
+        yield from map(fn, items)
+        return
+    pending = collections.deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _chunk_batches(documents, batch_size):
+    """
+    Pack chunked documents into embedding batches.
+
+    Yields:
+        (batch, finished): up to ``batch_size`` (text, metadata) chunks, and
+        the documents whose last chunk is in this batch
+    """
+    batch, finished = [], []
+    for filename, chunks in documents:
+        if not chunks:
+            finished.append(filename)
+        for i, chunk in enumerate(chunks):
+            batch.append(chunk)
+            if i == len(chunks) - 1:
+                finished.append(filename)
+            if len(batch) == batch_size:
+                yield batch, finished
+                batch, finished = [], []
+    if batch or finished:
+        yield batch, finished
+
+
+def _embed_batch(item, embedder=None):
+    """Embed one (batch, finished) item; runs in the embedding thread pool."""
+    batch, _ = item
+    if not batch:
+        return item, None
+    texts = [text for text, _ in batch]
+    if embedder is None:
+        return item, get_embeddings(texts, batch_size=len(batch))
+    return item, embedder.embed(texts, batch_size=len(batch))
+
+
+class BuildProgress:
+    """Counts documents, chunks and tokens, printing throughput periodically."""
+
+    def __init__(self, total_docs, interval=1.0):
+        self.total_docs = total_docs
+        self.interval = interval
+        self.docs = self.chunks = self.tokens = 0
+        self.started = self._reported = time.perf_counter()
+
+    def update(self, docs, batch):
+        self.docs += docs
+        self.chunks += len(batch)
+        self.tokens += sum(count_tokens(text) for text, _ in batch)
+        if time.perf_counter() - self._reported >= self.interval:
+            self.report()
+
+    def stats(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return {
+            "seconds": round(elapsed, 3),
+            "docs": self.docs,
+            "chunks": self.chunks,
+            "tokens": self.tokens,
+            "docs_per_s": round(self.docs / elapsed, 2),
+            "tokens_per_s": round(self.tokens / elapsed, 1),
+        }
+
+    def report(self):
+        self._reported = time.perf_counter()
+        s = self.stats()
+        print(
+            f"  {s['docs']}/{self.total_docs} docs, {s['chunks']} chunks | "
+            f"{s['docs_per_s']:.1f} docs/s, {s['tokens_per_s']:,.0f} tokens/s"
+        )
+
+
+def build_index(
+    kb_directory="knowledge_base",
+    output_file="rag_index",
+    incremental=False,
+    chunk_strategy="recursive",
+    chunk_size=1000,
+    chunk_overlap=100,
+    batch_size=64,
+    ann=False,
+    lexical=True,
+    workers=1,
+    concurrency=1,
+    checkpoint_every=60.0,
+    resume=True,
+    embedder=None,
+):
     """
     Build and save a vector store.
 
+    Documents are read, chunked and embedded as a stream, ``batch_size``
+    chunks at a time, so the corpus never has to fit in memory. Chunks are
+    added to the store in document order whatever the parallelism, so the
+    same corpus always produces the same index.
+
     Args:
         kb_directory: Folder containing your documents
-        output_file: Where to save the index
+        output_file: Index directory to write
+        incremental: Reuse the existing index and only re-embed documents
+            that were added or modified since it was built
+        chunk_strategy: "fixed", "sentence" or "recursive" (see lib.chunking)
+        chunk_size: Maximum characters per chunk
+        chunk_overlap: Characters shared between consecutive chunks
+        batch_size: Chunks per embedding request
+        ann: Build an IVF approximate-search index over the chunks (an
+            incremental build keeps updating an existing one)
+        lexical: Build a BM25 index for lexical and hybrid search
+        workers: Processes reading and chunking documents (1 = inline)
+        concurrency: Embedding requests in flight at once
+        checkpoint_every: Seconds between checkpoints to
+            ``<output_file>.partial`` (0 = after every batch, None = never)
+        resume: Continue from an existing checkpoint made with the same
+            chunking settings
+        embedder: Embedder (or backend name, see lib.embedders) to embed
+            chunks with (default: the remote API). An unfitted
+            HashingEmbedder is fitted on the corpus first; an existing index
+            or checkpoint made with a different embedder is rebuilt.
+
+    Returns:
+        SimpleVectorStore: The store; ``store.manifest["changes"]`` lists the
+        added/modified/deleted/unchanged files and
+        ``store.manifest["throughput"]`` the build statistics
     """
     print("=" * 60)
-    print("BUILDING VECTOR STORE")
+    print("BUILDING VECTOR STORE" + (" (incremental)" if incremental else ""))
     print("=" * 60)
 
-    # Load documents
-    print(f"\nLoading documents from {kb_directory}/...")
-    documents = load_documents(kb_directory)
-    print(f"Found {len(documents)} documents\n")
+    if isinstance(embedder, str):
+        embedder = make_embedder(embedder)
+    chunking = {"strategy": chunk_strategy, "chunk_size": chunk_size, "overlap": chunk_overlap}
+    checkpoint_path = f"{output_file}.partial"
+    wanted = embedder_params(embedder)
+
+    def reusable(store):
+        """An unfitted HashingEmbedder matches whatever IDF the index has."""
+        if embedder is not None and getattr(embedder, "fitted", True) is False:
+            recorded = dict(store.embedder_params(), idf=None)
+        else:
+            recorded = store.embedder_params()
+        return same_embedder(recorded, wanted)
+
+    # Start from a checkpoint of an interrupted build, else from the existing
+    # index if it recorded per-file fingerprints and was chunked (and
+    # embedded) the same way
+    store = SimpleVectorStore(embedder=embedder)
+    previous = {}
+    resumed = False
+    if resume and is_index_dir(checkpoint_path):
+        store = SimpleVectorStore()
+        store.load(checkpoint_path)
+        if store.manifest.get("chunking") == chunking and reusable(store):
+            previous = store.manifest.get("files", {})
+            resumed = True
+            # Chunks of a document that was only partly added are redone
+            store.remove_where(lambda m: m.get("source") not in previous)
+            print(f"Resuming from checkpoint ({len(previous)} documents done)")
+        else:
+            store = SimpleVectorStore(embedder=embedder)
+    if not resumed and incremental and is_index_dir(output_file):
+        store = SimpleVectorStore()
+        store.load(output_file)
+        previous = store.manifest.get("files", {})
+        if not previous:
+            print("Existing index has no file fingerprints; rebuilding from scratch")
+        elif store.manifest.get("chunking") != chunking:
+            print("Chunking settings changed; rebuilding from scratch")
+            previous = {}
+        elif not reusable(store):
+            print(
+                f"Embedder changed from {describe(store.embedder_params())} "
+                f"to {describe(wanted)}; rebuilding from scratch"
+            )
+            previous = {}
+        if not previous:
+            store = SimpleVectorStore(embedder=embedder)
 
-    # Create store
-    store = SimpleVectorStore()
+    print(f"\nScanning documents in {kb_directory}/...")
+    fingerprints = fingerprint_documents(kb_directory, previous)
+    changes = diff_fingerprints(previous, fingerprints)
+    print(
+        f"Found {len(fingerprints)} documents: {len(changes['added'])} added, "
+        f"{len(changes['modified'])} modified, {len(changes['deleted'])} deleted, "
+        f"{len(changes['unchanged'])} unchanged\n"
+    )
 
-    # Add each document (simple: 1 doc = 1 chunk)
-    for filename, content in documents:
-        store.add_text(content, metadata={"source": filename})
+    if incremental and previous and fingerprints == previous and not resumed:
+        print("Index is up to date")
+        store.manifest["changes"] = changes
+        return store
+
+    # Drop chunks of deleted and modified files, then embed the new versions
+    stale = set(changes["deleted"]) | set(changes["modified"])
+    if stale:
+        removed = store.remove_where(lambda m: m.get("source") in stale)
+        print(f"Removed {removed} stale chunks")
+
+    # Pipeline: read + chunk (process pool) -> batches -> embed (thread pool)
+    # -> add to the store in order. Only fully added documents count as done.
+    todo = changes["added"] + changes["modified"]
+    done = {f: fingerprints[f] for f in changes["unchanged"]}
+    jobs = [(kb_directory, f, chunk_strategy, chunk_size, chunk_overlap) for f in sorted(todo)]
+    if getattr(store.embedder, "fitted", True) is False:
+        # IDF needs the whole corpus, so chunk it once up front
+        print("Fitting embedder IDF weights...")
+        store.embedder.fit(
+            text for _, chunks in map(_read_and_chunk, jobs) for text, _ in chunks
+        )
+    progress = BuildProgress(len(todo))
+    last_checkpoint = time.monotonic()
+
+    chunk_pool = ProcessPoolExecutor(workers) if workers > 1 and len(jobs) > 1 else None
+    embed_pool = ThreadPoolExecutor(concurrency) if concurrency > 1 else None
+    try:
+        documents = _ordered_map(chunk_pool, _read_and_chunk, jobs, window=2 * workers)
+        batches = _chunk_batches(documents, batch_size)
+        for (batch, finished), vectors in _ordered_map(
+            embed_pool,
+            partial(_embed_batch, embedder=store.embedder),
+            batches,
+            window=2 * concurrency,
+        ):
+            if batch:
+                store.add_texts(
+                    [text for text, _ in batch],
+                    metadatas=[metadata for _, metadata in batch],
+                    embeddings=vectors,
+                    ids=[f"{m['source']}#{m['chunk']}" for _, m in batch],
+                )
+            done.update((f, fingerprints[f]) for f in finished)
+            progress.update(len(finished), batch)
+
+            if checkpoint_every is not None and (
+                time.monotonic() - last_checkpoint >= checkpoint_every
+            ):
+                store.save(checkpoint_path, extra={"files": done, "chunking": chunking})
+                last_checkpoint = time.monotonic()
+    finally:
+        for pool in (chunk_pool, embed_pool):
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+    progress.report()
+
+    if ann and store.ann is None and len(store):
+        store.build_ann()
+    if lexical and store.lexical is None and len(store):
+        store.build_lexical()
+    if store.filters is None and len(store):
+        store.build_filters()
 
     # Save
     print(f"\nSaving...")
-    store.save(output_file)
+    store.save(
+        output_file,
+        extra={
+            "files": fingerprints,
+            "changes": changes,
+            "chunking": chunking,
+            "throughput": progress.stats(),
+        },
+    )
+    shutil.rmtree(checkpoint_path, ignore_errors=True)
+    remove_log(checkpoint_path)
 
     print("\n" + "=" * 60)
     print(f"DONE! Created index with {len(store)} chunks")
@@ -61,7 +419,65 @@ def build_index(kb_directory="knowledge_base", output_file="rag_store.pkl"):
 
 
 if __name__ == "__main__":
-    store = build_index()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--kb", default="knowledge_base", help="Documents folder")
+    parser.add_argument("--output", default="rag_index", help="Index directory")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only re-embed documents added or modified since the last build",
+    )
+    parser.add_argument(
+        "--chunk-strategy", default="recursive", choices=sorted(STRATEGIES), help="Chunker"
+    )
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Max characters per chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=100, help="Overlap in characters")
+    parser.add_argument("--ann", action="store_true", help="Build an IVF approximate index")
+    parser.add_argument(
+        "--no-lexical", action="store_true", help="Skip the BM25 index used by lexical/hybrid search"
+    )
+    parser.add_argument("--workers", type=int, default=1, help="Processes reading and chunking")
+    parser.add_argument(
+        "--concurrency", type=int, default=1, help="Embedding requests in flight at once"
+    )
+    parser.add_argument(
+        "--checkpoint-every", type=float, default=60.0, help="Seconds between checkpoints"
+    )
+    parser.add_argument(
+        "--no-resume", action="store_true", help="Ignore a checkpoint of an interrupted build"
+    )
+    parser.add_argument(
+        "--embedder", default="remote", choices=sorted(EMBEDDERS), help="Embedding backend"
+    )
+    parser.add_argument(
+        "--embedding-dim", type=int, default=DEFAULT_DIM, help="Dimension of --embedder hashing"
+    )
+    parser.add_argument("--embedding-file", help="Vector file for --embedder precomputed")
+    args = parser.parse_args()
+
+    embedder = None
+    if args.embedder == "hashing":
+        embedder = HashingEmbedder(dim=args.embedding_dim)
+    elif args.embedder == "precomputed":
+        if not args.embedding_file:
+            parser.error("--embedder precomputed needs --embedding-file")
+        embedder = PrecomputedEmbedder(args.embedding_file)
+
+    store = build_index(
+        args.kb,
+        args.output,
+        incremental=args.incremental,
+        chunk_strategy=args.chunk_strategy,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        ann=args.ann,
+        lexical=not args.no_lexical,
+        workers=args.workers,
+        concurrency=args.concurrency,
+        checkpoint_every=args.checkpoint_every,
+        resume=not args.no_resume,
+        embedder=embedder,
+    )
 
     # Quick test
     print("\n" + "=" * 60)
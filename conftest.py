@@ -0,0 +1,70 @@
+"""
+Pytest configuration for the offline test suite.
+
+``test_openrautoer.py`` and ``test_retrieval_quality.py`` talk to the live
+OpenRouter API (and read from stdin), so they are only collected when
+``RAG_LIVE_TESTS=1`` is set.
+"""
+
+import os
+import threading
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+import lib.vector_store as vector_store
+
+# The default HTTP clients need a key; offline tests only talk to local servers.
+os.environ.setdefault("OPENROUTER_API_KEY", "test-key")
+# Tests opt in to the embedding cache explicitly, with a temporary file.
+os.environ.setdefault("RAG_EMBEDDING_CACHE", "off")
+
+collect_ignore = []
+if os.getenv("RAG_LIVE_TESTS") != "1":
+    collect_ignore += ["test_openrautoer.py", "test_retrieval_quality.py"]
+
+
+def fake_embedding(text):
+    """Deterministic pseudo-embedding derived from the text."""
+    seed = sum(ord(c) * (i + 1) for i, c in enumerate(text)) % (2**32)
+    return np.random.default_rng(seed).normal(size=32)
+
+
+def fake_embeddings(texts, model=None, batch_size=64):
+    return np.array([fake_embedding(t) for t in texts])
+
+
+@pytest.fixture
+def fake_embedder(monkeypatch):
+    """
+    Replace the store's embedding calls with deterministic fake vectors and
+    return the batch function, so tests can embed expected queries too.
+    """
+    monkeypatch.setattr(vector_store, "get_embedding", lambda text, model=None: fake_embedding(text))
+    monkeypatch.setattr(vector_store, "get_embeddings", fake_embeddings)
+    return fake_embeddings
+
+
+@pytest.fixture
+def http_server():
+    """
+    Factory fixture: ``http_server(HandlerClass)`` serves the handler on a
+    local port in a background thread and returns the server, whose
+    ``base_url`` attribute points at it. Servers are shut down afterwards.
+    """
+    servers = []
+
+    def start(handler):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.base_url = f"http://127.0.0.1:{server.server_port}"
+        server.requests = []
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
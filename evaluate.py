@@ -0,0 +1,364 @@
+"""
+Offline retrieval-quality evaluation with recall/latency trade-off reports.
+
+Reads labelled queries (JSON lines: {"query": ..., "relevant": [sources]}
+or {"relevant": {source: grade}} for graded relevance), builds the
+knowledge base index for each chunk size in the sweep and scores every
+combination of search mode, quantization, ANN nprobe and top_k with
+SimpleVectorStore.search. Quality is measured per source document:
+recall@k, MRR and nDCG@k, next to p50/p95 search latency. Configurations
+no other one beats on both recall and latency form the Pareto front.
+
+Embeddings come from the on-disk embedding cache, so after one run with
+--online (which embeds and caches every chunk and query) sweeps need no
+API calls. --synthetic runs on a generated corpus with the benchmark's
+fake embedder instead.
+
+Usage:
+    python evaluate.py --online                   # first run: fill the cache
+    python evaluate.py                            # offline sweep
+    python evaluate.py --chunk-sizes 300,1000 --top-k 1,3,5 --modes dense,hybrid
+    python evaluate.py --synthetic 5000           # no knowledge base or cache needed
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import benchmark
+from build_index import build_index
+from lib.embedders import DEFAULT_MODEL, RemoteEmbedder
+from lib.embedding import get_embeddings
+from lib.embedding_cache import get_default_cache
+from lib.settings import api_key
+
+
+class CachedEmbedder(RemoteEmbedder):
+    """
+    The remote model's embeddings, served from the on-disk cache only.
+
+    Indexes record the remote model, whose vectors these are, but the API
+    is never called: LookupError names how many texts are missing, so a
+    sweep cannot silently fall back to network calls.
+    """
+
+    def __init__(self, cache=None, model=DEFAULT_MODEL):
+        cache = cache if cache is not None else get_default_cache()
+        if cache is None:
+            raise LookupError("The embedding cache is disabled (RAG_EMBEDDING_CACHE=off)")
+        super().__init__(model=model, cache=cache)
+
+    def embed(self, texts, batch_size=64):
+        texts = list(texts)
+        vectors = self.cache.get_many(self.model, texts)
+        missing = sum(v is None for v in vectors)
+        if missing:
+            raise LookupError(
+                f"{missing} of {len(texts)} texts are not in the embedding cache "
+                f"{self.cache.path}; run evaluate.py once with --online to embed them"
+            )
+        return np.array(vectors, dtype=np.float32)
+
+    async def aembed(self, texts, batch_size=64):
+        return self.embed(texts, batch_size=batch_size)
+
+
+def load_labels(path):
+    """
+    Labelled queries from a JSON-lines file.
+
+    Returns:
+        List of (query, {source: gain}); a list of relevant sources means gain 1
+    """
+    labelled = []
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            relevant = item.get("relevant")
+            if isinstance(relevant, str):
+                relevant = [relevant]
+            if not relevant:
+                raise ValueError(f"{path}:{number}: no relevant sources for {item.get('query')!r}")
+            if not isinstance(relevant, dict):
+                relevant = {source: 1 for source in relevant}
+            labelled.append((item["query"], relevant))
+    return labelled
+
+
+def ranked_sources(results):
+    """Sources of ranked chunks, first occurrence only."""
+    sources = []
+    for result in results:
+        source = result["metadata"].get("source")
+        if source not in sources:
+            sources.append(source)
+    return sources
+
+
+def recall_at_k(ranked, relevant):
+    """Share of the relevant sources that were retrieved."""
+    return len(set(ranked) & set(relevant)) / len(relevant)
+
+
+def reciprocal_rank(ranked, relevant):
+    """1 / rank of the first relevant source (0 if none was retrieved)."""
+    for rank, source in enumerate(ranked, 1):
+        if source in relevant:
+            return 1.0 / rank
+    return 0.0
+
+
+def ndcg_at_k(ranked, relevant, k):
+    """Normalised discounted cumulative gain of the ranking, cut at ``k``."""
+    dcg = sum(relevant.get(s, 0) / math.log2(i + 2) for i, s in enumerate(ranked[:k]))
+    ideal = sorted(relevant.values(), reverse=True)[:k]
+    idcg = sum(gain / math.log2(i + 2) for i, gain in enumerate(ideal))
+    return dcg / idcg if idcg else 0.0
+
+
+def evaluate_store(store, labelled, query_vectors, top_k, mode="dense", nprobe=None):
+    """
+    Search every labelled query and average the quality metrics.
+
+    Args:
+        store: SimpleVectorStore to search
+        labelled: List of (query, {source: gain}) (see load_labels)
+        query_vectors: (q, dim) embeddings of the queries
+        top_k: Chunks retrieved per query
+        mode: Search mode (see SimpleVectorStore.search)
+        nprobe: ANN partitions to scan, if the store has an IVF index
+
+    Returns:
+        dict with recall, mrr, ndcg, p50_ms and p95_ms
+    """
+    recall, mrr, ndcg, durations = [], [], [], []
+    for (query, relevant), vector in zip(labelled, query_vectors):
+        start = time.perf_counter()
+        results = store.search(query, top_k=top_k, nprobe=nprobe, mode=mode, query_vector=vector)
+        durations.append(time.perf_counter() - start)
+
+        ranked = ranked_sources(results)
+        recall.append(recall_at_k(ranked, relevant))
+        mrr.append(reciprocal_rank(ranked, relevant))
+        ndcg.append(ndcg_at_k(ranked, relevant, top_k))
+
+    ms = 1000 * np.asarray(durations)
+    return {
+        "recall": round(float(np.mean(recall)), 4),
+        "mrr": round(float(np.mean(mrr)), 4),
+        "ndcg": round(float(np.mean(ndcg)), 4),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+    }
+
+
+def _backends(quantizations, nprobes):
+    """(name, ann, quant, nprobe) for every quantization x (exact + nprobes)."""
+    backends = []
+    for quant in quantizations:
+        base = quant or "exact"
+        backends.append((base, False, quant, None))
+        for nprobe in nprobes:
+            name = "ivf" if quant is None else f"ivf+{quant}"
+            backends.append((name, True, quant, nprobe))
+    return backends
+
+
+def sweep(
+    kb_directory,
+    labelled,
+    workdir,
+    chunk_sizes=(1000,),
+    chunk_overlap=100,
+    top_ks=(1, 3, 5),
+    quantizations=(None, "int8"),
+    nprobes=(),
+    modes=("dense",),
+    embedder=None,
+    verbose=False,
+):
+    """
+    Evaluate every configuration in the sweep.
+
+    Args:
+        kb_directory: Documents to index (once per chunk size)
+        labelled: List of (query, {source: gain})
+        workdir: Directory for the indexes built
+        chunk_sizes: Chunk sizes to build
+        chunk_overlap: Overlap, capped at a fifth of the chunk size
+        top_ks: Chunks retrieved per query
+        quantizations: None (float32), "int8" and/or "pq"
+        nprobes: IVF nprobe values tried in addition to exact search
+        modes: "dense", "lexical" and/or "hybrid"
+        embedder: Embedder for the chunks and queries (default: the remote model)
+        verbose: Show build output
+
+    Returns:
+        List of row dicts: the configuration plus evaluate_store() metrics
+    """
+    quiet = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    queries = [query for query, _ in labelled]
+    query_vectors = get_embeddings(queries) if embedder is None else embedder.embed(queries)
+    rows = []
+    for chunk_size in chunk_sizes:
+        with quiet:
+            store = build_index(
+                kb_directory,
+                os.path.join(workdir, f"index-{chunk_size}"),
+                chunk_size=chunk_size,
+                chunk_overlap=min(chunk_overlap, chunk_size // 5),
+                checkpoint_every=None,
+                resume=False,
+                embedder=embedder,
+            )
+        built = {}
+        for mode in modes:
+            if mode == "lexical":
+                # BM25 ignores the vector backends
+                backends = [("bm25", False, None, None)]
+            else:
+                backends = _backends(quantizations, nprobes)
+            for name, ann, quant, nprobe in backends:
+                with quiet:
+                    benchmark.configure_backend(store, built, ann=ann, quant=quant)
+                for top_k in top_ks:
+                    metrics = evaluate_store(store, labelled, query_vectors, top_k, mode, nprobe)
+                    rows.append(
+                        {
+                            "chunk_size": chunk_size,
+                            "chunks": len(store),
+                            "mode": mode,
+                            "backend": name,
+                            "nprobe": nprobe,
+                            "top_k": top_k,
+                            **metrics,
+                        }
+                    )
+    return rows
+
+
+def pareto_front(rows, quality="recall", cost="p50_ms"):
+    """
+    Indices of the rows no other row dominates (at least as good on both
+    ``quality`` and ``cost`` and strictly better on one).
+    """
+    front = []
+    for i, row in enumerate(rows):
+        dominated = any(
+            other[quality] >= row[quality]
+            and other[cost] <= row[cost]
+            and (other[quality] > row[quality] or other[cost] < row[cost])
+            for other in rows
+        )
+        if not dominated:
+            front.append(i)
+    return front
+
+
+def print_table(rows, front):
+    header = (
+        f"{'chunk':>6} {'mode':<8} {'backend':<9} {'nprobe':>6} {'k':>3} "
+        f"{'recall@k':>9} {'MRR':>6} {'nDCG@k':>7} {'p50 ms':>8} {'p95 ms':>8}  pareto"
+    )
+    print(header)
+    print("-" * len(header))
+    order = sorted(range(len(rows)), key=lambda i: (rows[i]["p50_ms"], -rows[i]["recall"]))
+    for i in order:
+        row = rows[i]
+        print(
+            f"{row['chunk_size']:>6} {row['mode']:<8} {row['backend']:<9} "
+            f"{row['nprobe'] if row['nprobe'] is not None else '-':>6} {row['top_k']:>3} "
+            f"{row['recall']:>9.3f} {row['mrr']:>6.3f} {row['ndcg']:>7.3f} "
+            f"{row['p50_ms']:>8.3f} {row['p95_ms']:>8.3f}  {'*' if i in front else ''}"
+        )
+
+
+def _ints(text):
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--kb", default="knowledge_base", help="Documents folder")
+    parser.add_argument("--labels", default="eval_queries.jsonl", help="Labelled queries")
+    parser.add_argument("--chunk-sizes", default="500,1000", help="Chunk sizes to build")
+    parser.add_argument("--chunk-overlap", type=int, default=100, help="Overlap in characters")
+    parser.add_argument("--top-k", default="1,3,5", help="top_k values")
+    parser.add_argument(
+        "--quantization", default="none,int8,pq", help="Any of none, int8, pq"
+    )
+    parser.add_argument("--nprobe", default="1,4", help="IVF nprobe values ('' = no ANN)")
+    parser.add_argument("--modes", default="dense", help="Any of dense, lexical, hybrid")
+    parser.add_argument("--output", default="eval_results.json", help="Results JSON file")
+    parser.add_argument(
+        "--online", action="store_true", help="Embed (and cache) anything not yet cached"
+    )
+    parser.add_argument(
+        "--synthetic",
+        metavar="N",
+        help="Evaluate on an N-chunk synthetic corpus with a fake embedder instead",
+    )
+    parser.add_argument("--queries", type=int, default=200, help="Synthetic queries")
+    parser.add_argument("--verbose", action="store_true", help="Show build output")
+    args = parser.parse_args(argv)
+
+    if args.online and not api_key():
+        parser.error("--online needs OPENROUTER_API_KEY")
+
+    quantizations = [None if q == "none" else q for q in args.quantization.split(",") if q]
+    with tempfile.TemporaryDirectory(prefix="rag-eval-") as workdir:
+        kb_directory = args.kb
+        if args.synthetic:
+            embedder = benchmark.FakeEmbedder()
+            paragraphs, _ = benchmark.synthetic_paragraphs(benchmark.parse_size(args.synthetic))
+            kb_directory = os.path.join(workdir, "kb")
+            benchmark.write_corpus(kb_directory, paragraphs)
+            queries, sources = benchmark.sample_queries(paragraphs, args.queries)
+            labelled = [
+                (query, {benchmark.document_name(row): 1}) for query, row in zip(queries, sources)
+            ]
+        else:
+            embedder = None if args.online else CachedEmbedder()
+            labelled = load_labels(args.labels)
+
+        try:
+            rows = sweep(
+                kb_directory,
+                labelled,
+                workdir,
+                chunk_sizes=_ints(args.chunk_sizes),
+                chunk_overlap=args.chunk_overlap,
+                top_ks=_ints(args.top_k),
+                quantizations=quantizations,
+                nprobes=_ints(args.nprobe),
+                modes=[m for m in args.modes.split(",") if m],
+                embedder=embedder,
+                verbose=args.verbose,
+            )
+        except LookupError as e:
+            print(f"Error: {e}")
+            return 1
+
+    front = pareto_front(rows)
+    print(f"\n{len(labelled)} labelled queries, {len(rows)} configurations\n")
+    print_table(rows, front)
+    for i in front:
+        rows[i]["pareto"] = True
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"queries": len(labelled), "rows": rows}, f, indent=2)
+    print(f"\nResults written to {args.output} (* = Pareto-optimal recall vs p50 latency)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,39 @@
 """
 RAG Library - Core modules for Retrieval-Augmented Generation.
+
+Submodules and the names below are imported on first access, so
+``import lib`` stays cheap and free of side effects; numpy, the HTTP stack
+and the configuration are only loaded when something needs them.
 """
 
-from .embedding import get_embedding, cosine_similarity
-from .vector_store import SimpleVectorStore
-from .rag_system import RAGSystem
+import importlib
+
+_EXPORTS = {
+    "get_embedding": "embedding",
+    "get_embeddings": "embedding",
+    "cosine_similarity": "embedding",
+    "EmbeddingCache": "embedding_cache",
+    "AnswerCache": "answer_cache",
+    "SimpleVectorStore": "vector_store",
+    "RAGSystem": "rag_system",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    else:
+        try:
+            value = importlib.import_module(f".{name}", __name__)
+        except ModuleNotFoundError as e:
+            if e.name != f"{__name__}.{name}":
+                raise
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    globals()[name] = value
+    return value
+
 
-__all__ = [
-    "get_embedding",
-    "cosine_similarity",
-    "SimpleVectorStore",
-    "RAGSystem",
-]
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,75 @@
+"""
+Readers-writer lock guarding SimpleVectorStore's in-memory state.
+"""
+
+import contextlib
+import threading
+
+
+class ReadWriteLock:
+    """
+    Any number of readers, or one writer.
+
+    Once a writer is waiting no new reader gets in, so a steady stream of
+    searches cannot starve an update. Both sides are re-entrant for the
+    thread holding them, and the writer may also read; a reader may not
+    upgrade to writing.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None  # ident of the thread holding the write lock
+        self._depth = 0  # its re-entry depth
+        self._waiting = 0  # writers waiting for the lock
+        self._local = threading.local()  # per-thread read depth
+
+    @contextlib.contextmanager
+    def read(self):
+        """Hold the lock shared for the duration of the block."""
+        depth = getattr(self._local, "depth", 0)
+        me = threading.get_ident()
+        if depth == 0 and self._writer != me:
+            with self._cond:
+                while self._writer is not None or self._waiting:
+                    self._cond.wait()
+                self._readers += 1
+            counted = True
+        else:
+            counted = False
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            if counted:
+                with self._cond:
+                    self._readers -= 1
+                    if not self._readers:
+                        self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def write(self):
+        """Hold the lock exclusively for the duration of the block."""
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._depth += 1
+            else:
+                if getattr(self._local, "depth", 0):
+                    raise RuntimeError("Cannot take the write lock while reading")
+                self._waiting += 1
+                try:
+                    while self._writer is not None or self._readers:
+                        self._cond.wait()
+                finally:
+                    self._waiting -= 1
+                self._writer, self._depth = me, 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._depth -= 1
+                if not self._depth:
+                    self._writer = None
+                    self._cond.notify_all()
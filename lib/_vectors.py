@@ -0,0 +1,20 @@
+"""
+Small NumPy helpers shared by the store and its index structures.
+"""
+
+import numpy as np
+
+
+def normalize_rows(matrix):
+    """L2-normalise each row of a 2-D float32 array (zero rows stay zero)."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k_indices(scores, top_k):
+    """Indices of the ``top_k`` highest scores, best first."""
+    if top_k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
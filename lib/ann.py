@@ -0,0 +1,230 @@
+"""
+Approximate nearest-neighbour search for SimpleVectorStore.
+
+IVFIndex partitions the (L2-normalised) embedding matrix with spherical
+k-means and, at query time, only scores the rows in the ``nprobe`` lists
+whose centroids are closest to the query. ``nprobe`` trades recall for
+latency: nprobe == nlist is exact search.
+"""
+
+import time
+
+import numpy as np
+
+from ._vectors import normalize_rows, top_k_indices
+
+# Rows scored per block when assigning vectors to centroids
+_ASSIGN_BLOCK = 4096
+
+
+def assign_clusters(vectors, centroids, spherical=True):
+    """Index of the most similar (cosine) or nearest (L2) centroid per row."""
+    # argmin |x - c|^2 == argmax (x.c - |c|^2 / 2)
+    bias = 0.0 if spherical else 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _ASSIGN_BLOCK):
+        block = vectors[start : start + _ASSIGN_BLOCK]
+        labels[start : start + len(block)] = np.argmax(block @ centroids.T - bias, axis=1)
+    return labels
+
+
+def kmeans(vectors, k, iterations=20, seed=0, spherical=True):
+    """
+    k-means over the rows of ``vectors``.
+
+    Spherical k-means (cosine similarity, unit-length centroids) suits
+    L2-normalised embeddings; ``spherical=False`` runs plain Euclidean
+    k-means, as used for product-quantization codebooks.
+
+    Returns:
+        (k, dim) float32 matrix of centroids
+    """
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+
+    for _ in range(iterations):
+        labels = assign_clusters(vectors, centroids, spherical)
+        counts = np.bincount(labels, minlength=k)
+
+        # Per-cluster sums: sort rows by label and reduce each run
+        order = np.argsort(labels, kind="stable")
+        nonempty = counts > 0
+        starts = (np.cumsum(counts) - counts)[nonempty]
+        sums = np.zeros_like(centroids)
+        sums[nonempty] = np.add.reduceat(vectors[order], starts, axis=0)
+
+        # Re-seed empty clusters from random points
+        empty = np.flatnonzero(counts == 0)
+        sums[empty] = vectors[rng.choice(len(vectors), size=len(empty))]
+
+        if spherical:
+            updated = normalize_rows(sums)
+        else:
+            updated = sums / np.maximum(counts, 1)[:, None]
+        if np.allclose(updated, centroids, atol=1e-6):
+            break
+        centroids = updated
+
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index with a k-means coarse quantizer.
+
+    The index only stores centroids and one list id per row; the vectors
+    themselves stay in the store's matrix.
+
+    Args:
+        nlist: Number of lists (default: about sqrt(N) at train time)
+        nprobe: Lists scanned per query unless overridden in search()
+        seed: Seed for k-means initialisation and training sampling
+    """
+
+    def __init__(self, nlist=None, nprobe=8, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.seed = seed
+        self.centroids = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self._lists = None
+
+    def train(self, vectors, iterations=20, max_train_points=None):
+        """
+        Learn centroids from the stored vectors and assign every row.
+
+        Args:
+            vectors: (N, dim) L2-normalised matrix
+            iterations: Maximum k-means iterations
+            max_train_points: Sample size for k-means (default 64 * nlist)
+        """
+        n = len(vectors)
+        if n == 0:
+            raise ValueError("Cannot train an IVF index on an empty store")
+        if self.nlist is None:
+            self.nlist = max(1, int(round(np.sqrt(n))))
+        self.nlist = min(self.nlist, n)
+
+        sample_size = min(n, max_train_points or 64 * self.nlist)
+        rng = np.random.default_rng(self.seed)
+        sample = np.sort(rng.choice(n, size=sample_size, replace=False))
+
+        self.centroids = kmeans(vectors[sample], self.nlist, iterations, self.seed)
+        self.assignments = assign_clusters(vectors, self.centroids)
+        self._lists = None
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def add(self, vectors):
+        """Assign newly appended rows to their nearest list."""
+        labels = assign_clusters(vectors, self.centroids)
+        self.assignments = np.concatenate([self.assignments, labels])
+        self._lists = None
+
+    def keep(self, mask):
+        """Drop rows where ``mask`` is False (mirrors a store row removal)."""
+        self.assignments = self.assignments[mask]
+        self._lists = None
+
+    def _inverted_lists(self):
+        """(order, offsets): rows of list i are order[offsets[i]:offsets[i+1]]."""
+        if self._lists is None:
+            order = np.argsort(self.assignments, kind="stable")
+            offsets = np.searchsorted(
+                self.assignments[order], np.arange(self.nlist + 1), side="left"
+            )
+            self._lists = (order, offsets)
+        return self._lists
+
+    def candidates(self, queries, nprobe=None):
+        """
+        Rows worth scoring for each query.
+
+        Args:
+            queries: (q, dim) L2-normalised query matrix
+            nprobe: Lists to scan per query (default: self.nprobe)
+
+        Returns:
+            List of sorted row-index arrays, one per query
+        """
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        order, offsets = self._inverted_lists()
+        coarse = queries @ self.centroids.T
+
+        result = []
+        for centroid_scores in coarse:
+            probe = top_k_indices(centroid_scores, nprobe)
+            rows = np.concatenate([order[offsets[c] : offsets[c + 1]] for c in probe])
+            rows.sort()  # sequential access into the matrix
+            result.append(rows)
+        return result
+
+    def search(self, matrix, queries, top_k, nprobe=None):
+        """
+        Approximate top-k search with exact scoring of the candidate rows.
+
+        Args:
+            matrix: The store's (N, dim) matrix the index was built over
+            queries: (q, dim) L2-normalised query matrix
+            top_k: Results per query
+            nprobe: Lists to scan per query (default: self.nprobe)
+
+        Returns:
+            List of (rows, scores) arrays per query, best first
+        """
+        hits = []
+        for query, rows in zip(queries, self.candidates(queries, nprobe)):
+            scores = matrix[rows] @ query
+            top = top_k_indices(scores, top_k)
+            hits.append((rows[top], scores[top]))
+        return hits
+
+    def state(self):
+        """(params, arrays) for persisting the index."""
+        params = {"type": "ivf", "nlist": self.nlist, "nprobe": self.nprobe, "seed": self.seed}
+        arrays = {"centroids": self.centroids, "assignments": self.assignments}
+        return params, arrays
+
+    @classmethod
+    def from_state(cls, params, arrays):
+        index = cls(nlist=params["nlist"], nprobe=params["nprobe"], seed=params.get("seed", 0))
+        index.centroids = np.asarray(arrays["centroids"], dtype=np.float32)
+        index.assignments = np.asarray(arrays["assignments"], dtype=np.int32)
+        return index
+
+
+def recall_at_k(exact_rows, approx_rows):
+    """Mean fraction of each exact top-k list that the approximate list found."""
+    recalls = [
+        len(set(exact).intersection(approx)) / len(exact)
+        for exact, approx in zip(exact_rows, approx_rows)
+        if len(exact)
+    ]
+    return float(np.mean(recalls)) if recalls else 1.0
+
+
+def evaluate_recall(index, matrix, queries, top_k=10, nprobe=None):
+    """
+    Compare an IVF index against exact brute-force search.
+
+    Returns:
+        dict: recall@k, mean per-query latency (ms) of both paths, nprobe
+    """
+    start = time.perf_counter()
+    scores = queries @ matrix.T
+    exact = [top_k_indices(row, top_k) for row in scores]
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    start = time.perf_counter()
+    approx = [rows for rows, _ in index.search(matrix, queries, top_k, nprobe)]
+    ann_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    return {
+        f"recall@{top_k}": recall_at_k(exact, approx),
+        "exact_ms": exact_ms,
+        "ann_ms": ann_ms,
+        "nprobe": min(nprobe or index.nprobe, index.nlist),
+    }
@@ -0,0 +1,192 @@
+"""
+Semantic cache of generated answers for RAGSystem.
+
+An answer is reused when a new question retrieves exactly the same chunks
+and its embedding is within a cosine-similarity threshold of a question
+that was already answered, so near-duplicate questions skip the LLM call.
+Entries expire after a TTL, the least recently used are evicted beyond
+``max_entries``, and the cache is emptied when the index build changes.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+from . import settings
+
+DEFAULT_THRESHOLD = 0.95
+DEFAULT_TTL = 3600.0
+DEFAULT_MAX_ENTRIES = 1000
+
+_Entry = namedtuple("_Entry", ["key", "vector", "answer", "created", "latency"])
+
+
+class AnswerCache:
+    """
+    In-memory LRU + TTL cache of answers keyed by (query embedding, chunk ids).
+
+    Args:
+        threshold: Minimum cosine similarity between question embeddings
+        ttl: Seconds an answer stays valid (None = forever)
+        max_entries: Least recently used answers are evicted beyond this
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        if not -1.0 <= threshold <= 1.0:
+            raise ValueError("threshold must be a cosine similarity in [-1, 1]")
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.build_id = None
+
+        self._entries = OrderedDict()  # entry id -> _Entry, least recently used first
+        self._by_key = {}  # (namespace, chunk ids) -> set of entry ids
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.latency_saved = 0.0
+
+    @staticmethod
+    def _key(chunk_ids, namespace):
+        return namespace, tuple(chunk_ids)
+
+    def _bind(self, build_id):
+        """Drop every answer if the index was rebuilt since they were cached."""
+        if build_id != self.build_id:
+            self._entries.clear()
+            self._by_key.clear()
+            self.build_id = build_id
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        ids = self._by_key[entry.key]
+        ids.discard(entry_id)
+        if not ids:
+            del self._by_key[entry.key]
+
+    def _expired(self, entry, now):
+        return self.ttl is not None and now - entry.created > self.ttl
+
+    def lookup(self, vector, chunk_ids, build_id=None, namespace=None):
+        """
+        Find a cached answer for a question.
+
+        Args:
+            vector: The question's embedding
+            chunk_ids: Stable keys of the chunks retrieved for it, in rank
+                order (hashable, e.g. chunk ids; not row numbers, which
+                change when rows are removed)
+            build_id: Build id of the index the chunks came from
+            namespace: Anything else the answer depends on (e.g. the model)
+
+        Returns:
+            str or None
+        """
+        vector = _unit(vector)
+        key = self._key(chunk_ids, namespace)
+        now = time.time()
+
+        with self._lock:
+            self._bind(build_id)
+            best_id, best_score = None, self.threshold
+            for entry_id in list(self._by_key.get(key, ())):
+                entry = self._entries[entry_id]
+                if self._expired(entry, now):
+                    self._remove(entry_id)
+                    self.expirations += 1
+                    continue
+                score = float(entry.vector @ vector)
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            entry = self._entries[best_id]
+            self.hits += 1
+            self.latency_saved += entry.latency
+            return entry.answer
+
+    def store(self, vector, chunk_ids, answer, latency=0.0, build_id=None, namespace=None):
+        """
+        Cache an answer.
+
+        Args:
+            vector: The question's embedding
+            chunk_ids: Keys of the chunks the answer was generated from,
+                as passed to lookup()
+            answer: The generated answer
+            latency: Seconds the generation took (reported as saved on hits)
+            build_id: Build id of the index the chunks came from
+            namespace: Anything else the answer depends on (e.g. the model)
+        """
+        entry = _Entry(
+            self._key(chunk_ids, namespace), _unit(vector), answer, time.time(), float(latency)
+        )
+        with self._lock:
+            self._bind(build_id)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = entry
+            self._by_key.setdefault(entry.key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every cached answer."""
+        with self._lock:
+            self._entries.clear()
+            self._by_key.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Hit/miss counters, latency saved (seconds) and the entry count."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "latency_saved": self.latency_saved,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "entries": len(self),
+            "max_entries": self.max_entries,
+        }
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def answer_cache_from_env():
+    """
+    Build the answer cache RAGSystem uses by default.
+
+    Disabled unless ``RAG_ANSWER_CACHE`` is set to ``on``; tuned with
+    ``RAG_ANSWER_CACHE_THRESHOLD``, ``RAG_ANSWER_CACHE_TTL`` (seconds) and
+    ``RAG_ANSWER_CACHE_SIZE``.
+
+    Returns:
+        AnswerCache, or None when disabled
+    """
+    settings.load_env()
+    if os.getenv("RAG_ANSWER_CACHE", "off").lower() not in ("1", "on", "true", "yes"):
+        return None
+    return AnswerCache(
+        threshold=float(os.getenv("RAG_ANSWER_CACHE_THRESHOLD", DEFAULT_THRESHOLD)),
+        ttl=float(os.getenv("RAG_ANSWER_CACHE_TTL", DEFAULT_TTL)),
+        max_entries=int(os.getenv("RAG_ANSWER_CACHE_SIZE", DEFAULT_MAX_ENTRIES)),
+    )
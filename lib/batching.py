@@ -0,0 +1,305 @@
+"""
+Dynamic micro-batching of concurrent searches.
+
+Requests submitted from many threads (for example the query server's
+request handlers) are queued and coalesced into windows: a window opens
+with the first waiting request and closes after ``max_wait_ms`` or once
+``max_batch`` requests have joined. Each window is embedded with one
+batched embedding call, and every group of its requests that share a
+search mode and filter is scored with one search_batch() call (one matrix
+multiply); each caller then gets its own results. Plain dense searches
+share a group across top_k values and are cut to each caller's; hybrid,
+lexical and re-ranked quantized searches look deeper as top_k grows, so
+their groups also share top_k.
+
+The queue is bounded: when ``max_queue`` requests are already waiting,
+submit() raises Overloaded at once rather than letting latency grow
+without limit, so callers can shed load (the server answers 503).
+"""
+
+import json
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future
+
+import numpy as np
+
+from . import tracing
+from .tracing import Histogram
+
+DEFAULT_MAX_BATCH = 32
+DEFAULT_MAX_WAIT_MS = 5.0
+DEFAULT_MAX_QUEUE = 256
+DEFAULT_TIMEOUT = 30.0
+# Seconds of completions behind stats()["recent_qps"]
+RATE_WINDOW = 10.0
+
+_Request = namedtuple("_Request", ["query", "top_k", "mode", "where", "future", "enqueued"])
+
+
+class Overloaded(RuntimeError):
+    """The batcher's queue is full; the request was not accepted."""
+
+
+def _where_key(where):
+    return None if where is None else json.dumps(where, sort_keys=True, default=str)
+
+
+class QueryBatcher:
+    """
+    Coalesce concurrent searches on one store into batched embedding and scoring.
+
+    A background thread drains the queue window by window; use search()
+    from any number of threads, or submit() to get a Future.
+
+    Args:
+        store: SimpleVectorStore to search
+        max_batch: Most requests per window
+        max_wait_ms: Longest a window stays open after its first request
+            arrived (a request that already waited that long is not held)
+        max_queue: Requests allowed to wait; beyond it submit() raises
+            Overloaded
+        mode: Search mode of requests that do not specify one
+        timeout: Default seconds search() waits for its result
+    """
+
+    def __init__(
+        self,
+        store,
+        max_batch=DEFAULT_MAX_BATCH,
+        max_wait_ms=DEFAULT_MAX_WAIT_MS,
+        max_queue=DEFAULT_MAX_QUEUE,
+        mode="dense",
+        timeout=DEFAULT_TIMEOUT,
+    ):
+        if max_batch < 1 or max_queue < 1 or max_wait_ms < 0:
+            raise ValueError("max_batch and max_queue must be positive, max_wait_ms >= 0")
+        self.store = store
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self.mode = mode
+        self.timeout = timeout
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = threading.Event()
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.batches = 0
+        self.latency = Histogram()  # submit() to result, seconds
+        self.queue_wait = Histogram()  # submit() to the start of its window
+        self._finished = deque()  # completion times within RATE_WINDOW
+
+        self._thread = threading.Thread(target=self._run, name="rag-query-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, query, top_k=3, mode=None, where=None):
+        """
+        Queue a search without waiting for it.
+
+        Args:
+            query: Search string
+            top_k: Number of results
+            mode: "dense", "lexical" or "hybrid" (default: the batcher's)
+            where: Metadata filter (see SimpleVectorStore.search)
+
+        Returns:
+            Future resolving to (results, query_vector); query_vector is
+            the query's embedding, or None for lexical searches
+
+        Raises:
+            Overloaded: ``max_queue`` requests are already waiting
+        """
+        if self._closed.is_set():
+            raise RuntimeError("QueryBatcher is closed")
+        if int(top_k) < 0:
+            raise ValueError("top_k must be non-negative")
+        future = Future()
+        enqueued = time.perf_counter()
+        request = _Request(query, int(top_k), mode or self.mode, where, future, enqueued)
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            tracing.count("batcher_rejected")
+            raise Overloaded(f"Query queue is full ({self.max_queue} requests waiting)") from None
+        with self._lock:
+            self.submitted += 1
+        return future
+
+    def search(self, query, top_k=3, mode=None, where=None, timeout=None):
+        """
+        submit() and wait for the result.
+
+        Returns:
+            tuple: (results, query_vector), see submit()
+
+        Raises:
+            Overloaded: The queue is full
+            concurrent.futures.TimeoutError: No result within ``timeout``
+                seconds (default: the batcher's)
+        """
+        future = self.submit(query, top_k, mode, where)
+        return future.result(self.timeout if timeout is None else timeout)
+
+    def _collect(self):
+        """The next window: wait for a first request, then gather until full or due."""
+        first = self._queue.get(timeout=0.1)
+        batch = [first]
+        deadline = first.enqueued + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    # Past the deadline, still take whatever is already queued
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._closed.is_set():
+            try:
+                batch = self._collect()
+            except queue.Empty:
+                continue
+            try:
+                self._process(batch)
+            except Exception as e:  # never let one window stop the batcher
+                for request in batch:
+                    if not request.future.done():
+                        self._finish(request, error=e)
+
+    def _process(self, batch):
+        start = time.perf_counter()
+        with self._lock:
+            self.batches += 1
+            for request in batch:
+                self.queue_wait.observe(start - request.enqueued)
+        batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+
+        with tracing.span("batch", size=len(batch)):
+            tracing.count("batched_queries", len(batch))
+            vectors = [None] * len(batch)
+            embed = [i for i, r in enumerate(batch) if r.mode != "lexical"]
+            if embed:
+                try:
+                    embedded = self.store.embed_queries([batch[i].query for i in embed])
+                except Exception as e:
+                    for i in embed:
+                        self._finish(batch[i], error=e)
+                    batch = [r if r.mode == "lexical" else None for r in batch]
+                else:
+                    for i, vector in zip(embed, np.asarray(embedded, dtype=np.float32)):
+                        vectors[i] = vector
+
+            # A larger top_k changes which candidates hybrid fusion and code
+            # re-ranking consider, so only plain dense rankings can be cut
+            reranks = self.store.quantizer is not None and self.store.rerank
+            groups = {}
+            for request, vector in zip(batch, vectors):
+                if request is not None:
+                    cut = request.mode == "dense" and not reranks
+                    key = (request.mode, _where_key(request.where), None if cut else request.top_k)
+                    groups.setdefault(key, []).append((request, vector))
+            for group in groups.values():
+                self._search_group(*zip(*group))
+
+    def _search_group(self, requests, vectors):
+        """Score requests sharing a mode and filter (and top_k) with one search_batch() call."""
+        first = requests[0]
+        try:
+            results = self.store.search_batch(
+                [r.query for r in requests],
+                top_k=max(r.top_k for r in requests),
+                mode=first.mode,
+                where=first.where,
+                query_vectors=None if first.mode == "lexical" else np.stack(vectors),
+            )
+        except Exception as e:
+            for request in requests:
+                self._finish(request, error=e)
+            return
+        for request, hits, vector in zip(requests, results, vectors):
+            self._finish(request, result=(hits[: request.top_k], vector))
+
+    def _finish(self, request, result=None, error=None):
+        now = time.perf_counter()
+        with self._lock:
+            self.latency.observe(now - request.enqueued)
+            if error is None:
+                self.completed += 1
+                self._finished.append(now)
+            else:
+                self.failed += 1
+        if error is None:
+            request.future.set_result(result)
+        else:
+            request.future.set_exception(error)
+
+    def stats(self):
+        """
+        Batching, queueing, latency and throughput statistics.
+
+        Returns:
+            dict with request counters, ``mean_batch_size``, ``queue_depth``,
+            ``qps`` (since start), ``recent_qps`` (last RATE_WINDOW seconds)
+            and ``latency_ms`` / ``queue_wait_ms`` percentiles
+        """
+        now = time.perf_counter()
+        with self._lock:
+            while self._finished and self._finished[0] < now - RATE_WINDOW:
+                self._finished.popleft()
+            uptime = time.monotonic() - self.started
+            window = min(RATE_WINDOW, uptime)
+            processed = self.completed + self.failed
+            stats = {
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "batches": self.batches,
+                "mean_batch_size": processed / self.batches if self.batches else 0.0,
+                "max_batch": self.max_batch,
+                "max_wait_ms": 1000 * self.max_wait,
+                "queue_depth": self._queue.qsize(),
+                "max_queue": self.max_queue,
+                "qps": self.completed / uptime if uptime > 0 else 0.0,
+                "recent_qps": len(self._finished) / window if window > 0 else 0.0,
+            }
+            for name, histogram in (
+                ("latency_ms", self.latency),
+                ("queue_wait_ms", self.queue_wait),
+            ):
+                p50, p95, p99 = histogram.quantiles()
+                stats[name] = {"p50": 1000 * p50, "p95": 1000 * p95, "p99": 1000 * p99}
+        return stats
+
+    def close(self):
+        """Stop the batching thread; requests still queued fail with RuntimeError."""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._thread.join()
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request.future.set_running_or_notify_cancel():
+                self._finish(request, error=RuntimeError("QueryBatcher is closed"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
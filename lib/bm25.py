@@ -0,0 +1,197 @@
+"""
+Lexical (BM25) retrieval for SimpleVectorStore.
+
+BM25Index is an inverted index over the stored chunks. It answers queries
+without an embedding call and ranks exact terms such as error codes and
+identifiers well, which dense similarity often does not. Postings are
+kept as flat (term, chunk, frequency) arrays, so the index is saved next
+to the embeddings and memory-mapped on load like the other structures.
+"""
+
+import math
+import re
+from collections import Counter
+
+import numpy as np
+
+from ._vectors import top_k_indices
+
+# Words, plus compounds such as "err-503", "foo.bar" or "v1.2:beta"
+_TOKEN = re.compile(r"\w+(?:[-.:/]\w+)*")
+_COMPOUND_SEPARATOR = re.compile(r"[-_.:/]")
+
+
+def tokenize(text):
+    """
+    Lower-cased terms of ``text``.
+
+    Compound tokens are kept whole and also split into their parts, so
+    "ERR_CONN-42" matches queries for "err_conn-42", "conn" or "42".
+    """
+    tokens = []
+    for match in _TOKEN.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        parts = [p for p in _COMPOUND_SEPARATOR.split(token) if p]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the rows of a store.
+
+    Args:
+        k1: Term-frequency saturation
+        b: Document-length normalisation (0 = none, 1 = full)
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.terms = []  # term id -> term
+        self.vocab = {}  # term -> term id
+        self.term_ids = np.zeros(0, dtype=np.int32)  # one entry per (term, row) pair
+        self.rows = np.zeros(0, dtype=np.int32)
+        self.tf = np.zeros(0, dtype=np.float32)
+        self.doc_len = np.zeros(0, dtype=np.float32)  # tokens per row
+        self._postings = None
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def add(self, texts):
+        """Index newly appended rows."""
+        term_ids, rows, tf, lengths = [], [], [], []
+        for offset, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                term_id = self.vocab.get(term)
+                if term_id is None:
+                    term_id = self.vocab[term] = len(self.terms)
+                    self.terms.append(term)
+                term_ids.append(term_id)
+                rows.append(len(self) + offset)
+                tf.append(count)
+
+        self.term_ids = np.concatenate([self.term_ids, np.asarray(term_ids, dtype=np.int32)])
+        self.rows = np.concatenate([self.rows, np.asarray(rows, dtype=np.int32)])
+        self.tf = np.concatenate([self.tf, np.asarray(tf, dtype=np.float32)])
+        self.doc_len = np.concatenate([self.doc_len, np.asarray(lengths, dtype=np.float32)])
+        self._postings = None
+
+    def keep(self, mask):
+        """Drop rows where ``mask`` is False (mirrors a store row removal)."""
+        mask = np.asarray(mask, dtype=bool)
+        new_row = np.cumsum(mask, dtype=np.int64) - 1
+        alive = mask[self.rows]
+        self.term_ids = self.term_ids[alive]
+        self.rows = new_row[self.rows[alive]].astype(np.int32)
+        self.tf = self.tf[alive]
+        self.doc_len = self.doc_len[mask]
+        self._postings = None
+
+    def _inverted_lists(self):
+        """(rows, tf, offsets): postings of term t are [offsets[t]:offsets[t+1]]."""
+        if self._postings is None:
+            order = np.argsort(self.term_ids, kind="stable")
+            offsets = np.searchsorted(
+                self.term_ids[order], np.arange(len(self.terms) + 1), side="left"
+            )
+            self._postings = (self.rows[order], self.tf[order], offsets)
+        return self._postings
+
+    def scores(self, query):
+        """BM25 score of every row for ``query`` (0 where no term matches)."""
+        n = len(self)
+        scores = np.zeros(n, dtype=np.float32)
+        if n == 0:
+            return scores
+        rows, tf, offsets = self._inverted_lists()
+        avg_len = max(float(self.doc_len.mean()), 1e-9)
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len / avg_len)
+
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = offsets[term_id], offsets[term_id + 1]
+            df = end - start
+            if df == 0:
+                continue
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            hits, freq = rows[start:end], tf[start:end]
+            scores[hits] += idf * freq * (self.k1 + 1) / (freq + norm[hits])
+        return scores
+
+    def search(self, query, top_k, allowed=None):
+        """
+        Best-scoring rows for ``query``.
+
+        Args:
+            query: Query text
+            top_k: Rows to return
+            allowed: Optional boolean row mask; other rows are never returned
+
+        Returns:
+            (rows, scores) arrays, best first; rows matching no query term
+            are left out, so there may be fewer than ``top_k``
+        """
+        scores = self.scores(query)
+        if allowed is not None:
+            scores[~allowed] = 0
+        matched = np.flatnonzero(scores > 0)
+        top = top_k_indices(scores[matched], top_k)
+        return matched[top], scores[matched[top]]
+
+    def state(self):
+        """(params, arrays) for persisting the index."""
+        rows, tf, offsets = self._inverted_lists()
+        vocab = np.frombuffer("\n".join(self.terms).encode("utf-8"), dtype=np.uint8)
+        params = {"type": "bm25", "k1": self.k1, "b": self.b}
+        arrays = {
+            "vocab": vocab,
+            "term_ids": np.repeat(np.arange(len(self.terms), dtype=np.int32), np.diff(offsets)),
+            "rows": rows,
+            "tf": tf,
+            "doc_len": self.doc_len,
+        }
+        return params, arrays
+
+    @classmethod
+    def from_state(cls, params, arrays):
+        index = cls(k1=params["k1"], b=params["b"])
+        vocab = bytes(arrays["vocab"]).decode("utf-8")
+        index.terms = vocab.split("\n") if vocab else []
+        index.vocab = {term: i for i, term in enumerate(index.terms)}
+        index.term_ids = np.asarray(arrays["term_ids"], dtype=np.int32)
+        index.rows = np.asarray(arrays["rows"], dtype=np.int32)
+        index.tf = np.asarray(arrays["tf"], dtype=np.float32)
+        index.doc_len = np.asarray(arrays["doc_len"], dtype=np.float32)
+        return index
+
+
+def reciprocal_rank_fusion(rankings, top_k, k=60):
+    """
+    Fuse several ranked row lists: score(row) = sum of 1 / (k + rank).
+
+    Args:
+        rankings: Iterable of row-index arrays, best first
+        top_k: Rows to return
+        k: Damping constant (60 in the original RRF paper)
+
+    Returns:
+        (rows, scores) arrays, best first
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, 1):
+            fused[int(row)] = fused.get(int(row), 0.0) + 1.0 / (k + rank)
+    if not fused:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    rows = np.fromiter(fused, dtype=np.int64, count=len(fused))
+    scores = np.fromiter(fused.values(), dtype=np.float32, count=len(fused))
+    top = top_k_indices(scores, top_k)
+    return rows[top], scores[top]
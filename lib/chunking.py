@@ -0,0 +1,153 @@
+"""
+Chunking strategies for splitting documents before embedding.
+
+Every strategy is a generator of Chunk(text, start, end) tuples, where
+start/end are character offsets into the original document, so chunks
+can be produced and embedded one batch at a time.
+"""
+
+import re
+from collections import namedtuple
+
+Chunk = namedtuple("Chunk", ["text", "start", "end"])
+
+DEFAULT_SEPARATORS = ("\n\n", "\n", ". ", " ")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def _make_chunk(text, start, end):
+    """Trim surrounding whitespace, keeping offsets in sync (None if empty)."""
+    piece = text[start:end]
+    stripped = piece.strip()
+    if not stripped:
+        return None
+    start += len(piece) - len(piece.lstrip())
+    return Chunk(stripped, start, start + len(stripped))
+
+
+def _fixed_spans(start, end, size, step):
+    """Fixed-width (start, end) windows over text[start:end]."""
+    pos = start
+    while pos < end:
+        yield pos, min(pos + size, end)
+        if pos + size >= end:
+            break
+        pos += step
+
+
+def _merge_spans(text, spans, chunk_size, overlap):
+    """
+    Pack consecutive (start, end) spans into chunks of at most ``chunk_size``
+    characters, starting each chunk so it re-covers about ``overlap``
+    characters of the previous one.
+    """
+    if overlap >= chunk_size:
+        raise ValueError("overlap must be smaller than chunk_size")
+    spans = list(spans)
+    i = 0
+    while i < len(spans):
+        j = i
+        while j + 1 < len(spans) and spans[j + 1][1] - spans[i][0] <= chunk_size:
+            j += 1
+
+        chunk = _make_chunk(text, spans[i][0], spans[j][1])
+        if chunk:
+            yield chunk
+        if j + 1 >= len(spans):
+            break
+
+        # Step back over trailing spans that fit in the overlap window
+        next_i = j + 1
+        while next_i - 1 > i and spans[j][1] - spans[next_i - 1][0] <= overlap:
+            next_i -= 1
+        i = next_i
+
+
+def fixed_size_chunks(text, chunk_size=1000, overlap=100):
+    """Split text into fixed-size character windows."""
+    if overlap >= chunk_size:
+        raise ValueError("overlap must be smaller than chunk_size")
+    for start, end in _fixed_spans(0, len(text), chunk_size, chunk_size - overlap):
+        chunk = _make_chunk(text, start, end)
+        if chunk:
+            yield chunk
+
+
+def _sentence_spans(text, chunk_size):
+    """Sentence (start, end) spans; overlong sentences are cut to size."""
+    start = 0
+    for match in _SENTENCE_END.finditer(text):
+        yield from _fixed_spans(start, match.start(), chunk_size, chunk_size)
+        start = match.end()
+    yield from _fixed_spans(start, len(text), chunk_size, chunk_size)
+
+
+def sentence_chunks(text, chunk_size=1000, overlap=100):
+    """Pack whole sentences into chunks of at most ``chunk_size`` characters."""
+    return _merge_spans(text, _sentence_spans(text, chunk_size), chunk_size, overlap)
+
+
+def _recursive_spans(text, start, end, chunk_size, separators):
+    """Split text[start:end] on the coarsest separator that fits the size."""
+    if end - start <= chunk_size:
+        yield start, end
+        return
+    if not separators:
+        yield from _fixed_spans(start, end, chunk_size, chunk_size)
+        return
+
+    separator, rest = separators[0], separators[1:]
+    pos = start
+    while pos < end:
+        cut = text.find(separator, pos, end)
+        piece_end = end if cut == -1 else cut + len(separator)
+        yield from _recursive_spans(text, pos, piece_end, chunk_size, rest)
+        pos = piece_end
+
+
+def recursive_chunks(text, chunk_size=1000, overlap=100, separators=DEFAULT_SEPARATORS):
+    """
+    Split on paragraphs, then lines, sentences and words as needed, and pack
+    the pieces into chunks of at most ``chunk_size`` characters.
+    """
+    spans = _recursive_spans(text, 0, len(text), chunk_size, tuple(separators))
+    return _merge_spans(text, spans, chunk_size, overlap)
+
+
+STRATEGIES = {
+    "fixed": fixed_size_chunks,
+    "sentence": sentence_chunks,
+    "recursive": recursive_chunks,
+}
+
+
+def chunk_text(text, strategy="recursive", chunk_size=1000, overlap=100):
+    """
+    Split one document with the named strategy.
+
+    Args:
+        text: Document text
+        strategy: "fixed", "sentence" or "recursive"
+        chunk_size: Maximum characters per chunk
+        overlap: Characters shared between consecutive chunks
+
+    Returns:
+        Generator of Chunk(text, start, end)
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown chunking strategy {strategy!r}; choose from {sorted(STRATEGIES)}")
+    if chunk_size <= 0 or overlap < 0:
+        raise ValueError("chunk_size must be positive and overlap non-negative")
+    return STRATEGIES[strategy](text, chunk_size=chunk_size, overlap=overlap)
+
+
+def iter_chunks(documents, strategy="recursive", chunk_size=1000, overlap=100):
+    """
+    Chunk a stream of (source, text) documents lazily.
+
+    Yields:
+        (chunk_text, metadata) with metadata {"source", "chunk", "start", "end"}
+    """
+    for source, text in documents:
+        for i, chunk in enumerate(chunk_text(text, strategy, chunk_size, overlap)):
+            yield chunk.text, {"source": source, "chunk": i, "start": chunk.start, "end": chunk.end}
@@ -0,0 +1,211 @@
+"""
+Token-budgeted context assembly for RAG prompts.
+
+ContextBuilder picks which retrieved chunks go into the prompt: it drops
+near-duplicates, can diversify the selection with maximal marginal
+relevance (MMR), and stops (truncating the last chunk if worthwhile) once
+a token budget is spent. Tokens are counted with a local approximation of
+a BPE tokenizer, so no tokenizer download or API call is needed.
+"""
+
+import os
+import re
+from collections import namedtuple
+
+import numpy as np
+
+from . import settings
+
+DEFAULT_MAX_TOKENS = 3000
+DEFAULT_DEDUP_THRESHOLD = 0.95
+# A chunk is only truncated into the budget if at least this much of it fits
+MIN_TRUNCATED_TOKENS = 32
+
+# Words, numbers and single punctuation marks
+_PIECE = re.compile(r"\w+|[^\w\s]")
+
+ContextReport = namedtuple(
+    "ContextReport",
+    ["candidates", "selected", "duplicates", "truncated", "tokens_sent", "tokens_saved"],
+)
+
+
+def _piece_tokens(piece):
+    # Short words are usually one BPE token; longer ones about 4 characters each
+    return 1 if len(piece) <= 4 else (len(piece) + 3) // 4
+
+
+def count_tokens(text):
+    """Approximate number of LLM tokens in ``text`` (within ~10-20% for English)."""
+    return sum(_piece_tokens(m.group()) for m in _PIECE.finditer(text))
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Longest prefix of ``text`` (cut between words) within ``max_tokens``."""
+    used, end = 0, 0
+    for match in _PIECE.finditer(text):
+        used += _piece_tokens(match.group())
+        if used > max_tokens:
+            break
+        end = match.end()
+    return text[:end]
+
+
+def _similarities(texts, embeddings):
+    """(n, n) cosine similarities of the embeddings, else word-set Jaccard."""
+    if embeddings is not None:
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms > 0, norms, 1.0)
+        return matrix @ matrix.T
+
+    words = [set(re.findall(r"\w+", text.lower())) for text in texts]
+    sims = np.eye(len(texts), dtype=np.float32)
+    for i in range(len(texts)):
+        for j in range(i + 1, len(texts)):
+            union = len(words[i] | words[j])
+            sims[i, j] = sims[j, i] = len(words[i] & words[j]) / union if union else 1.0
+    return sims
+
+
+class ContextBuilder:
+    """
+    Select and trim retrieved chunks to fit a prompt token budget.
+
+    Args:
+        max_tokens: Budget for the chunk texts placed in the prompt
+        dedup_threshold: Drop a chunk whose similarity to an already
+            selected one is at least this (None disables deduplication)
+        mmr_lambda: Enable MMR with this relevance/diversity trade-off
+            (1.0 = pure relevance, 0.0 = pure diversity; None disables)
+        fetch_factor: Retrieve this many times top_k candidates when
+            deduplication or MMR may discard some
+    """
+
+    def __init__(
+        self,
+        max_tokens=DEFAULT_MAX_TOKENS,
+        dedup_threshold=DEFAULT_DEDUP_THRESHOLD,
+        mmr_lambda=None,
+        fetch_factor=2,
+    ):
+        if max_tokens <= 0:
+            raise ValueError("max_tokens must be positive")
+        if mmr_lambda is not None and not 0.0 <= mmr_lambda <= 1.0:
+            raise ValueError("mmr_lambda must be between 0 and 1")
+        self.max_tokens = max_tokens
+        self.dedup_threshold = dedup_threshold
+        self.mmr_lambda = mmr_lambda
+        self.fetch_factor = fetch_factor
+        self.tokens_sent = 0
+        self.tokens_saved = 0
+
+    def fetch_k(self, top_k):
+        """How many candidates to retrieve for ``top_k`` context chunks."""
+        if self.dedup_threshold is None and self.mmr_lambda is None:
+            return top_k
+        return top_k * self.fetch_factor
+
+    def _order(self, results, sims, embeddings, query_vector):
+        """Candidate positions in selection order (MMR or retrieval rank)."""
+        if self.mmr_lambda is None:
+            return list(range(len(results)))
+
+        if embeddings is not None and query_vector is not None:
+            query = np.asarray(query_vector, dtype=np.float32).ravel()
+            matrix = np.asarray(embeddings, dtype=np.float32)
+            relevance = matrix @ query / max(float(np.linalg.norm(query)), 1e-12)
+            relevance = relevance / np.maximum(np.linalg.norm(matrix, axis=1), 1e-12)
+        else:
+            # Scores of different retrieval modes are on different scales
+            scores = np.array([r["score"] for r in results], dtype=np.float32)
+            relevance = scores / max(float(np.abs(scores).max()), 1e-12)
+
+        order, remaining = [], list(range(len(results)))
+        while remaining:
+            if order:
+                redundancy = sims[np.ix_(remaining, order)].max(axis=1)
+            else:
+                redundancy = np.zeros(len(remaining), dtype=np.float32)
+            mmr = self.mmr_lambda * relevance[remaining] - (1 - self.mmr_lambda) * redundancy
+            order.append(remaining.pop(int(np.argmax(mmr))))
+        return order
+
+    def build(self, results, top_k, embeddings=None, query_vector=None):
+        """
+        Choose the chunks to send.
+
+        Args:
+            results: Retrieved result dicts, best first (see SimpleVectorStore.search)
+            top_k: Maximum chunks to keep
+            embeddings: Optional (n, dim) embeddings of ``results``, used for
+                deduplication and MMR (word overlap is used otherwise)
+            query_vector: Optional query embedding for MMR relevance
+
+        Returns:
+            (selected results, ContextReport); a truncated chunk is a copy of
+            its result dict with shortened text and "truncated": True
+        """
+        results = list(results)
+        tokens = [count_tokens(r["text"]) for r in results]
+        # What sending the top_k chunks whole would have cost
+        baseline = sum(tokens[:top_k])
+
+        check_dups = self.dedup_threshold is not None or self.mmr_lambda is not None
+        sims = _similarities([r["text"] for r in results], embeddings) if check_dups else None
+
+        selected, chosen, duplicates, truncated, used = [], [], 0, 0, 0
+        for i in self._order(results, sims, embeddings, query_vector):
+            if len(selected) == top_k or used >= self.max_tokens:
+                break
+            if self.dedup_threshold is not None and chosen:
+                if sims[i, chosen].max() >= self.dedup_threshold:
+                    duplicates += 1
+                    continue
+
+            remaining = self.max_tokens - used
+            if tokens[i] <= remaining:
+                selected.append(results[i])
+                used += tokens[i]
+            elif remaining >= MIN_TRUNCATED_TOKENS:
+                text = truncate_to_tokens(results[i]["text"], remaining)
+                selected.append(dict(results[i], text=text, truncated=True))
+                used += count_tokens(text)
+                truncated += 1
+            else:
+                continue
+            chosen.append(i)
+
+        report = ContextReport(
+            candidates=len(results),
+            selected=len(selected),
+            duplicates=duplicates,
+            truncated=truncated,
+            tokens_sent=used,
+            tokens_saved=max(0, baseline - used),
+        )
+        self.tokens_sent += report.tokens_sent
+        self.tokens_saved += report.tokens_saved
+        return selected, report
+
+    def stats(self):
+        """Context tokens sent and saved so far."""
+        return {"tokens_sent": self.tokens_sent, "tokens_saved": self.tokens_saved}
+
+
+def context_builder_from_env():
+    """
+    Build the ContextBuilder RAGSystem uses by default.
+
+    ``RAG_CONTEXT_TOKENS`` sets the budget, ``RAG_CONTEXT_DEDUP`` the
+    near-duplicate threshold (``off`` disables it) and ``RAG_CONTEXT_MMR``
+    enables MMR with the given lambda.
+    """
+    settings.load_env()
+    dedup = os.getenv("RAG_CONTEXT_DEDUP", str(DEFAULT_DEDUP_THRESHOLD))
+    mmr = os.getenv("RAG_CONTEXT_MMR")
+    return ContextBuilder(
+        max_tokens=int(os.getenv("RAG_CONTEXT_TOKENS", DEFAULT_MAX_TOKENS)),
+        dedup_threshold=None if dedup.lower() in ("", "off", "none") else float(dedup),
+        mmr_lambda=float(mmr) if mmr else None,
+    )
@@ -0,0 +1,411 @@
+"""
+Embedding backends for SimpleVectorStore.
+
+RemoteEmbedder calls the embeddings API (lib.embedding). HashingEmbedder
+and PrecomputedEmbedder run locally with no network at all:
+
+- HashingEmbedder hashes each word and its character n-grams into a large
+  sparse TF-IDF space and maps it to ``dim`` dense dimensions with a fixed
+  sparse random projection. Lexical rather than semantic (though n-grams
+  match "chunk" with "chunking"), but deterministic, fast and vectorised
+  over a batch of texts.
+- PrecomputedEmbedder serves vectors computed elsewhere from a .npz or
+  JSON-lines file, keyed by text.
+
+Every backend describes itself with ``state()`` (manifest params plus
+arrays, like the ANN index and quantizers), so a saved store records which
+embedder and dimension produced it and queries are embedded the same way.
+Loading an index only creates embedders of registered backends: the ones
+above, and Embedder subclasses passed to register_embedder() (e.g. as a
+class decorator). An index may also name its backend "package.module:Class";
+that module is imported only when the caller opts in (``import_embedder``),
+since an index from elsewhere could otherwise run arbitrary imports.
+"""
+
+import abc
+import hashlib
+import importlib
+import json
+import os
+import zlib
+
+import numpy as np
+
+from ._vectors import normalize_rows
+from .bm25 import tokenize
+
+DEFAULT_MODEL = "openai/text-embedding-3-small"
+DEFAULT_DIM = 256
+DEFAULT_FEATURES = 2**18
+DEFAULT_CHAR_NGRAMS = (3, 5)
+# Output dimensions each hashed feature is projected onto
+PROJECTION_NONZEROS = 4
+# Words whose feature ids are remembered per HashingEmbedder before the memo resets
+_MEMO_SIZE = 1_000_000
+# Params that say where an embedder's data lives rather than what it computes
+_LOCATION_PARAMS = ("path",)
+
+
+class Embedder(abc.ABC):
+    """
+    Base class: turns a batch of texts into a (n, dim) float32 matrix.
+
+    Subclasses set ``backend`` and implement ``embed`` and ``state`` (and
+    ``from_state`` to be loadable); the async variant runs ``embed`` inline
+    unless overridden.
+    """
+
+    backend = None
+    dim = None
+
+    @abc.abstractmethod
+    def embed(self, texts, batch_size=64):
+        """(n, dim) float32 embeddings of ``texts``."""
+
+    def embed_one(self, text):
+        return self.embed([text])[0]
+
+    async def aembed(self, texts, batch_size=64):
+        return self.embed(texts, batch_size=batch_size)
+
+    async def aembed_one(self, text):
+        return (await self.aembed([text]))[0]
+
+    @abc.abstractmethod
+    def state(self):
+        """(manifest params including "backend", {name: ndarray}) describing this embedder."""
+
+
+class RemoteEmbedder(Embedder):
+    """
+    Embeddings from the OpenRouter API (see lib.embedding).
+
+    Args:
+        model: Embedding model to request
+        cache: EmbeddingCache to consult (default: the shared on-disk cache,
+            False to bypass it)
+    """
+
+    backend = "remote"
+
+    def __init__(self, model=DEFAULT_MODEL, cache=None):
+        self.model = model
+        self.cache = cache
+
+    def embed(self, texts, batch_size=64):
+        from .embedding import get_embeddings
+
+        return get_embeddings(texts, model=self.model, batch_size=batch_size, cache=self.cache)
+
+    async def aembed(self, texts, batch_size=64):
+        from .embedding import aget_embeddings
+
+        return await aget_embeddings(
+            texts, model=self.model, batch_size=batch_size, cache=self.cache
+        )
+
+    def state(self):
+        return {"backend": self.backend, "model": self.model}, {}
+
+    @classmethod
+    def from_state(cls, params, arrays):
+        return cls(model=params["model"])
+
+
+class HashingEmbedder(Embedder):
+    """
+    Feature-hashed TF-IDF vectors reduced by a sparse random projection.
+
+    Words (lib.bm25's tokenizer) and the character n-grams of "<word>" are
+    hashed into ``n_features`` buckets and weighted by 1 + log(tf), times
+    the bucket's IDF once ``fit`` has seen a corpus. Each bucket is
+    projected onto PROJECTION_NONZEROS of the ``dim`` output dimensions
+    with random signs, which approximately preserves cosine similarity.
+    Everything is derived from ``seed``, so the same settings always
+    produce the same vectors.
+
+    Args:
+        dim: Output dimension
+        n_features: Hash buckets before projection
+        seed: Seed of the term hash and of the projection
+        char_ngrams: (min, max) character n-gram lengths, or None for
+            whole words only
+    """
+
+    backend = "hashing"
+
+    def __init__(
+        self, dim=DEFAULT_DIM, n_features=DEFAULT_FEATURES, seed=0, char_ngrams=DEFAULT_CHAR_NGRAMS
+    ):
+        if dim <= 0 or n_features <= 0:
+            raise ValueError("dim and n_features must be positive")
+        self.dim = dim
+        self.n_features = n_features
+        self.seed = seed
+        self.char_ngrams = tuple(char_ngrams) if char_ngrams else None
+        self.idf = None
+        self._memo = {}
+        self._projection = None
+
+    @property
+    def fitted(self):
+        return self.idf is not None
+
+    def _features(self, word):
+        """Hashed feature ids of a word and its character n-grams."""
+        features = self._memo.get(word)
+        if features is None:
+            terms = [word]
+            if self.char_ngrams:
+                low, high = self.char_ngrams
+                marked = f"<{word}>"
+                for n in range(low, high + 1):
+                    terms.extend(marked[i : i + n] for i in range(len(marked) - n + 1))
+            features = [
+                zlib.crc32(term.encode("utf-8"), self.seed) % self.n_features for term in terms
+            ]
+            if len(self._memo) >= _MEMO_SIZE:
+                self._memo.clear()
+            self._memo[word] = features
+        return features
+
+    def _term_counts(self, texts):
+        """(rows, features, counts) of the distinct hashed terms in each text."""
+        rows, features = [], []
+        for row, text in enumerate(texts):
+            ids = [f for word in tokenize(text) for f in self._features(word)]
+            rows.append(np.full(len(ids), row, dtype=np.int64))
+            features.append(np.array(ids, dtype=np.int64))
+        if not rows:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        keys = np.concatenate(rows) * self.n_features + np.concatenate(features)
+        keys, counts = np.unique(keys, return_counts=True)
+        rows, features = np.divmod(keys, self.n_features)
+        return rows, features, counts
+
+    def _project(self):
+        """(n_features, PROJECTION_NONZEROS) output columns and signed weights."""
+        if self._projection is None:
+            rng = np.random.default_rng(self.seed)
+            shape = (self.n_features, PROJECTION_NONZEROS)
+            columns = rng.integers(0, self.dim, size=shape, dtype=np.int64)
+            signs = rng.choice(np.array([-1.0, 1.0], dtype=np.float32), size=shape)
+            self._projection = columns, signs / np.sqrt(PROJECTION_NONZEROS)
+        return self._projection
+
+    def fit(self, texts, batch_size=1024):
+        """
+        Learn IDF weights from a corpus (an iterable of texts, streamed).
+
+        Returns:
+            self
+        """
+        df = np.zeros(self.n_features, dtype=np.int64)
+        total, batch = 0, []
+        for text in texts:
+            batch.append(text)
+            if len(batch) == batch_size:
+                df += np.bincount(self._term_counts(batch)[1], minlength=self.n_features)
+                total, batch = total + len(batch), []
+        if batch:
+            df += np.bincount(self._term_counts(batch)[1], minlength=self.n_features)
+            total += len(batch)
+        self.idf = (np.log((1 + total) / (1 + df)) + 1).astype(np.float32)
+        return self
+
+    def embed(self, texts, batch_size=64):
+        texts = list(texts)
+        rows, features, counts = self._term_counts(texts)
+        weights = 1 + np.log(counts)
+        if self.idf is not None:
+            weights = weights * self.idf[features]
+        columns, signs = self._project()
+        flat = (rows[:, None] * self.dim + columns[features]).ravel()
+        values = (weights[:, None] * signs[features]).ravel()
+        out = np.bincount(flat, weights=values, minlength=len(texts) * self.dim)
+        return normalize_rows(out.reshape(len(texts), self.dim).astype(np.float32))
+
+    def state(self):
+        params = {
+            "backend": self.backend,
+            "dim": self.dim,
+            "n_features": self.n_features,
+            "seed": self.seed,
+            "char_ngrams": list(self.char_ngrams) if self.char_ngrams else None,
+            "idf": None,
+        }
+        if self.idf is None:
+            return params, {}
+        params["idf"] = hashlib.sha256(self.idf.tobytes()).hexdigest()[:16]
+        return params, {"idf": self.idf}
+
+    @classmethod
+    def from_state(cls, params, arrays):
+        embedder = cls(
+            dim=params["dim"],
+            n_features=params["n_features"],
+            seed=params["seed"],
+            char_ngrams=params["char_ngrams"],
+        )
+        if "idf" in arrays:
+            embedder.idf = np.asarray(arrays["idf"], dtype=np.float32)
+        return embedder
+
+
+class PrecomputedEmbedder(Embedder):
+    """
+    Vectors computed ahead of time, looked up by exact text.
+
+    The file is either a .npz with ``texts`` and ``vectors`` arrays (and an
+    optional ``model`` string; see save_precomputed), or JSON lines of
+    {"text": ..., "embedding": [...]}. It is read on first use.
+
+    Args:
+        path: Vector file
+        model: Name of the model that produced the vectors (default: the
+            one stored in a .npz)
+    """
+
+    backend = "precomputed"
+
+    def __init__(self, path, model=None):
+        self.path = path
+        self.model = model
+        self._rows = None
+        self._vectors = None
+
+    def _load(self):
+        if self._rows is not None:
+            return
+        if self.path.endswith(".npz"):
+            with np.load(self.path, allow_pickle=False) as data:
+                texts, vectors = data["texts"].tolist(), data["vectors"]
+                if self.model is None and "model" in data:
+                    self.model = str(data["model"])
+        else:
+            texts, vectors = [], []
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        texts.append(record["text"])
+                        vectors.append(record["embedding"])
+        self._vectors = np.asarray(vectors, dtype=np.float32)
+        self._rows = {text: row for row, text in enumerate(texts)}
+
+    @property
+    def dim(self):
+        self._load()
+        return self._vectors.shape[1] if self._vectors.ndim == 2 else None
+
+    def embed(self, texts, batch_size=64):
+        self._load()
+        texts = list(texts)
+        rows = [self._rows.get(text) for text in texts]
+        missing = sum(row is None for row in rows)
+        if missing:
+            raise LookupError(
+                f"{missing} of {len(texts)} texts have no precomputed vector in {self.path}"
+            )
+        return self._vectors[np.array(rows, dtype=np.int64)]
+
+    def state(self):
+        self._load()
+        return {"backend": self.backend, "model": self.model, "path": self.path}, {}
+
+    @classmethod
+    def from_state(cls, params, arrays):
+        return cls(params["path"], model=params["model"])
+
+
+def save_precomputed(path, texts, vectors, model=None):
+    """Write ``texts`` and their (n, dim) ``vectors`` as a PrecomputedEmbedder .npz file."""
+    arrays = {"texts": np.array(list(texts), dtype=str), "vectors": np.asarray(vectors, np.float32)}
+    if model is not None:
+        arrays["model"] = np.array(model)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    np.savez(path, **arrays)
+
+
+EMBEDDERS = {
+    "remote": RemoteEmbedder,
+    "hashing": HashingEmbedder,
+    "precomputed": PrecomputedEmbedder,
+}
+# Params recorded for the default remote model (served by lib.embedding directly)
+DEFAULT_PARAMS = {"backend": "remote", "model": DEFAULT_MODEL}
+
+
+def register_embedder(cls):
+    """
+    Make an Embedder subclass creatable by its ``backend`` name.
+
+    Indexes recording that backend can then be loaded. Returns ``cls``, so
+    it also works as a class decorator.
+    """
+    if not (isinstance(cls, type) and issubclass(cls, Embedder)):
+        raise TypeError(f"{cls!r} is not an Embedder subclass")
+    if not cls.backend:
+        raise ValueError(f"{cls.__name__} has no backend name")
+    EMBEDDERS[cls.backend] = cls
+    return cls
+
+
+def make_embedder(backend, **options):
+    """Create an embedder by name ("remote", "hashing", "precomputed" or a registered one)."""
+    if backend not in EMBEDDERS:
+        raise ValueError(f"Unknown embedder {backend!r}; choose from {sorted(EMBEDDERS)}")
+    return EMBEDDERS[backend](**options)
+
+
+def _embedder_class(backend, import_embedder=False):
+    """The registered class of a backend, importing a "package.module:Class" one if allowed."""
+    if backend in EMBEDDERS:
+        return EMBEDDERS[backend]
+    if ":" not in backend:
+        raise ValueError(f"Unknown embedder {backend!r}; choose from {sorted(EMBEDDERS)}")
+    if not import_embedder:
+        raise ValueError(
+            f"Index uses embedder {backend!r}, which is not registered; import and "
+            "register_embedder() it, or pass import_embedder=True if the index is trusted"
+        )
+    module, _, name = backend.partition(":")
+    cls = getattr(importlib.import_module(module), name, None)
+    if not (isinstance(cls, type) and issubclass(cls, Embedder)):
+        raise ValueError(f"{backend!r} is not an Embedder subclass")
+    EMBEDDERS[backend] = cls
+    return cls
+
+
+def embedder_from_state(params, arrays, import_embedder=False):
+    """
+    Rebuild an embedder saved with ``state()`` (None for the default remote model).
+
+    Args:
+        params: Manifest params recorded by ``state()``
+        arrays: The arrays recorded with them
+        import_embedder: Import an unregistered "package.module:Class"
+            backend (only for trusted indexes)
+    """
+    if same_embedder(params, DEFAULT_PARAMS):
+        return None
+    return _embedder_class(params["backend"], import_embedder).from_state(params, arrays)
+
+
+def embedder_params(embedder):
+    """Manifest params of ``embedder`` (None = the default remote model)."""
+    return dict(DEFAULT_PARAMS) if embedder is None else embedder.state()[0]
+
+
+def same_embedder(a, b):
+    """True if two params dicts describe embedders producing the same vectors."""
+    a = {k: v for k, v in a.items() if k not in _LOCATION_PARAMS}
+    b = {k: v for k, v in b.items() if k not in _LOCATION_PARAMS}
+    return a == b
+
+
+def describe(params):
+    """Short human-readable form of embedder params, e.g. "hashing(dim=256, ...)"."""
+    options = ", ".join(f"{k}={v}" for k, v in params.items() if k != "backend" and v is not None)
+    return f"{params.get('backend')}({options})"
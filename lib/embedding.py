@@ -3,50 +3,181 @@ Embedding utility for converting text to vectors.
 Uses OpenAI's text-embedding-3-small model via OpenRouter.
 """
 
-import requests
-import os
 import numpy as np
-from dotenv import load_dotenv
+from .embedding_cache import get_default_cache
+from .http_client import APIError, get_async_client, get_client
 
-# Load environment variables from .env
-load_dotenv()
+# Upper bound on the characters packed into one /embeddings request
+MAX_BATCH_CHARS = 100_000
 
-# Reuse your API key setup
-API_KEY = os.getenv("OPENROUTER_API_KEY", "")
-if not API_KEY:
-    print("Warning: OPENROUTER_API_KEY not set. Embeddings will fail.")
 
-BASE_URL = "https://openrouter.ai/api/v1"
-headers = {"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"}
+def _resolve_cache(cache):
+    """None selects the process-wide cache; False disables caching."""
+    if cache is False:
+        return None
+    return cache if cache is not None else get_default_cache()
 
 
-def get_embedding(text, model="openai/text-embedding-3-small"):
+def _parse_embeddings(result, count):
+    """Map an /embeddings response back to its inputs by ``index``."""
+    vectors = [None] * count
+    try:
+        for item in result["data"]:
+            vectors[item["index"]] = np.array(item["embedding"], dtype=np.float32)
+    except (KeyError, IndexError, TypeError) as e:
+        raise APIError(f"Malformed /embeddings response: {str(result)[:200]}") from e
+    if any(vec is None for vec in vectors):
+        raise APIError(f"/embeddings returned {len(result['data'])} of {count} vectors")
+    return vectors
+
+
+def get_embedding(text, model="openai/text-embedding-3-small", cache=None):
     """
     Convert text to an embedding vector.
 
     Args:
         text: String to embed
         model: Embedding model to use
+        cache: EmbeddingCache to consult (default: the shared on-disk cache,
+            False to bypass it)
 
     Returns:
         numpy array: Vector representation of the text (1536 dimensions)
+
+    Raises:
+        APIError: The request failed after retries or returned no embedding
     """
-    url = f"{BASE_URL}/embeddings"
+    cache = _resolve_cache(cache)
+    if cache is not None:
+        cached = cache.get(model, text)
+        if cached is not None:
+            return cached
 
     data = {"model": model, "input": text}
+    result = get_client().post_json("/embeddings", data)
+    embedding = _parse_embeddings(result, 1)[0]
+
+    if cache is not None:
+        cache.put(model, text, embedding)
+    return embedding
+
+
+async def aget_embedding(text, model="openai/text-embedding-3-small", cache=None):
+    """Async version of get_embedding, using the event loop's HTTP client."""
+    return (await aget_embeddings([text], model=model, cache=cache))[0]
+
+
+def _iter_batches(texts, batch_size, max_batch_chars):
+    """Yield batches of texts honouring both size limits."""
+    start = 0
+    while start < len(texts):
+        end, chars = start, 0
+        while end < len(texts) and end - start < batch_size:
+            # Always take at least one text, even if it alone exceeds the limit
+            if end > start and chars + len(texts[end]) > max_batch_chars:
+                break
+            chars += len(texts[end])
+            end += 1
+        yield texts[start:end]
+        start = end
+
+
+def get_embeddings(
+    texts,
+    model="openai/text-embedding-3-small",
+    batch_size=64,
+    max_batch_chars=MAX_BATCH_CHARS,
+    cache=None,
+):
+    """
+    Convert several texts to embedding vectors in as few requests as possible.
 
-    try:
-        response = requests.post(url, headers=headers, json=data, timeout=15)
-        response.raise_for_status()
-        result = response.json()
+    Texts are packed into batches of at most ``batch_size`` inputs and
+    ``max_batch_chars`` characters, and each response is mapped back to its
+    input by the ``index`` field the API returns. Texts already in the
+    embedding cache are not sent at all.
+
+    Args:
+        texts: List of strings to embed
+        model: Embedding model to use
+        batch_size: Maximum number of texts per request
+        max_batch_chars: Maximum total characters per request
+        cache: EmbeddingCache to consult (default: the shared on-disk cache,
+            False to bypass it)
+
+    Returns:
+        numpy array: (len(texts), 1536) matrix, one row per input text
+
+    Raises:
+        APIError: A batch failed after retries or came back incomplete
+    """
+    texts = list(texts)
+    if not texts:
+        return np.zeros((0, 1536), dtype=np.float32)
+
+    cache = _resolve_cache(cache)
+    rows, pending = _lookup(cache, model, texts)
+    client = get_client()
 
-        # Extract embedding from response
-        embedding = result["data"][0]["embedding"]
-        return np.array(embedding)
+    for batch in _iter_batches(list(pending), batch_size, max_batch_chars):
+        result = client.post_json("/embeddings", {"model": model, "input": batch})
+        _fill(cache, model, batch, _parse_embeddings(result, len(batch)), pending, rows)
 
-    except Exception as e:
-        print(f"Error getting embedding: {e}")
-        return np.zeros(1536)  # Fallback
+    return np.array(rows)
+
+
+async def aget_embeddings(
+    texts,
+    model="openai/text-embedding-3-small",
+    batch_size=64,
+    max_batch_chars=MAX_BATCH_CHARS,
+    cache=None,
+):
+    """
+    Async version of get_embeddings.
+
+    Batches are sent concurrently (bounded by the async client's pool).
+    """
+    import asyncio
+
+    texts = list(texts)
+    if not texts:
+        return np.zeros((0, 1536), dtype=np.float32)
+
+    cache = _resolve_cache(cache)
+    rows, pending = _lookup(cache, model, texts)
+    client = get_async_client()
+
+    async def embed(batch):
+        result = await client.post_json("/embeddings", {"model": model, "input": batch})
+        _fill(cache, model, batch, _parse_embeddings(result, len(batch)), pending, rows)
+
+    await asyncio.gather(
+        *(embed(batch) for batch in _iter_batches(list(pending), batch_size, max_batch_chars))
+    )
+    return np.array(rows)
+
+
+def _lookup(cache, model, texts):
+    """
+    Cached rows (None for misses) plus {uncached text: [row indices]}, so
+    each distinct uncached text is embedded once.
+    """
+    rows = cache.get_many(model, texts) if cache is not None else [None] * len(texts)
+    pending = {}
+    for i, row in enumerate(rows):
+        if row is None:
+            pending.setdefault(texts[i], []).append(i)
+    return rows, pending
+
+
+def _fill(cache, model, batch, vectors, pending, rows):
+    """Cache a finished batch right away and copy it into its rows."""
+    if cache is not None:
+        cache.put_many(model, batch, vectors)
+    for text, vec in zip(batch, vectors):
+        for i in pending[text]:
+            rows[i] = vec
 
 
 def cosine_similarity(vec1, vec2):
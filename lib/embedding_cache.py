@@ -0,0 +1,208 @@
+"""
+Persistent, content-addressed cache for embedding vectors.
+
+Vectors are keyed by a hash of (model, text) and stored in a small SQLite
+database, so index builds and query-time lookups share the same cache and
+several processes can use it at once.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from . import settings
+
+DEFAULT_CACHE_PATH = "embedding_cache.sqlite"
+DEFAULT_MAX_ENTRIES = 100_000
+
+
+def cache_key(model, text):
+    """Content address for an embedding: sha256 of the model and the text."""
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk LRU cache of embedding vectors.
+
+    The database runs in WAL mode and every write happens inside a
+    ``BEGIN IMMEDIATE`` transaction, so concurrent readers and writers in
+    different processes are safe. Each thread (and each forked process)
+    opens its own connection.
+
+    Args:
+        path: SQLite file to use (created on first use)
+        max_entries: Least recently used vectors are evicted beyond this
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = os.fspath(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY,"
+                " vector BLOB NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_access"
+                " ON embeddings (last_access)"
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._connection())
+
+    def get_many(self, model, texts):
+        """
+        Look up several texts at once.
+
+        Returns:
+            List with a float32 vector for each hit and None for each miss
+        """
+        keys = [cache_key(model, text) for text in texts]
+        found = {}
+        conn = self._connection()
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            part = keys[start : start + 500]
+            marks = ",".join("?" * len(part))
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", part
+            )
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+
+        if found:
+            now = time.time()
+            with self._transaction() as conn:
+                conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+
+        vectors = [found.get(key) for key in keys]
+        hits = sum(v is not None for v in vectors)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(vectors) - hits
+        return vectors
+
+    def get(self, model, text):
+        """Look up one text; returns its vector or None."""
+        return self.get_many(model, [text])[0]
+
+    def put_many(self, model, texts, vectors):
+        """Store vectors for several texts, evicting old entries if needed."""
+        now = time.time()
+        rows = [
+            (cache_key(model, text), np.asarray(vec, dtype=np.float32).tobytes(), now)
+            for text, vec in zip(texts, vectors)
+        ]
+        if not rows:
+            return
+
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_access)"
+                " VALUES (?, ?, ?)",
+                rows,
+            )
+            (count,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    " SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+    def put(self, model, text, vector):
+        """Store the vector for one text."""
+        self.put_many(model, [text], [vector])
+
+    def clear(self):
+        """Drop every cached vector."""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM embeddings")
+
+    def __len__(self):
+        (count,) = self._connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        return count
+
+    def stats(self):
+        """Hit/miss counters for this process plus the current entry count."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self),
+            "max_entries": self.max_entries,
+        }
+
+
+class _Transaction:
+    """``BEGIN IMMEDIATE`` ... ``COMMIT`` / ``ROLLBACK`` context manager."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """
+    The process-wide cache used by get_embedding / get_embeddings.
+
+    Configured with ``RAG_EMBEDDING_CACHE`` (a file path, or ``off`` to
+    disable caching) and ``RAG_EMBEDDING_CACHE_SIZE`` (max entries).
+
+    Returns:
+        EmbeddingCache, or None when caching is disabled
+    """
+    global _default_cache
+    if _default_cache is None:
+        settings.load_env()
+        path = os.getenv("RAG_EMBEDDING_CACHE", DEFAULT_CACHE_PATH)
+        if path.lower() in ("", "0", "off", "false", "none"):
+            return None
+        with _default_cache_lock:
+            if _default_cache is None:
+                size = int(os.getenv("RAG_EMBEDDING_CACHE_SIZE", DEFAULT_MAX_ENTRIES))
+                _default_cache = EmbeddingCache(path, max_entries=size)
+    return _default_cache
+
+
+def set_default_cache(cache):
+    """Replace the process-wide cache (pass None to reset to the env default)."""
+    global _default_cache
+    _default_cache = cache
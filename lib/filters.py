@@ -0,0 +1,221 @@
+"""
+Metadata filtering for SimpleVectorStore.
+
+AttributeIndex dictionary-encodes each metadata field: the distinct values
+are kept sorted and every row stores the position of its value (-1 when
+the field is missing). Equality and set membership become integer
+comparisons over one array, and because the dictionary is sorted a range
+predicate is a contiguous range of codes. The result is a boolean row mask
+that search applies before scoring.
+
+Filters are dicts in the usual document-store style::
+
+    {"source": "doc1.txt"}                              equality
+    {"source": {"$in": ["a.txt", "b.txt"]}}             set membership
+    {"date": {"$gte": "2024-01-01", "$lt": "2025-01-01"}}  range
+    {"$or": [{"tenant": "acme"}, {"public": True}]}     boolean combinations
+
+Supported operators: $eq, $ne, $in, $nin, $gt, $gte, $lt, $lte, $and, $or.
+Several fields in one dict must all match. Only str and numeric values are
+indexed; strings compare lexicographically (so ISO dates work in ranges).
+"""
+
+import numbers
+
+import numpy as np
+
+KINDS = ("num", "str")
+
+
+def value_kind(value):
+    """Column kind a metadata value is stored in, or None if not indexable."""
+    if isinstance(value, str):
+        return "str"
+    if isinstance(value, numbers.Real) and value == value:  # excludes NaN
+        return "num"
+    return None
+
+
+def _as_array(values, kind):
+    return np.asarray(values, dtype=np.float64 if kind == "num" else str)
+
+
+class _Column:
+    """Sorted distinct ``values`` plus one int32 code per row (-1 = missing)."""
+
+    def __init__(self, kind, values, codes):
+        self.kind = kind
+        self.values = values
+        self.codes = codes
+
+    def code_of(self, value):
+        """Code of ``value``, or -1 if no row has it."""
+        i = int(np.searchsorted(self.values, value))
+        if i < len(self.values) and self.values[i] == value:
+            return i
+        return -1
+
+
+class AttributeIndex:
+    """
+    Per-field dictionary-encoded indexes over a store's metadata.
+
+    Args:
+        fields: Fields to index (default: every field with str or numeric values)
+    """
+
+    def __init__(self, fields=None):
+        self.fields = list(fields) if fields is not None else None
+        self.count = 0
+        self.columns = {}  # (field, kind) -> _Column
+
+    def add(self, metadatas):
+        """Index the metadata of newly appended rows."""
+        metadatas = list(metadatas)
+        start, total = self.count, self.count + len(metadatas)
+
+        gathered = {}
+        for offset, metadata in enumerate(metadatas):
+            for field, value in (metadata or {}).items():
+                if self.fields is not None and field not in self.fields:
+                    continue
+                kind = value_kind(value)
+                if kind is not None:
+                    rows, values = gathered.setdefault((field, kind), ([], []))
+                    rows.append(start + offset)
+                    values.append(value)
+
+        for key, column in self.columns.items():
+            if key not in gathered:
+                column.codes = np.concatenate(
+                    [column.codes, np.full(total - start, -1, dtype=np.int32)]
+                )
+
+        for (field, kind), (rows, values) in gathered.items():
+            column = self.columns.get((field, kind))
+            if column is None:
+                column = _Column(kind, _as_array([], kind), np.full(start, -1, dtype=np.int32))
+                self.columns[(field, kind)] = column
+            codes = np.concatenate([column.codes, np.full(total - start, -1, dtype=np.int32)])
+
+            new_values = _as_array(values, kind)
+            merged = np.union1d(column.values, new_values)
+            if len(merged) != len(column.values):
+                # New distinct values shift the dictionary; re-code existing rows
+                present = codes >= 0
+                codes[present] = np.searchsorted(merged, column.values[codes[present]])
+            codes[rows] = np.searchsorted(merged, new_values)
+            column.values, column.codes = merged, codes
+
+        self.count = total
+
+    def keep(self, mask):
+        """Drop rows where ``mask`` is False (mirrors a store row removal)."""
+        mask = np.asarray(mask, dtype=bool)
+        for column in self.columns.values():
+            column.codes = column.codes[mask]
+        self.count = int(mask.sum())
+
+    def mask(self, where):
+        """
+        Evaluate a filter.
+
+        Returns:
+            Boolean array with one entry per row, True where ``where`` matches
+        """
+        if not isinstance(where, dict):
+            raise ValueError(f"where must be a dict, got {type(where).__name__}")
+        result = np.ones(self.count, dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    result &= self.mask(clause)
+            elif key == "$or":
+                matched = np.zeros(self.count, dtype=bool)
+                for clause in condition:
+                    matched |= self.mask(clause)
+                result &= matched
+            elif key.startswith("$"):
+                raise ValueError(f"Unknown filter operator {key!r}")
+            else:
+                result &= self._field_mask(key, condition)
+        return result
+
+    def _field_mask(self, field, condition):
+        if self.fields is not None and field not in self.fields:
+            raise ValueError(f"Metadata field {field!r} is not indexed")
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+
+        result = np.ones(self.count, dtype=bool)
+        for op, operand in condition.items():
+            if op == "$eq":
+                result &= self._isin(field, [operand])
+            elif op == "$in":
+                result &= self._isin(field, operand)
+            elif op == "$ne":
+                result &= self._present(field) & ~self._isin(field, [operand])
+            elif op == "$nin":
+                result &= self._present(field) & ~self._isin(field, operand)
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                result &= self._range(field, op, operand)
+            else:
+                raise ValueError(f"Unknown filter operator {op!r}")
+        return result
+
+    def _column(self, field, value):
+        kind = value_kind(value)
+        if kind is None:
+            raise ValueError(f"Cannot filter {field!r} on {value!r}; use str or number values")
+        return self.columns.get((field, kind))
+
+    def _present(self, field):
+        present = np.zeros(self.count, dtype=bool)
+        for kind in KINDS:
+            column = self.columns.get((field, kind))
+            if column is not None:
+                present |= column.codes >= 0
+        return present
+
+    def _isin(self, field, values):
+        matched = np.zeros(self.count, dtype=bool)
+        wanted = {}
+        for value in values:
+            column = self._column(field, value)
+            if column is not None and (code := column.code_of(value)) >= 0:
+                wanted.setdefault(id(column), (column, []))[1].append(code)
+        for column, codes in wanted.values():
+            matched |= np.isin(column.codes, codes)
+        return matched
+
+    def _range(self, field, op, bound):
+        column = self._column(field, bound)
+        if column is None:
+            return np.zeros(self.count, dtype=bool)
+        if op in ("$gt", "$lte"):
+            cut = int(np.searchsorted(column.values, bound, side="right"))
+        else:
+            cut = int(np.searchsorted(column.values, bound, side="left"))
+        if op in ("$gt", "$gte"):
+            return column.codes >= cut
+        return (column.codes >= 0) & (column.codes < cut)
+
+    def state(self):
+        """(params, arrays) for persisting the index."""
+        keys = sorted(self.columns)
+        params = {"type": "attributes", "fields": self.fields, "columns": [list(k) for k in keys]}
+        arrays = {}
+        for i, key in enumerate(keys):
+            arrays[f"c{i}_values"] = self.columns[key].values
+            arrays[f"c{i}_codes"] = self.columns[key].codes
+        return params, arrays
+
+    @classmethod
+    def from_state(cls, params, arrays, count):
+        index = cls(fields=params.get("fields"))
+        index.count = count
+        for i, (field, kind) in enumerate(params["columns"]):
+            index.columns[(field, kind)] = _Column(
+                kind, arrays[f"c{i}_values"], np.asarray(arrays[f"c{i}_codes"], dtype=np.int32)
+            )
+        return index
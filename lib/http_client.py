@@ -0,0 +1,502 @@
+"""
+Shared HTTP client for the OpenRouter (OpenAI-compatible) API.
+
+One keep-alive requests.Session with a bounded connection pool is reused
+for every embedding and LLM call. Requests are rate limited client-side,
+retried with exponential backoff and jitter on 429/5xx and connection
+errors, and failures are raised as APIError instead of being swallowed.
+
+AsyncHTTPClient applies the same policy on an httpx.AsyncClient so one
+event loop can keep hundreds of requests in flight.
+
+requests, httpx and asyncio are imported when first needed, not when
+this module is, so importing lib stays fast.
+"""
+
+import itertools
+import json
+import os
+import random
+import threading
+import time
+import weakref
+
+from . import settings, tracing
+
+DEFAULT_BASE_URL = "https://openrouter.ai/api/v1"
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class APIError(RuntimeError):
+    """A request to the API failed (after retries, where applicable)."""
+
+    def __init__(self, message, status=None, body=None):
+        super().__init__(message)
+        self.status = status
+        self.body = body
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket.
+
+    Args:
+        rate: Requests allowed per second on average
+        burst: Requests allowed back to back before throttling starts
+    """
+
+    def __init__(self, rate, burst=1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token; return how long the caller must wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Wait (without blocking the event loop) until a request may be sent."""
+        import asyncio
+
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class _SSEDecoder:
+    """Incremental server-sent events parser that only keeps ``data:`` fields."""
+
+    def __init__(self):
+        self._data = []
+
+    def feed(self, line):
+        """Consume one line; return the data of the event it completes, if any."""
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.rstrip("\r")
+        if not line:
+            payload = "\n".join(self._data) if self._data else None
+            self._data = []
+            return payload
+        if line.startswith("data:"):
+            self._data.append(line[6:] if line.startswith("data: ") else line[5:])
+        return None
+
+
+def iter_sse_data(lines):
+    """
+    Yield the ``data:`` payloads of a server-sent event stream.
+
+    Multi-line data fields are joined with newlines; comments (": ...")
+    and other fields are ignored. Stops at the OpenAI-style "[DONE]" marker.
+    """
+    decoder = _SSEDecoder()
+    for line in itertools.chain(lines, [""]):
+        payload = decoder.feed(line)
+        if payload == "[DONE]":
+            return
+        if payload is not None:
+            yield payload
+
+
+def _decode_event(path, payload):
+    try:
+        return json.loads(payload)
+    except ValueError as e:
+        raise APIError(f"POST {path} streamed invalid JSON: {payload[:200]}") from e
+
+
+def _httpx():
+    """The httpx module, or None (optional: AsyncHTTPClient falls back to worker threads)."""
+    try:
+        import httpx
+    except ImportError:
+        return None
+    return httpx
+
+
+def backoff_delay(attempt, base=0.5, cap=20.0):
+    """Exponential backoff with full jitter: uniform(0, min(cap, base * 2^attempt))."""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class HTTPClient:
+    """
+    Pooled, retrying JSON client.
+
+    Args:
+        base_url: API root, e.g. "https://openrouter.ai/api/v1"
+        api_key: Bearer token (default: OPENROUTER_API_KEY)
+        pool_size: Maximum keep-alive connections kept open
+        timeout: (connect, read) timeout in seconds, or a single number
+        max_retries: Retries after the first attempt for retryable failures
+        backoff_base: First backoff step in seconds (doubles per retry)
+        backoff_max: Upper bound on a single backoff sleep
+        rate_limit: Optional requests per second (RateLimiter)
+        burst: Burst size for the rate limiter
+    """
+
+    def __init__(
+        self,
+        base_url=DEFAULT_BASE_URL,
+        api_key=None,
+        pool_size=10,
+        timeout=(5, 30),
+        max_retries=4,
+        backoff_base=0.5,
+        backoff_max=20.0,
+        rate_limit=None,
+        burst=1,
+    ):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key if api_key is not None else settings.api_key()
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = RateLimiter(rate_limit, burst) if rate_limit else None
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(
+            {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        )
+
+    def retry_delay(self, attempt, response=None):
+        """Honour Retry-After when the server sends one, else back off."""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            try:
+                return min(self.backoff_max, max(0.0, float(retry_after)))
+            except (TypeError, ValueError):
+                pass
+        return backoff_delay(attempt, self.backoff_base, self.backoff_max)
+
+    def request(self, path, payload, timeout=None, stream=False):
+        """
+        POST ``payload`` as JSON to ``base_url + path``, retrying as configured.
+
+        Returns:
+            requests.Response with a 2xx status
+
+        Raises:
+            APIError: Non-retryable status, or retries exhausted
+        """
+        import requests
+
+        url = f"{self.base_url}{path}"
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+
+            try:
+                response = self.session.post(
+                    url, json=payload, timeout=timeout or self.timeout, stream=stream
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise APIError(f"POST {path} failed after {attempt + 1} attempts: {e}") from e
+                time.sleep(self.retry_delay(attempt))
+                continue
+
+            if response.ok:
+                tracing.count("http_bytes_sent", len(response.request.body or b""))
+                return response
+
+            body = response.text
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                raise APIError(
+                    f"POST {path} returned HTTP {response.status_code}: {body[:200]}",
+                    status=response.status_code,
+                    body=body,
+                )
+            time.sleep(self.retry_delay(attempt, response))
+
+    def post_json(self, path, payload, timeout=None):
+        """POST JSON and return the decoded JSON response."""
+        response = self.request(path, payload, timeout=timeout)
+        tracing.count("http_bytes_received", len(response.content))
+        try:
+            return response.json()
+        except ValueError as e:
+            raise APIError(f"POST {path} returned invalid JSON", response.status_code) from e
+
+    def stream_events(self, path, payload, timeout=None):
+        """
+        POST JSON and yield the decoded JSON events of an SSE response.
+
+        Connecting is retried like request(); once events are flowing a
+        dropped connection raises APIError.
+        """
+        import requests
+
+        response = self.request(path, payload, timeout=timeout, stream=True)
+        try:
+            for data in iter_sse_data(response.iter_lines()):
+                tracing.count("http_bytes_received", len(data))
+                yield _decode_event(path, data)
+        except requests.RequestException as e:
+            raise APIError(f"POST {path} stream interrupted: {e}") from e
+        finally:
+            response.close()
+
+    def close(self):
+        self.session.close()
+
+
+def _settings_from_env(default_pool_size):
+    key = settings.api_key()
+    if not key:
+        raise APIError("OPENROUTER_API_KEY not set (export it or add it to .env)")
+    rate_limit = os.getenv("RAG_RATE_LIMIT")
+    return {
+        "api_key": key,
+        "base_url": os.getenv("RAG_API_BASE_URL", DEFAULT_BASE_URL),
+        "pool_size": int(os.getenv("RAG_HTTP_POOL_SIZE", default_pool_size)),
+        "timeout": (5, float(os.getenv("RAG_HTTP_TIMEOUT", 30))),
+        "max_retries": int(os.getenv("RAG_HTTP_MAX_RETRIES", 4)),
+        "rate_limit": float(rate_limit) if rate_limit else None,
+    }
+
+
+def client_from_env():
+    """
+    Build an HTTPClient from environment variables.
+
+    OPENROUTER_API_KEY, RAG_API_BASE_URL, RAG_HTTP_POOL_SIZE,
+    RAG_HTTP_TIMEOUT (read timeout, seconds), RAG_HTTP_MAX_RETRIES and
+    RAG_RATE_LIMIT (requests per second); .env is loaded first.
+
+    Raises:
+        APIError: OPENROUTER_API_KEY is not set
+    """
+    return HTTPClient(**_settings_from_env(default_pool_size=10))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The process-wide HTTPClient, created from the environment on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = client_from_env()
+    return _client
+
+
+def set_client(client):
+    """Replace the process-wide client (None recreates it from the env)."""
+    global _client
+    _client = client
+
+
+class AsyncHTTPClient:
+    """
+    Asyncio counterpart of HTTPClient with the same retry/rate-limit policy.
+
+    Uses httpx.AsyncClient when httpx is installed; otherwise each request
+    runs the synchronous HTTPClient in a worker thread.
+
+    Args:
+        Same as HTTPClient; ``pool_size`` caps concurrent connections.
+    """
+
+    def __init__(
+        self,
+        base_url=DEFAULT_BASE_URL,
+        api_key=None,
+        pool_size=100,
+        timeout=(5, 30),
+        max_retries=4,
+        backoff_base=0.5,
+        backoff_max=20.0,
+        rate_limit=None,
+        burst=1,
+    ):
+        self._sync = HTTPClient(
+            base_url,
+            api_key,
+            pool_size,
+            timeout,
+            max_retries,
+            backoff_base,
+            backoff_max,
+            rate_limit,
+            burst,
+        )
+        self.base_url = self._sync.base_url
+        self.max_retries = max_retries
+        self.rate_limiter = self._sync.rate_limiter
+
+        self.client = None
+        httpx = _httpx()
+        if httpx is not None:
+            connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+            self.client = httpx.AsyncClient(
+                headers=dict(self._sync.session.headers),
+                timeout=httpx.Timeout(read, connect=connect),
+                limits=httpx.Limits(
+                    max_connections=pool_size, max_keepalive_connections=pool_size
+                ),
+            )
+
+    async def request(self, path, payload, timeout=None, stream=False):
+        """
+        POST ``payload`` as JSON to ``base_url + path``, retrying as configured.
+
+        Returns:
+            httpx.Response with a 2xx status (body not yet read if ``stream``;
+            the caller must close it)
+
+        Raises:
+            APIError: Non-retryable status, or retries exhausted
+        """
+        import asyncio
+
+        import httpx
+
+        url = f"{self.base_url}{path}"
+        kwargs = {"json": payload}
+        if timeout:
+            kwargs["timeout"] = timeout
+
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire_async()
+
+            try:
+                request = self.client.build_request("POST", url, **kwargs)
+                response = await self.client.send(request, stream=stream)
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise APIError(f"POST {path} failed after {attempt + 1} attempts: {e}") from e
+                await asyncio.sleep(self._sync.retry_delay(attempt))
+                continue
+
+            if response.is_success:
+                tracing.count("http_bytes_sent", len(request.content))
+                return response
+
+            if stream:
+                await response.aread()
+                await response.aclose()
+            body = response.text
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                raise APIError(
+                    f"POST {path} returned HTTP {response.status_code}: {body[:200]}",
+                    status=response.status_code,
+                    body=body,
+                )
+            await asyncio.sleep(self._sync.retry_delay(attempt, response))
+
+    async def post_json(self, path, payload, timeout=None):
+        """POST JSON and return the decoded JSON response."""
+        if self.client is None:
+            import asyncio
+
+            return await asyncio.to_thread(self._sync.post_json, path, payload, timeout)
+        response = await self.request(path, payload, timeout)
+        tracing.count("http_bytes_received", len(response.content))
+        try:
+            return response.json()
+        except ValueError as e:
+            raise APIError(f"POST {path} returned invalid JSON", response.status_code) from e
+
+    async def stream_events(self, path, payload, timeout=None):
+        """Async generator of the decoded JSON events of an SSE response."""
+        if self.client is None:
+            import asyncio
+
+            events = self._sync.stream_events(path, payload, timeout)
+            try:
+                while (event := await asyncio.to_thread(next, events, None)) is not None:
+                    yield event
+            finally:
+                events.close()
+            return
+
+        import httpx
+
+        response = await self.request(path, payload, timeout, stream=True)
+        try:
+            async for data in _aiter_sse_data(response.aiter_lines()):
+                tracing.count("http_bytes_received", len(data))
+                yield _decode_event(path, data)
+        except httpx.TransportError as e:
+            raise APIError(f"POST {path} stream interrupted: {e}") from e
+        finally:
+            await response.aclose()
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+        self._sync.close()
+
+
+async def _aiter_sse_data(lines):
+    """iter_sse_data() over an async iterator of lines."""
+    decoder = _SSEDecoder()
+    async for line in lines:
+        payload = decoder.feed(line)
+        if payload == "[DONE]":
+            return
+        if payload is not None:
+            yield payload
+    payload = decoder.feed("")
+    if payload not in (None, "[DONE]"):
+        yield payload
+
+
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """
+    The AsyncHTTPClient for the running event loop, created on first use.
+
+    httpx connection pools are bound to one event loop, so each loop gets
+    its own client. Configured from the same environment variables as
+    get_client(), with RAG_HTTP_POOL_SIZE defaulting to 100.
+    """
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = AsyncHTTPClient(**_settings_from_env(default_pool_size=100))
+        _async_clients[loop] = client
+    return client
+
+
+def set_async_client(client):
+    """Install ``client`` for the running event loop (None to reset)."""
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    if client is None:
+        _async_clients.pop(loop, None)
+    else:
+        _async_clients[loop] = client
@@ -0,0 +1,387 @@
+"""
+Versioned, memory-mappable on-disk format for SimpleVectorStore.
+
+An index is a directory holding one or two versions and a pointer to the
+live one:
+
+    CURRENT          name of the live version directory
+    v-<build_id>/    the files of one version (below)
+
+Each version directory holds:
+
+    manifest.json    format name/version, row count, dimension, dtype
+    embeddings.bin   raw row-major float32 (or float16) matrix
+    chunks.bin       UTF-8 chunk texts, back to back
+    chunks.idx       int64 byte offsets into chunks.bin (count + 1 entries)
+    metadata.bin     one compact JSON object per chunk, back to back
+    metadata.idx     int64 byte offsets into metadata.bin
+    ids.bin/.idx     optional stable chunk ids, stored like the chunk texts
+    <group>.<name>.npy   optional arrays of auxiliary structures (ANN, ...)
+
+Every file is opened with ``np.memmap``, so loading is near-instant and
+several processes reading the same index share the OS page cache.
+
+A write fills a new version directory and then atomically replaces
+CURRENT, so a reader always finds a complete index. Old versions are
+only removed while no reader is opening one (readers hold a shared lock
+for that), and the previous version is kept until the next write, for
+processes that still have its files mapped. Indexes written before versioning keep their files
+directly in the index directory and are still read.
+"""
+
+import contextlib
+import json
+import os
+import pickle
+import shutil
+import time
+import uuid
+from collections.abc import Sequence
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+FORMAT_NAME = "rag-index"
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+CURRENT = "CURRENT"
+VERSION_PREFIX = "v-"
+SUPPORTED_DTYPES = ("float32", "float16")
+# Times a read resolves CURRENT again after the version it named was removed
+READ_ATTEMPTS = 3
+SWAP_LOCK = ".lock"  # held by writers switching versions
+READERS_LOCK = ".readers"  # held shared by readers opening a version
+
+
+class StringTable(Sequence):
+    """Read-only sequence of strings decoded lazily from a memory map."""
+
+    def __init__(self, data, offsets):
+        self._data = data
+        self._offsets = offsets
+
+    def _decode(self, i):
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return bytes(self._data[start:end]).decode("utf-8")
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("table index out of range")
+        return self._decode(i)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+
+class JsonTable(StringTable):
+    """Read-only sequence of JSON records decoded lazily from a memory map."""
+
+    def _decode(self, i):
+        return json.loads(super()._decode(i))
+
+
+def _write_table(path, items):
+    """Write encoded items back to back plus their offsets file."""
+    offsets = np.zeros(len(items) + 1, dtype=np.int64)
+    with open(path + ".bin", "wb") as f:
+        for i, item in enumerate(items):
+            f.write(item)
+            offsets[i + 1] = offsets[i] + len(item)
+    offsets.tofile(path + ".idx")
+
+
+def _memmap(path, dtype, shape=None):
+    """np.memmap that also copes with empty files (mmap cannot map 0 bytes)."""
+    if os.path.getsize(path) == 0:
+        return np.zeros(shape if shape is not None else 0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+
+def _read_table(path, cls):
+    offsets = _memmap(path + ".idx", np.int64)
+    data = _memmap(path + ".bin", np.uint8)
+    return cls(data, offsets)
+
+
+def current_dir(path):
+    """Directory holding the live version of an index (``path`` itself if unversioned)."""
+    try:
+        with open(os.path.join(path, CURRENT), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except (FileNotFoundError, NotADirectoryError):
+        return os.fspath(path)
+    return os.path.join(path, name)
+
+
+@contextlib.contextmanager
+def pinned_version(path):
+    """
+    Resolve the live version of an index and keep writers from removing it
+    until the block exits. Files opened (mapped) inside the block stay
+    readable after that.
+    """
+    if not os.path.exists(os.path.join(path, READERS_LOCK)):
+        yield current_dir(path)  # unversioned index: readers rely on retries
+        return
+    with _flock(path, READERS_LOCK, shared=True):
+        yield current_dir(path)
+
+
+def _read_current(read, path):
+    """read(version directory), resolving CURRENT again if a writer removed that version."""
+    for attempt in range(READ_ATTEMPTS):
+        try:
+            with pinned_version(path) as version:
+                return read(version)
+        except FileNotFoundError:
+            if attempt == READ_ATTEMPTS - 1:
+                raise
+
+
+def is_index_dir(path):
+    """True if ``path`` holds an index in this format."""
+    return os.path.isfile(os.path.join(current_dir(path), MANIFEST))
+
+
+@contextlib.contextmanager
+def _flock(path, name, shared=False, wait=True):
+    """
+    Hold an flock on the lock file ``name`` of an index. Yields whether it
+    was taken, which is only False with ``wait=False`` while others hold it.
+    """
+    flags = os.O_RDONLY if shared else os.O_RDWR | os.O_CREAT
+    fd = os.open(os.path.join(path, name), flags, 0o644)
+    try:
+        taken = True
+        if fcntl is not None:
+            mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+            try:
+                fcntl.flock(fd, mode if wait else mode | fcntl.LOCK_NB)
+            except BlockingIOError:
+                taken = False
+        yield taken
+    finally:
+        os.close(fd)  # releases the flock
+
+
+def _switch_version(path, version):
+    """Point CURRENT at ``version`` and remove all but it and the one it replaces."""
+    pointer = os.path.join(path, f".{CURRENT}.{version}")
+    with _flock(path, SWAP_LOCK):  # one switch at a time
+        previous = None
+        if os.path.exists(os.path.join(path, CURRENT)):
+            previous = os.path.basename(current_dir(path))
+        with open(pointer, "w", encoding="utf-8") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer, os.path.join(path, CURRENT))
+
+        with _flock(path, READERS_LOCK, wait=False) as idle:
+            if idle:  # else readers are opening a version; a later write prunes
+                _prune(path, keep=(version, previous))
+
+
+def _prune(path, keep):
+    for name in os.listdir(path):
+        entry = os.path.join(path, name)
+        if name in keep or name.startswith("."):
+            continue  # live, kept, or another writer's work in progress
+        if os.path.isdir(entry):
+            if name.startswith(VERSION_PREFIX):
+                shutil.rmtree(entry, ignore_errors=True)
+        elif keep[1] is not None and name != CURRENT:
+            os.remove(entry)  # files of an unversioned index, now superseded
+
+
+def write_index(
+    path, chunks, embeddings, metadata, dtype="float32", extra=None, arrays=None, ids=None
+):
+    """
+    Write an index directory.
+
+    The new version is written inside ``path`` and made live by atomically
+    replacing CURRENT, so readers never see a half-written or missing
+    index. Processes that still have the old files mapped keep reading
+    them until they reload.
+
+    Args:
+        path: Index directory to create or replace
+        chunks: Sequence of chunk texts
+        embeddings: (N, dim) matrix
+        metadata: Sequence of JSON-serialisable dicts
+        dtype: On-disk dtype, "float32" or "float16"
+        extra: Optional dict of additional manifest fields
+        arrays: Optional {group: {name: ndarray}} of auxiliary arrays, saved
+            as .npy files and listed in the manifest under "arrays"
+        ids: Optional sequence of stable chunk ids (strings), one per chunk
+
+    Returns:
+        dict: The manifest that was written
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"dtype must be one of {SUPPORTED_DTYPES}, got {dtype!r}")
+    embeddings = np.asarray(embeddings)
+    if len(embeddings) != len(chunks) or len(metadata) != len(chunks):
+        raise ValueError("chunks, embeddings and metadata must have the same length")
+    if ids is not None and len(ids) != len(chunks):
+        raise ValueError("ids must have one entry per chunk")
+
+    path = os.fspath(path).rstrip("/\\")
+    build_id = uuid.uuid4().hex
+    version = VERSION_PREFIX + build_id
+    tmp = os.path.join(path, f".tmp-{build_id}")
+    os.makedirs(tmp)
+    try:
+        np.ascontiguousarray(embeddings, dtype=dtype).tofile(os.path.join(tmp, "embeddings.bin"))
+        _write_table(os.path.join(tmp, "chunks"), [c.encode("utf-8") for c in chunks])
+        _write_table(
+            os.path.join(tmp, "metadata"),
+            [json.dumps(m, separators=(",", ":")).encode("utf-8") for m in metadata],
+        )
+        if ids is not None:
+            _write_table(os.path.join(tmp, "ids"), [str(i).encode("utf-8") for i in ids])
+
+        manifest = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "build_id": build_id,
+            "created": time.time(),
+            "count": len(chunks),
+            "dim": int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+            "dtype": dtype,
+            "arrays": {},
+            "ids": ids is not None,
+        }
+        for group, named in (arrays or {}).items():
+            manifest["arrays"][group] = sorted(named)
+            for name, array in named.items():
+                np.save(os.path.join(tmp, f"{group}.{name}.npy"), np.ascontiguousarray(array))
+        manifest.update(extra or {})
+        with open(os.path.join(tmp, MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        os.rename(tmp, os.path.join(path, version))
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    _switch_version(path, version)
+
+    return manifest
+
+
+def read_manifest(path):
+    """Read and validate an index manifest."""
+    return _read_current(_read_manifest, path)
+
+
+def _read_manifest(path):
+    with open(os.path.join(path, MANIFEST), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT_NAME:
+        raise ValueError(f"{path} is not a {FORMAT_NAME} directory")
+    if manifest.get("version", 0) > FORMAT_VERSION:
+        raise ValueError(
+            f"{path} uses index format v{manifest['version']}; "
+            f"this version reads up to v{FORMAT_VERSION}"
+        )
+    return manifest
+
+
+def read_index(path):
+    """
+    Open an index directory without copying it into memory.
+
+    ``path`` may be the index directory or, to read ids and arrays of the
+    same version afterwards, the version directory from current_dir().
+
+    Returns:
+        tuple: (manifest, embeddings, chunks, metadata) where embeddings is a
+        read-only (N, dim) memmap and chunks/metadata are lazy sequences
+    """
+    return _read_current(_read_index, path)
+
+
+def _read_index(path):
+    manifest = _read_manifest(path)
+    count, dim = manifest["count"], manifest["dim"]
+    embeddings = _memmap(
+        os.path.join(path, "embeddings.bin"), manifest["dtype"], shape=(count, dim)
+    )
+    chunks = _read_table(os.path.join(path, "chunks"), StringTable)
+    metadata = _read_table(os.path.join(path, "metadata"), JsonTable)
+    return manifest, embeddings, chunks, metadata
+
+
+def read_ids(path, manifest):
+    """The stable chunk ids of an index as a lazy sequence (None if it has none)."""
+    if not manifest.get("ids"):
+        return None
+    return _read_table(os.path.join(path, "ids"), StringTable)
+
+
+def read_arrays(path, manifest):
+    """
+    Memory-map the auxiliary arrays listed in a manifest.
+
+    Returns:
+        dict: {group: {name: read-only ndarray}}
+    """
+    return {
+        group: {
+            name: np.load(os.path.join(path, f"{group}.{name}.npy"), mmap_mode="r")
+            for name in names
+        }
+        for group, names in manifest.get("arrays", {}).items()
+    }
+
+
+def read_legacy_pickle(filepath):
+    """
+    Read a pre-v1 ``rag_store.pkl`` file.
+
+    Returns:
+        tuple: (chunks, embeddings, metadata) with embeddings as a float32 matrix
+    """
+    with open(filepath, "rb") as f:
+        data = pickle.load(f)
+    embeddings = np.asarray(data["embeddings"], dtype=np.float32)
+    if embeddings.size == 0:
+        embeddings = embeddings.reshape(0, 0)
+    return list(data["chunks"]), embeddings, list(data["metadata"])
+
+
+def migrate_pickle(pickle_path, index_path, dtype="float32"):
+    """Convert a legacy ``rag_store.pkl`` into an index directory."""
+    chunks, embeddings, metadata = read_legacy_pickle(pickle_path)
+    if embeddings.size:
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        embeddings = embeddings / norms
+    return write_index(
+        index_path,
+        chunks,
+        embeddings,
+        metadata,
+        dtype=dtype,
+        extra={"migrated_from": os.path.basename(pickle_path)},
+    )
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) not in (3, 4):
+        print("Usage: python -m lib.index_format <rag_store.pkl> <index_dir> [float32|float16]")
+        sys.exit(2)
+
+    manifest = migrate_pickle(*sys.argv[1:])
+    print(f"Migrated {manifest['count']} chunks to {sys.argv[2]}")
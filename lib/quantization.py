@@ -0,0 +1,161 @@
+"""
+Compact vector codes for SimpleVectorStore.
+
+ScalarQuantizer stores each dimension as int8 (4x smaller than float32);
+ProductQuantizer splits vectors into sub-vectors and stores one uint8
+codebook index per sub-vector (up to 32x smaller). Both score queries
+directly on the codes, so the float matrix is only needed to re-rank a
+handful of candidates exactly.
+"""
+
+import numpy as np
+
+from .ann import assign_clusters, kmeans
+
+# Codes decoded/scored per block, bounding temporary memory
+_SCORE_BLOCK = 16384
+
+
+class ScalarQuantizer:
+    """
+    Symmetric per-dimension int8 quantization.
+
+    Each dimension d is stored as round(x_d / scale_d) with
+    scale_d = max|x_d| / 127 over the training vectors.
+    """
+
+    method = "int8"
+
+    def __init__(self):
+        self.scale = None
+
+    def train(self, vectors, seed=0):
+        peak = np.abs(np.asarray(vectors, dtype=np.float32)).max(axis=0)
+        self.scale = np.where(peak > 0, peak / 127.0, 1.0).astype(np.float32)
+
+    def encode(self, vectors):
+        codes = np.rint(np.asarray(vectors, dtype=np.float32) / self.scale)
+        return np.clip(codes, -127, 127).astype(np.int8)
+
+    def decode(self, codes):
+        return codes.astype(np.float32) * self.scale
+
+    def score(self, codes, queries):
+        """(q, n) approximate inner products between queries and coded rows."""
+        scaled = (queries * self.scale).T
+        scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), _SCORE_BLOCK):
+            block = codes[start : start + _SCORE_BLOCK].astype(np.float32)
+            scores[:, start : start + len(block)] = (block @ scaled).T
+        return scores
+
+    def state(self):
+        return {"method": self.method}, {"scale": self.scale}
+
+    @classmethod
+    def from_state(cls, params, arrays):
+        quantizer = cls()
+        quantizer.scale = np.asarray(arrays["scale"], dtype=np.float32)
+        return quantizer
+
+
+def default_subspaces(dim, dims_per_subspace=8):
+    """Largest divisor of ``dim`` no bigger than dim / dims_per_subspace."""
+    m = max(1, dim // dims_per_subspace)
+    while dim % m:
+        m -= 1
+    return m
+
+
+class ProductQuantizer:
+    """
+    Product quantization with 256-entry codebooks.
+
+    Vectors are split into ``m`` equal sub-vectors and each is replaced by
+    the index of its nearest codebook centroid, so a row costs ``m`` bytes.
+    Queries are scored with per-subspace lookup tables (asymmetric distance
+    computation): score = sum over subspaces of table[s, code[s]].
+
+    Args:
+        m: Number of sub-vectors (must divide the dimension; default dim / 8)
+        ks: Centroids per codebook (at most 256)
+        iterations: k-means iterations per codebook
+        max_train_points: Training sample size
+    """
+
+    method = "pq"
+
+    def __init__(self, m=None, ks=256, iterations=20, max_train_points=20000):
+        if not 1 < ks <= 256:
+            raise ValueError("ks must be between 2 and 256")
+        self.m = m
+        self.ks = ks
+        self.iterations = iterations
+        self.max_train_points = max_train_points
+        self.codebooks = None  # (m, ks, dsub)
+
+    def train(self, vectors, seed=0):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        n, dim = vectors.shape
+        self.m = self.m or default_subspaces(dim)
+        if dim % self.m:
+            raise ValueError(f"m={self.m} does not divide dimension {dim}")
+        self.ks = min(self.ks, n)
+
+        rng = np.random.default_rng(seed)
+        sample = vectors[np.sort(rng.choice(n, size=min(n, self.max_train_points), replace=False))]
+        subs = sample.reshape(len(sample), self.m, -1)
+        self.codebooks = np.stack(
+            [
+                kmeans(subs[:, s], self.ks, self.iterations, seed + s, spherical=False)
+                for s in range(self.m)
+            ]
+        )
+
+    def encode(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        subs = vectors.reshape(len(vectors), self.m, -1)
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for s in range(self.m):
+            codes[:, s] = assign_clusters(subs[:, s], self.codebooks[s], spherical=False)
+        return codes
+
+    def decode(self, codes):
+        return self.codebooks[np.arange(self.m), codes].reshape(len(codes), -1)
+
+    def score(self, codes, queries):
+        """(q, n) approximate inner products between queries and coded rows."""
+        # tables[q, s, c] = <query sub-vector s, centroid c of codebook s>
+        tables = np.einsum("qsd,scd->qsc", queries.reshape(len(queries), self.m, -1), self.codebooks)
+        subspace = np.arange(self.m)
+        scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), _SCORE_BLOCK):
+            block = np.asarray(codes[start : start + _SCORE_BLOCK])
+            for qi, table in enumerate(tables):
+                scores[qi, start : start + len(block)] = table[subspace, block].sum(axis=1)
+        return scores
+
+    def state(self):
+        params = {"method": self.method, "m": self.m, "ks": self.ks}
+        return params, {"codebooks": self.codebooks}
+
+    @classmethod
+    def from_state(cls, params, arrays):
+        quantizer = cls(m=params["m"], ks=params["ks"])
+        quantizer.codebooks = np.asarray(arrays["codebooks"], dtype=np.float32)
+        return quantizer
+
+
+QUANTIZERS = {"int8": ScalarQuantizer, "pq": ProductQuantizer}
+
+
+def make_quantizer(method, **options):
+    """Create an untrained quantizer by name ("int8" or "pq")."""
+    if method not in QUANTIZERS:
+        raise ValueError(f"Unknown quantization {method!r}; choose from {sorted(QUANTIZERS)}")
+    return QUANTIZERS[method](**options)
+
+
+def quantizer_from_state(params, arrays):
+    """Rebuild a trained quantizer saved with ``state()``."""
+    return QUANTIZERS[params["method"]].from_state(params, arrays)
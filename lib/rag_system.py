@@ -4,37 +4,23 @@ Complete RAG System: Retrieval + Augmentation + Generation
 
 import os
 import sys
+import threading
+import time
 from .vector_store import SimpleVectorStore
+from .index_format import is_index_dir, migrate_pickle
+from .answer_cache import answer_cache_from_env
+from .context import context_builder_from_env, count_tokens
+from .sharding import shards_from_env
+from . import settings, tracing
 
 # ============================================================================
 # YOUR EXISTING API CLIENT CODE (REUSED AS-IS)
 # ============================================================================
 
-import requests
+from .http_client import get_async_client, get_client
 
-try:
-    from dotenv import load_dotenv
-
-    load_dotenv()
-except:
-    env_path = os.path.join(os.path.dirname(__file__), ".env")
-    if os.path.exists(env_path):
-        with open(env_path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith("#"):
-                    continue
-                if "=" in line:
-                    k, v = line.split("=", 1)
-                    os.environ.setdefault(k.strip(), v.strip().strip('"').strip("'"))
-
-API_KEY = os.getenv("OPENROUTER_API_KEY", "")
-if not API_KEY:
-    print("Error: OPENROUTER_API_KEY not set")
-    sys.exit(1)
-
-BASE_URL = "https://openrouter.ai/api/v1"
-headers = {"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"}
+DEFAULT_STORE_PATH = "rag_index"
+LEGACY_STORE_PATH = "rag_store.pkl"
 
 
 def _extract_reply(result):
@@ -55,18 +41,132 @@ def _extract_reply(result):
     return ""
 
 
+def _extract_delta(event):
+    """Text carried by one streamed chat-completion chunk ("" if none)."""
+    try:
+        first = event.get("choices", [])[0]
+        delta = first.get("delta") or {}
+        return delta.get("content") or first.get("text") or ""
+    except (AttributeError, IndexError, TypeError):
+        return ""
+
+
+def _record_tokens(span, name, text):
+    """Count ``text``'s tokens on ``span`` and the ``name`` counter (only when tracing)."""
+    if tracing.get_tracer().enabled:
+        tokens = count_tokens(text)
+        span.set(**{name: tokens})
+        tracing.count(name, tokens)
+
+
+def _prompt_text(messages):
+    return "\n".join(m.get("content", "") for m in messages)
+
+
+def _context_keys(results):
+    """
+    Answer-cache keys of retrieved chunks.
+
+    Row numbers shift when rows are removed and upsert() keeps a chunk's
+    id for new text, so a chunk is identified by its id and text.
+    """
+    return [(r["chunk_id"], r["text"]) for r in results]
+
+
 def call_llm(messages, model="gpt-3.5-turbo"):
-    """Call LLM with messages. YOUR EXISTING CODE, UNCHANGED."""
-    url = f"{BASE_URL}/chat/completions"
+    """Call LLM with messages over the shared pooled, retrying client."""
     data = {"model": model, "messages": messages}
 
-    try:
-        response = requests.post(url, headers=headers, json=data, timeout=30)
-        response.raise_for_status()
-        result = response.json()
-        return _extract_reply(result) or str(result)
-    except Exception as e:
-        return f"Error: {e}"
+    with tracing.span("llm", model=model) as span:
+        _record_tokens(span, "prompt_tokens", _prompt_text(messages))
+        try:
+            result = get_client().post_json("/chat/completions", data)
+            answer = _extract_reply(result) or str(result)
+        except Exception as e:
+            span.set(error=type(e).__name__)
+            return f"Error: {e}"
+        _record_tokens(span, "completion_tokens", answer)
+        return answer
+
+
+async def acall_llm(messages, model="gpt-3.5-turbo"):
+    """Async version of call_llm, using the event loop's HTTP client."""
+    data = {"model": model, "messages": messages}
+
+    with tracing.span("llm", model=model) as span:
+        _record_tokens(span, "prompt_tokens", _prompt_text(messages))
+        try:
+            result = await get_async_client().post_json("/chat/completions", data)
+            answer = _extract_reply(result) or str(result)
+        except Exception as e:
+            span.set(error=type(e).__name__)
+            return f"Error: {e}"
+        _record_tokens(span, "completion_tokens", answer)
+        return answer
+
+
+def call_llm_stream(messages, model="gpt-3.5-turbo"):
+    """
+    Stream an LLM reply as it is generated (server-sent events).
+
+    Yields:
+        str: Pieces of the answer; a failure yields one final "Error: ..." piece
+    """
+    data = {"model": model, "messages": messages, "stream": True}
+
+    with tracing.span("llm", model=model, stream=True) as span:
+        _record_tokens(span, "prompt_tokens", _prompt_text(messages))
+        start, parts = time.perf_counter(), []
+        try:
+            for event in get_client().stream_events("/chat/completions", data):
+                piece = _extract_delta(event)
+                if piece:
+                    if not parts:
+                        span.set(first_token_ms=round(1000 * (time.perf_counter() - start), 3))
+                    parts.append(piece)
+                    yield piece
+        except Exception as e:
+            span.set(error=type(e).__name__)
+            yield f"Error: {e}"
+            return
+        _record_tokens(span, "completion_tokens", "".join(parts))
+
+
+async def acall_llm_stream(messages, model="gpt-3.5-turbo"):
+    """Async version of call_llm_stream."""
+    data = {"model": model, "messages": messages, "stream": True}
+
+    with tracing.span("llm", model=model, stream=True) as span:
+        _record_tokens(span, "prompt_tokens", _prompt_text(messages))
+        start, parts = time.perf_counter(), []
+        try:
+            async for event in get_async_client().stream_events("/chat/completions", data):
+                piece = _extract_delta(event)
+                if piece:
+                    if not parts:
+                        span.set(first_token_ms=round(1000 * (time.perf_counter() - start), 3))
+                    parts.append(piece)
+                    yield piece
+        except Exception as e:
+            span.set(error=type(e).__name__)
+            yield f"Error: {e}"
+            return
+        _record_tokens(span, "completion_tokens", "".join(parts))
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+def print_stream(pieces):
+    """Print streamed pieces as they arrive and return the full text."""
+    parts = []
+    for piece in pieces:
+        print(piece, end="", flush=True)
+        parts.append(piece)
+    print("\n")
+    return "".join(parts)
 
 
 # ============================================================================
@@ -77,42 +177,336 @@ def call_llm(messages, model="gpt-3.5-turbo"):
 class RAGSystem:
     """Simple Retrieval-Augmented Generation system."""
 
-    def __init__(self, vector_store_path="rag_store.pkl"):
-        """Load the vector store."""
-        print("Loading vector store...")
-        self.store = SimpleVectorStore()
-        self.store.load(vector_store_path)
-        print(f"Ready with {len(self.store)} chunks\n")
+    def __init__(
+        self,
+        vector_store_path=DEFAULT_STORE_PATH,
+        answer_cache=None,
+        search_mode=None,
+        context=None,
+        preload=False,
+        embedder=None,
+        shards=None,
+    ):
+        """
+        Set up the system; the vector store is opened on first use.
 
-    def query(self, question, top_k=3, use_rag=True):
+        Args:
+            vector_store_path: Index directory to load
+            answer_cache: AnswerCache reusing answers to near-duplicate
+                questions (None = configured from the environment, False = off)
+            search_mode: "dense", "lexical" or "hybrid" retrieval (default:
+                RAG_SEARCH_MODE, else "dense"); the answer cache is keyed by
+                query embeddings, so it is not used with "lexical"
+            context: ContextBuilder choosing which retrieved chunks fit the
+                prompt's token budget (None = configured from the environment)
+            preload: Start loading the store in a background thread now, so
+                it is ready (or nearly) by the first question
+            embedder: Embedder (or backend name) for questions; by default
+                the one the index was built with (see lib.embedders)
+            shards: Score dense retrieval in this many worker processes, or
+                "auto" for one per core (None = RAG_SHARDS, False = off; see
+                SimpleVectorStore.shard)
+        """
+        settings.load_env()
+        self.vector_store_path = vector_store_path
+        self.embedder = embedder
+        self.shards = shards_from_env() if shards is None else shards or None
+        self._store = None
+        self._store_lock = threading.Lock()
+        if preload:
+            threading.Thread(target=self._preload, name="rag-store-loader", daemon=True).start()
+
+        if answer_cache is None:
+            answer_cache = answer_cache_from_env()
+        elif answer_cache is False:
+            answer_cache = None
+        self.answer_cache = answer_cache
+        self.search_mode = search_mode or os.getenv("RAG_SEARCH_MODE", "dense")
+        self.context = context if context is not None else context_builder_from_env()
+        # Optional lib.batching.QueryBatcher; query() then retrieves through it,
+        # so concurrent questions share embedding calls and scoring
+        self.batcher = None
+
+    @property
+    def store(self):
+        """The SimpleVectorStore, loaded on first access (waits for a preload)."""
+        if self._store is None:
+            self.load()
+        return self._store
+
+    def load(self):
+        """
+        Open the vector store now (migrating a legacy pickle first).
+
+        Thread-safe and idempotent; only the first call reads the index.
+
+        Returns:
+            SimpleVectorStore
+        """
+        with self._store_lock:
+            if self._store is not None:
+                return self._store
+            path = self.vector_store_path
+            if (
+                path == DEFAULT_STORE_PATH
+                and not is_index_dir(path)
+                and os.path.isfile(LEGACY_STORE_PATH)
+            ):
+                print(f"Migrating {LEGACY_STORE_PATH} to {path}/...")
+                migrate_pickle(LEGACY_STORE_PATH, path)
+
+            with tracing.span("load"):
+                store = SimpleVectorStore(embedder=self.embedder)
+                store.load(path)
+                if self.shards and len(store):
+                    store.shard(None if self.shards in ("auto", True) else self.shards)
+            self._store = store
+            return store
+
+    def _preload(self):
+        try:
+            self.load()
+        except Exception as e:
+            # Surfaced again, with its traceback, when the store is first used
+            tracing.log(f"Background store load failed: {e}")
+
+    @property
+    def _caching(self):
+        return self.answer_cache is not None and self.search_mode != "lexical"
+
+    def query(self, question, top_k=3, use_rag=True, stream=False, where=None):
         """
         Answer a question with or without RAG.
 
+        Each stage is traced (see lib.tracing); with ``stream`` the "query"
+        span ends when the generator is returned, before generation.
+
         Args:
             question: User's question
             top_k: Number of chunks to retrieve
             use_rag: If False, skip retrieval (for comparison)
+            stream: Return a generator of answer pieces as they are generated
+            where: Metadata filter restricting retrieval, e.g.
+                {"source": "doc1.txt"} (see lib.filters)
 
         Returns:
-            str: The answer
+            str: The answer (a generator of str pieces if ``stream``)
         """
+        with tracing.span("query", mode=self.search_mode if use_rag else "none", top_k=top_k):
+            return self._query(question, top_k, use_rag, stream, where)
+
+    def _query(self, question, top_k, use_rag, stream, where):
+        generate = call_llm_stream if stream else call_llm
+
         if not use_rag:
             # Direct LLM call (baseline)
-            print("🤖 Querying LLM directly (no RAG)...\n")
+            tracing.log("🤖 Querying LLM directly (no RAG)...\n")
             messages = [{"role": "user", "content": question}]
-            return call_llm(messages)
+            return generate(messages)
 
         # STEP 1: RETRIEVAL
-        print("🔍 RETRIEVAL: Finding relevant chunks...")
-        results = self.store.search(question, top_k=top_k)
+        tracing.log("🔍 RETRIEVAL: Finding relevant chunks...")
+        fetch_k = self.context.fetch_k(top_k)
+        with tracing.span("retrieve", k=fetch_k):
+            results, query_vector = self._retrieve(question, fetch_k, where)
+        results = self._select_context(results, top_k, query_vector)
+        if self._caching:
+            cached = self._cached_answer(query_vector, results)
+            if cached is not None:
+                return iter([cached]) if stream else cached
 
         if not results:
-            print("No relevant chunks found\n")
+            tracing.log("No relevant chunks found\n")
             messages = [{"role": "user", "content": question}]
-            return call_llm(messages)
+            return generate(messages)
 
         # STEP 2: AUGMENTATION
-        print("\n📝 AUGMENTATION: Building enriched prompt...")
+        tracing.log("\n📝 AUGMENTATION: Building enriched prompt...")
+        augmented_prompt = self._build_prompt(question, results)
+
+        # STEP 3: GENERATION
+        tracing.log("💬 GENERATION: Calling LLM with context...\n")
+        messages = [{"role": "user", "content": augmented_prompt}]
+        if not self._caching:
+            return generate(messages)
+
+        start = time.perf_counter()
+        if stream:
+            return self._stream_and_cache(generate(messages), query_vector, results, start)
+        answer = generate(messages)
+        self._cache_answer(query_vector, results, answer, time.perf_counter() - start)
+        return answer
+
+    def _retrieve(self, question, fetch_k, where):
+        """(results, query embedding or None), through the batcher if one is attached."""
+        if self.batcher is not None:
+            return self.batcher.search(question, top_k=fetch_k, mode=self.search_mode, where=where)
+        if not self._caching:
+            results = self.store.search(
+                question, top_k=fetch_k, mode=self.search_mode, where=where
+            )
+            return results, None
+        query_vector = self.store.embed_query(question)
+        results = self.store.search(
+            question,
+            top_k=fetch_k,
+            mode=self.search_mode,
+            query_vector=query_vector,
+            where=where,
+        )
+        return results, query_vector
+
+    async def aquery(self, question, top_k=3, use_rag=True, stream=False, where=None):
+        """
+        Async version of query().
+
+        Embedding and generation are awaited on the event loop's HTTP
+        client, so many questions can be in flight in one thread. With
+        ``stream`` the awaited result is an async iterator of answer pieces:
+
+            async for piece in await rag.aquery(question, stream=True): ...
+        """
+        with tracing.span("query", mode=self.search_mode if use_rag else "none", top_k=top_k):
+            return await self._aquery(question, top_k, use_rag, stream, where)
+
+    async def _aquery(self, question, top_k, use_rag, stream, where):
+        results, query_vector = [], None
+        fetch_k = self.context.fetch_k(top_k)
+        if use_rag:
+            with tracing.span("retrieve", k=fetch_k):
+                if not self._caching:
+                    results = await self.store.asearch(
+                        question, top_k=fetch_k, mode=self.search_mode, where=where
+                    )
+                else:
+                    query_vector = await self.store.aembed_query(question)
+                    results = await self.store.asearch(
+                        question,
+                        top_k=fetch_k,
+                        mode=self.search_mode,
+                        query_vector=query_vector,
+                        where=where,
+                    )
+        results = self._select_context(results, top_k, query_vector)
+        if results and self._caching:
+            cached = self._cached_answer(query_vector, results)
+            if cached is not None:
+                return _aiter([cached]) if stream else cached
+
+        content = self._build_prompt(question, results) if results else question
+        messages = [{"role": "user", "content": content}]
+        if not results or not self._caching:
+            return acall_llm_stream(messages) if stream else await acall_llm(messages)
+
+        start = time.perf_counter()
+        if stream:
+            return self._astream_and_cache(
+                acall_llm_stream(messages), query_vector, results, start
+            )
+        answer = await acall_llm(messages)
+        self._cache_answer(query_vector, results, answer, time.perf_counter() - start)
+        return answer
+
+    def _cached_answer(self, query_vector, results):
+        """Answer previously generated from the same chunks for a similar question."""
+        if not results:
+            return None
+        answer = self.answer_cache.lookup(
+            query_vector,
+            _context_keys(results),
+            build_id=self.store.manifest.get("build_id"),
+        )
+        if answer is not None:
+            tracing.count("answer_cache_hits")
+            tracing.log("⚡ CACHE: Reusing the answer to a similar question\n")
+        return answer
+
+    def _cache_answer(self, query_vector, results, answer, latency):
+        if answer and not answer.startswith("Error:"):
+            self.answer_cache.store(
+                query_vector,
+                _context_keys(results),
+                answer,
+                latency=latency,
+                build_id=self.store.manifest.get("build_id"),
+            )
+
+    def _stream_and_cache(self, pieces, query_vector, results, start):
+        """Pass streamed pieces through, caching the full answer at the end."""
+        parts = []
+        for piece in pieces:
+            parts.append(piece)
+            yield piece
+        if parts and not parts[-1].startswith("Error:"):
+            self._cache_answer(query_vector, results, "".join(parts), time.perf_counter() - start)
+
+    async def _astream_and_cache(self, pieces, query_vector, results, start):
+        parts = []
+        async for piece in pieces:
+            parts.append(piece)
+            yield piece
+        if parts and not parts[-1].startswith("Error:"):
+            self._cache_answer(query_vector, results, "".join(parts), time.perf_counter() - start)
+
+    def query_batch(self, questions, top_k=3, where=None):
+        """
+        Answer many questions with RAG, retrieving for all of them at once.
+
+        Retrieval is batched (one embedding request and one matrix product
+        for every question); generation still makes one LLM call each.
+
+        Args:
+            questions: List of user questions
+            top_k: Number of chunks to retrieve per question
+            where: Metadata filter applied to every question's retrieval
+
+        Returns:
+            List of answers, in the same order as ``questions``
+        """
+        questions = list(questions)
+        tracing.log(f"🔍 RETRIEVAL: Finding relevant chunks for {len(questions)} questions...")
+        fetch_k = self.context.fetch_k(top_k)
+        with tracing.span("retrieve", k=fetch_k, queries=len(questions)):
+            batch_results = self.store.search_batch(
+                questions, top_k=fetch_k, mode=self.search_mode, where=where
+            )
+
+        answers = []
+        for question, results in zip(questions, batch_results):
+            results = self._select_context(results, top_k)
+            if results:
+                content = self._build_prompt(question, results)
+            else:
+                content = question
+            answers.append(call_llm([{"role": "user", "content": content}]))
+        return answers
+
+    def _select_context(self, results, top_k, query_vector=None):
+        """Keep the retrieved chunks that fit the context budget, reporting the savings."""
+        if not results:
+            return results
+        with tracing.span("context", candidates=len(results)) as span:
+            # By stable id: rows may have been renumbered since the search
+            embeddings = self.store.embeddings_of([r["chunk_id"] for r in results])
+            selected, report = self.context.build(
+                results, top_k, embeddings=embeddings, query_vector=query_vector
+            )
+            span.set(tokens_sent=report.tokens_sent, tokens_saved=report.tokens_saved)
+        tracing.count("context_tokens_sent", report.tokens_sent)
+        tracing.count("context_tokens_saved", report.tokens_saved)
+        tracing.log(
+            f"Context: {report.selected}/{report.candidates} chunks, "
+            f"{report.tokens_sent} tokens sent, {report.tokens_saved} saved "
+            f"({report.duplicates} near-duplicates dropped, {report.truncated} truncated)"
+        )
+        return selected
+
+    def _build_prompt(self, question, results):
+        """Build the augmented prompt from retrieved chunks."""
+        with tracing.span("prompt", chunks=len(results)):
+            return self._format_prompt(question, results)
+
+    def _format_prompt(self, question, results):
         context_parts = []
         for i, result in enumerate(results, 1):
             source = result["metadata"].get("source", "unknown")
@@ -130,15 +524,11 @@ Question: {question}
 
 Answer:"""
 
-        print(f"Context length: {len(context)} characters\n")
+        tracing.log(f"Context length: {len(context)} characters\n")
+        return augmented_prompt
 
-        # STEP 3: GENERATION
-        print("💬 GENERATION: Calling LLM with context...\n")
-        messages = [{"role": "user", "content": augmented_prompt}]
-        return call_llm(messages)
-
-    def compare(self, question, top_k=3):
-        """Compare LLM with and without RAG side-by-side."""
+    def compare(self, question, top_k=3, stream=False):
+        """Compare LLM with and without RAG side-by-side (streamed if ``stream``)."""
         print("\n" + "=" * 70)
         print(f"QUESTION: {question}")
         print("=" * 70)
@@ -147,22 +537,61 @@ Answer:"""
         print("\n" + "-" * 70)
         print("WITHOUT RAG (LLM baseline):")
         print("-" * 70)
-        without = self.query(question, use_rag=False)
-        print(f"{without}\n")
+        without = self.query(question, use_rag=False, stream=stream)
+        if stream:
+            print_stream(without)
+        else:
+            print(f"{without}\n")
 
         # With RAG
         print("-" * 70)
         print("WITH RAG (Retrieval + LLM):")
         print("-" * 70)
-        with_rag = self.query(question, top_k=top_k, use_rag=True)
-        print(f"{with_rag}\n")
+        with_rag = self.query(question, top_k=top_k, use_rag=True, stream=stream)
+        if stream:
+            print_stream(with_rag)
+        else:
+            print(f"{with_rag}\n")
+
+        print("=" * 70)
 
+    async def acompare(self, question, top_k=3):
+        """
+        Async compare(): the baseline and RAG answers are generated concurrently.
+
+        Returns:
+            tuple: (answer without RAG, answer with RAG)
+        """
+        import asyncio
+
+        without, with_rag = await asyncio.gather(
+            self.aquery(question, use_rag=False),
+            self.aquery(question, top_k=top_k, use_rag=True),
+        )
+
+        print("\n" + "=" * 70)
+        print(f"QUESTION: {question}")
+        print("=" * 70)
+        print("\n" + "-" * 70)
+        print("WITHOUT RAG (LLM baseline):")
+        print("-" * 70)
+        print(f"{without}\n")
+        print("-" * 70)
+        print("WITH RAG (Retrieval + LLM):")
+        print("-" * 70)
+        print(f"{with_rag}\n")
         print("=" * 70)
 
+        return without, with_rag
+
 
 if __name__ == "__main__":
     # Interactive mode
-    rag = RAGSystem()
+    if not settings.api_key():
+        print("Error: OPENROUTER_API_KEY not set")
+        sys.exit(1)
+    tracing.set_verbose(True)
+    rag = RAGSystem(preload=True)
 
     print("RAG System Ready!")
     print("Commands:")
@@ -180,7 +609,8 @@ if __name__ == "__main__":
 
         if user_input.lower().startswith("compare:"):
             question = user_input[8:].strip()
-            rag.compare(question)
+            rag.compare(question, stream=True)
         else:
-            answer = rag.query(user_input)
-            print(f"\nAnswer: {answer}\n")
+            answer = rag.query(user_input, stream=True)
+            print("\nAnswer: ", end="")
+            print_stream(answer)
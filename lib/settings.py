@@ -0,0 +1,56 @@
+"""
+Deferred environment configuration.
+
+Nothing here runs at import time. load_env() merges the .env file into
+os.environ the first time configuration is actually needed (every
+``*_from_env`` helper calls it), and api_key() looks up the OpenRouter key
+at that point, so importing lib never reads files, prints or exits.
+"""
+
+import os
+import threading
+
+_loaded = False
+_lock = threading.Lock()
+
+
+def _read_env_file(path):
+    """Minimal KEY=value parser used when python-dotenv is not installed."""
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if "=" in line:
+                k, v = line.split("=", 1)
+                os.environ.setdefault(k.strip(), v.strip().strip('"').strip("'"))
+
+
+def load_env():
+    """
+    Load .env into os.environ once per process (existing variables win).
+
+    Safe to call repeatedly and from several threads; only the first call
+    touches the filesystem.
+    """
+    global _loaded
+    if _loaded:
+        return
+    with _lock:
+        if _loaded:
+            return
+        try:
+            from dotenv import load_dotenv
+        except ImportError:
+            _read_env_file(os.path.join(os.path.dirname(__file__), ".env"))
+        else:
+            load_dotenv()
+        _loaded = True
+
+
+def api_key():
+    """The OpenRouter API key (OPENROUTER_API_KEY, or from .env); "" if unset."""
+    load_env()
+    return os.getenv("OPENROUTER_API_KEY", "")
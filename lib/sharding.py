@@ -0,0 +1,287 @@
+"""
+Multi-process sharded scoring for SimpleVectorStore.
+
+One Python process scores queries with one interpreter's worth of CPU.
+ShardPool splits the store's (N, dim) embedding matrix into contiguous row
+ranges, one per worker process, scatters every query block to all of them
+and merges their partial top-k lists. The matrix is never copied per
+worker:
+
+- a store loaded from a float32 index directory is already an ``np.memmap``
+  of ``embeddings.bin``, so each worker maps just its own row range of that
+  file and all of them share the OS page cache;
+- any other matrix (built in memory, float16 on disk, edited after
+  loading) is copied once into a ``multiprocessing.shared_memory`` segment
+  that every worker attaches to.
+
+Workers are spawned (not forked) with single-threaded BLAS, so N shards
+use N cores without oversubscribing them.
+"""
+
+import contextlib
+import multiprocessing
+import os
+import threading
+import weakref
+
+import numpy as np
+
+from . import settings
+
+# Fewer rows than this per shard cost more in IPC than they save in scoring
+MIN_SHARD_ROWS = 4096
+# Thread-count variables of the common BLAS builds, pinned to 1 in workers
+_BLAS_THREAD_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+)
+
+
+def default_shards(rows):
+    """One shard per core, but no shard smaller than MIN_SHARD_ROWS rows."""
+    return max(1, min(os.cpu_count() or 1, rows // MIN_SHARD_ROWS))
+
+
+def shards_from_env():
+    """
+    Sharding RAGSystem uses by default, from ``RAG_SHARDS``.
+
+    Returns:
+        None (unset, "0" or "off"), "auto" (one worker per core) or a
+        worker count
+    """
+    settings.load_env()
+    value = os.getenv("RAG_SHARDS", "").strip().lower()
+    if value in ("", "0", "off", "none"):
+        return None
+    return "auto" if value == "auto" else int(value)
+
+
+def shard_bounds(rows, shards):
+    """(start, stop) row ranges splitting ``rows`` into ``shards`` near-equal parts."""
+    edges = [rows * i // shards for i in range(shards + 1)]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+@contextlib.contextmanager
+def _single_threaded_blas():
+    """Have processes started inside this block use one BLAS thread (unless configured)."""
+    saved = {name: os.environ.get(name) for name in _BLAS_THREAD_VARS}
+    for name, value in saved.items():
+        if value is None:
+            os.environ[name] = "1"
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+
+
+def _open_shard(source, start, stop):
+    """(matrix rows start:stop, shared memory handle or None) inside a worker."""
+    kind, name, rows, dim = source
+    if kind == "file":
+        offset = start * dim * np.dtype(np.float32).itemsize
+        shape = (stop - start, dim)
+        return np.memmap(name, dtype=np.float32, mode="r", offset=offset, shape=shape), None
+    from multiprocessing import shared_memory
+
+    shm = shared_memory.SharedMemory(name=name)
+    return np.ndarray((rows, dim), dtype=np.float32, buffer=shm.buf)[start:stop], shm
+
+
+def score_shard(matrix, queries, top_k, start=0, allowed=None):
+    """
+    Unordered top-k of one shard for a (q, dim) block of normalised queries.
+
+    Args:
+        matrix: The shard's (n, dim) rows
+        queries: (q, dim) float32 queries
+        top_k: Candidates to keep per query
+        start: Global row id of the shard's first row
+        allowed: Optional boolean mask over the shard's rows
+
+    Returns:
+        tuple: (ids, scores), both (q, k) with k = min(top_k, eligible rows)
+    """
+    rows = None if allowed is None else np.flatnonzero(allowed)
+    scores = queries @ (matrix if rows is None else matrix[rows]).T
+    k = min(top_k, scores.shape[1])
+    if k < scores.shape[1]:
+        picked = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        picked = np.broadcast_to(np.arange(k), (len(queries), k))
+    top_scores = np.take_along_axis(scores, picked, axis=1)
+    ids = picked if rows is None else rows[picked]
+    return ids.astype(np.int64) + start, top_scores
+
+
+def merge_top_k(parts, top_k):
+    """
+    Merge per-shard (ids, scores) candidate blocks into a global top-k.
+
+    Returns:
+        List (one per query row) of (ids, scores) arrays, best first
+    """
+    ids = np.concatenate([part[0] for part in parts], axis=1)
+    scores = np.concatenate([part[1] for part in parts], axis=1)
+    order = np.argsort(-scores, axis=1, kind="stable")[:, :top_k]
+    ids = np.take_along_axis(ids, order, axis=1)
+    scores = np.take_along_axis(scores, order, axis=1)
+    return list(zip(ids, scores))
+
+
+def _worker(conn, source, start, stop):
+    """Worker loop: score each (queries, top_k, allowed) request against rows start:stop."""
+    try:
+        matrix, shm = _open_shard(source, start, stop)
+    except Exception as e:
+        conn.send(e)
+        return
+    conn.send("ready")
+    try:
+        while True:
+            request = conn.recv()
+            if request is None:
+                break
+            try:
+                conn.send(score_shard(matrix, *request[:2], start, request[2]))
+            except Exception as e:
+                conn.send(e)
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        del matrix
+        if shm is not None:
+            shm.close()
+
+
+def _shutdown(conns, processes, shm):
+    """Stop the workers and free the shared segment (also run at exit / on GC)."""
+    for conn in conns:
+        with contextlib.suppress(OSError):
+            conn.send(None)
+    for process in processes:
+        process.join(timeout=1)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+    for conn in conns:
+        conn.close()
+    if shm is not None:
+        shm.close()
+        with contextlib.suppress(FileNotFoundError):
+            shm.unlink()
+
+
+class ShardPool:
+    """
+    Worker processes each scoring a contiguous row range of one matrix.
+
+    Requests from several threads are serialised; submit query blocks
+    (search_batch) to keep every shard busy.
+
+    Args:
+        matrix: (N, dim) float32 matrix of L2-normalised rows
+        shards: Worker processes (default: see default_shards)
+        path: Raw row-major float32 file holding exactly ``matrix``; workers
+            map it instead of sharing a copy
+    """
+
+    def __init__(self, matrix, shards=None, path=None):
+        rows, dim = matrix.shape
+        if rows == 0:
+            raise ValueError("Cannot shard an empty matrix")
+        shards = min(shards or default_shards(rows), rows)
+        self.bounds = shard_bounds(rows, shards)
+        self.rows, self.dim = rows, dim
+        self._lock = threading.Lock()
+
+        shm = None
+        if path is not None:
+            source = ("file", os.path.abspath(path), rows, dim)
+        else:
+            from multiprocessing import shared_memory
+
+            shm = shared_memory.SharedMemory(create=True, size=matrix.nbytes)
+            np.ndarray((rows, dim), dtype=np.float32, buffer=shm.buf)[:] = matrix
+            source = ("shm", shm.name, rows, dim)
+        self.shared = source[0]
+
+        context = multiprocessing.get_context("spawn")
+        self._conns, self._processes = [], []
+        self._finalizer = weakref.finalize(self, _shutdown, self._conns, self._processes, shm)
+        with _single_threaded_blas():
+            for i, (start, stop) in enumerate(self.bounds):
+                parent, child = context.Pipe()
+                process = context.Process(
+                    target=_worker,
+                    args=(child, source, start, stop),
+                    name=f"rag-shard-{i}",
+                    daemon=True,
+                )
+                process.start()
+                child.close()
+                self._conns.append(parent)
+                self._processes.append(process)
+        try:
+            self._gather()
+        except BaseException:
+            self.close()
+            raise
+
+    @property
+    def shards(self):
+        return len(self.bounds)
+
+    def _receive(self, conn):
+        try:
+            return conn.recv()
+        except EOFError:
+            return RuntimeError("A shard worker exited unexpectedly")
+
+    def _gather(self):
+        """One reply per worker; read them all before raising any error."""
+        replies = [self._receive(conn) for conn in self._conns]
+        for reply in replies:
+            if isinstance(reply, BaseException):
+                raise reply
+        return replies
+
+    def search(self, queries, top_k, allowed=None, extra=()):
+        """
+        Scatter a (q, dim) block of normalised queries and merge the top-k.
+
+        Args:
+            queries: (q, dim) float32 queries
+            top_k: Results per query
+            allowed: Optional boolean mask over the pool's ``rows``
+            extra: Further (ids, scores) candidate blocks (see score_shard)
+                to merge in, e.g. rows appended after the pool started
+
+        Returns:
+            List (one per query row) of (ids, scores) arrays, best first
+        """
+        if not self._finalizer.alive:
+            raise RuntimeError("ShardPool is closed")
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        with self._lock:
+            for conn, (start, stop) in zip(self._conns, self.bounds):
+                mask = None if allowed is None else allowed[start:stop]
+                conn.send((queries, top_k, mask))
+            parts = self._gather()
+        return merge_top_k(parts + list(extra), top_k)
+
+    def close(self):
+        """Stop the workers (idempotent)."""
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
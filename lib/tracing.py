@@ -0,0 +1,332 @@
+"""
+Lightweight tracing and metrics for the RAG hot path.
+
+Code wraps each stage in a span::
+
+    with tracing.span("score", rows=len(store)):
+        ...
+
+and bumps counters with ``tracing.count("prompt_tokens", n)``. An enabled
+Tracer records every span's latency in a per-name histogram (p50/p95/p99
+over a recent window), passes finished spans to its sinks (e.g. one JSON
+line each) and renders everything in the Prometheus text format. Tracing
+is off by default; a disabled tracer hands out one shared no-op span, so
+instrumented code costs a function call and an attribute check.
+
+Progress messages on the hot path go through ``log()``, which is quiet
+unless verbose mode is on (``RAG_VERBOSE=1`` or set_verbose(True)).
+
+numpy is imported only when percentiles are computed, so modules that
+merely instrument themselves (e.g. lib.http_client) stay cheap to import.
+
+Environment:
+    RAG_TRACE: Path of a JSON-lines file receiving every finished span
+    RAG_METRICS_PORT: Serve Prometheus metrics on this port (/metrics)
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from . import settings
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# The innermost open span of the current thread / asyncio task
+_current = contextvars.ContextVar("rag_span", default=None)
+
+
+class Histogram:
+    """
+    Latency distribution of one span name.
+
+    Count and sum cover every observation; percentiles are computed over
+    the most recent ``window`` observations.
+    """
+
+    def __init__(self, window=2048):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=window)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.samples.append(value)
+
+    def quantiles(self, qs=QUANTILES):
+        if not self.samples:
+            return [0.0 for _ in qs]
+        import numpy as np
+
+        return [float(v) for v in np.quantile(np.fromiter(self.samples, float), qs)]
+
+
+class Span:
+    """A timed stage; use as a context manager, attach attributes with set()."""
+
+    __slots__ = ("tracer", "name", "attrs", "trace", "parent", "start", "_token")
+
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        parent = _current.get()
+        self.parent = parent.name if parent is not None else None
+        self.trace = parent.trace if parent is not None else os.urandom(8).hex()
+        self._token = _current.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            pass  # closed from another context, e.g. an abandoned generator
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer._finish(self, duration)
+        return False
+
+
+class _NoopSpan:
+    """What a disabled tracer hands out: does nothing, shared by all callers."""
+
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class JSONLinesSink:
+    """Append every finished span to a file as one JSON object per line."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class Tracer:
+    """
+    Collects span latencies and counters and forwards spans to sinks.
+
+    Args:
+        sinks: Objects with ``emit(record)`` (and optionally ``close()``)
+            receiving a dict per finished span
+        enabled: When False every span is a no-op and nothing is recorded
+        window: Observations per histogram used for percentiles
+    """
+
+    def __init__(self, sinks=(), enabled=True, window=2048):
+        self.sinks = list(sinks)
+        self.enabled = enabled
+        self.window = window
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def span(self, name, **attrs):
+        """Context manager timing one stage named ``name``."""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, attrs)
+
+    def count(self, name, value=1):
+        """Add ``value`` to the counter ``name`` (tokens, bytes, hits...)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def _finish(self, span, duration):
+        with self._lock:
+            histogram = self.histograms.get(span.name)
+            if histogram is None:
+                histogram = self.histograms[span.name] = Histogram(self.window)
+            histogram.observe(duration)
+        if self.sinks:
+            record = {
+                "span": span.name,
+                "trace": span.trace,
+                "parent": span.parent,
+                "ms": round(duration * 1000, 3),
+                "ts": time.time(),
+                **span.attrs,
+            }
+            for sink in self.sinks:
+                sink.emit(record)
+
+    def stats(self):
+        """
+        Latency percentiles per span and counter totals.
+
+        Returns:
+            {"spans": {name: {"count", "mean_ms", "p50_ms", "p95_ms", "p99_ms"}},
+             "counters": {name: total}}
+        """
+        with self._lock:
+            spans = {}
+            for name, histogram in sorted(self.histograms.items()):
+                p50, p95, p99 = histogram.quantiles()
+                spans[name] = {
+                    "count": histogram.count,
+                    "mean_ms": 1000 * histogram.total / histogram.count,
+                    "p50_ms": 1000 * p50,
+                    "p95_ms": 1000 * p95,
+                    "p99_ms": 1000 * p99,
+                }
+            return {"spans": spans, "counters": dict(self.counters)}
+
+    def prometheus_text(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            if self.histograms:
+                lines.append("# HELP rag_span_seconds Latency of traced RAG stages")
+                lines.append("# TYPE rag_span_seconds summary")
+                for name, histogram in sorted(self.histograms.items()):
+                    for q, value in zip(QUANTILES, histogram.quantiles()):
+                        labels = f'span="{name}",quantile="{q}"'
+                        lines.append(f"rag_span_seconds{{{labels}}} {value:.6g}")
+                    lines.append(f'rag_span_seconds_sum{{span="{name}"}} {histogram.total:.6g}')
+                    lines.append(f'rag_span_seconds_count{{span="{name}"}} {histogram.count}')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE rag_{name}_total counter")
+                lines.append(f"rag_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Forget all recorded latencies and counters."""
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def close(self):
+        for sink in self.sinks:
+            if hasattr(sink, "close"):
+                sink.close()
+
+
+def serve_metrics(tracer, port, host="127.0.0.1"):
+    """
+    Serve ``tracer.prometheus_text()`` at http://host:port/metrics.
+
+    Runs in a daemon thread; returns the server (call ``shutdown()`` to stop).
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = tracer.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def tracer_from_env():
+    """
+    Build a Tracer from RAG_TRACE / RAG_METRICS_PORT (disabled if neither is set).
+    """
+    settings.load_env()
+    path = os.getenv("RAG_TRACE")
+    port = os.getenv("RAG_METRICS_PORT")
+    if not path and not port:
+        return Tracer(enabled=False)
+    tracer = Tracer(sinks=[JSONLinesSink(path)] if path else [])
+    if port:
+        serve_metrics(tracer, int(port))
+    return tracer
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    """The process-wide Tracer, created from the environment on first use."""
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = tracer_from_env()
+    return _tracer
+
+
+def set_tracer(tracer):
+    """Replace the process-wide tracer (None recreates it from the env)."""
+    global _tracer
+    _tracer = tracer
+
+
+def span(name, **attrs):
+    """Span on the process-wide tracer (a shared no-op when tracing is off)."""
+    return (_tracer or get_tracer()).span(name, **attrs)
+
+
+def count(name, value=1):
+    """Bump a counter on the process-wide tracer."""
+    (_tracer or get_tracer()).count(name, value)
+
+
+_verbose = None  # None: read RAG_VERBOSE (after .env is loaded) on first use
+
+
+def set_verbose(verbose=True):
+    """Turn hot-path progress messages on or off (None reads RAG_VERBOSE again)."""
+    global _verbose
+    _verbose = verbose
+
+
+def is_verbose():
+    global _verbose
+    if _verbose is None:
+        settings.load_env()
+        _verbose = os.getenv("RAG_VERBOSE", "").lower() in ("1", "true", "yes", "on")
+    return _verbose
+
+
+def log(*args, **kwargs):
+    """print() that only prints in verbose mode."""
+    if _verbose or (_verbose is None and is_verbose()):
+        print(*args, **kwargs)
@@ -3,18 +3,221 @@ Simple in-memory vector store for RAG.
 Stores text chunks with their embeddings and provides semantic search.
 """
 
+import itertools
+import os
+import threading
+import time
+import uuid
 import numpy as np
-from .embedding import get_embedding, cosine_similarity
-import pickle
+from .embedding import aget_embedding, aget_embeddings, get_embedding, get_embeddings
+from .embedders import (
+    describe,
+    embedder_from_state,
+    embedder_params,
+    make_embedder,
+    same_embedder,
+)
+from .ann import IVFIndex, evaluate_recall
+from .bm25 import BM25Index, reciprocal_rank_fusion
+from .filters import AttributeIndex
+from .quantization import make_quantizer, quantizer_from_state
+from .index_format import (
+    pinned_version,
+    read_arrays,
+    read_ids,
+    read_index,
+    read_legacy_pickle,
+    read_manifest,
+    write_index,
+)
+from .wal import decode_vector, encode_vector, open_log
+from ._locks import ReadWriteLock
+from ._vectors import normalize_rows, top_k_indices
+from . import tracing
+
+SEARCH_MODES = ("dense", "lexical", "hybrid")
+# Hybrid search fuses this many times top_k candidates from each ranking
+HYBRID_DEPTH = 4
+# Logged upserts/deletes after which a background compaction starts
+DEFAULT_COMPACT_AFTER = 10000
+# Manifest fields save() derives from the store; compaction carries over the rest
+_DERIVED_FIELDS = frozenset(
+    ("format", "version", "build_id", "created", "count", "dim", "dtype", "arrays", "ids")
+    + ("embedder", "ann", "quantization", "lexical", "filters", "wal_seq")
+)
+# Attributes a store keeps when it switches to a freshly loaded copy of its index
+_OWN_STATE = frozenset(
+    ("_chosen_embedder", "compact_after", "_rw", "_compacting", "_compaction_start")
+    + ("_compaction", "compaction_error", "_replaced_shards")
+)
 
 
 class SimpleVectorStore:
-    """A minimal vector database."""
+    """
+    A minimal vector database.
+
+    Args:
+        embedder: Embedder (or backend name, see lib.embedders) turning
+            texts and queries into vectors. None uses the embedder recorded
+            in a loaded index, else the default remote model; an explicit
+            one that differs from a loaded index's is rejected.
+    """
 
-    def __init__(self):
+    def __init__(self, embedder=None):
+        if isinstance(embedder, str):
+            embedder = make_embedder(embedder)
+        self._chosen_embedder = embedder
+        self.embedder = embedder
         self.chunks = []  # List of text strings
-        self.embeddings = []  # List of embedding vectors
         self.metadata = []  # List of metadata dicts
+        # Row-major float32 buffer holding one L2-normalised embedding per
+        # chunk. It grows geometrically so appends stay amortised O(1).
+        self._matrix = None
+        self.manifest = {}  # Manifest of the index this store was loaded from/saved to
+        self.ann = None  # Optional IVFIndex used instead of brute-force scoring
+        self.quantizer = None  # Optional int8/PQ quantizer scoring on self.codes
+        self.codes = None
+        self.rerank = 0  # Re-rank rerank * top_k code-scored candidates exactly
+        self.lexical = None  # Optional BM25Index for lexical and hybrid search
+        self.filters = None  # AttributeIndex over metadata for where= filters
+        self.shards = None  # Optional ShardPool scoring dense searches in worker processes
+        self.ids = []  # Stable chunk id per row (None: the row numbers, for old indexes)
+        self.deleted = None  # Tombstones: boolean row mask of replaced/deleted chunks
+        self.tombstones = 0
+        self.path = None  # Index directory this store was loaded from or saved to
+        self.log = None  # WriteAheadLog of ``path``, receiving upserts and deletes
+        self.compact_after = DEFAULT_COMPACT_AFTER  # 0 disables automatic compaction
+        self._log_seq = 0  # Last log record reflected in memory
+        self._row_of = None  # chunk id -> live row, built on first use
+        self._unsaved = False  # changed since the last save/load outside the log
+        self._rw = ReadWriteLock()  # searches read, changes write
+        self._compacting = threading.Lock()  # held while a compaction runs
+        self._compaction_start = threading.Lock()
+        self._compaction = None  # background compaction thread
+        self.compaction_error = None  # exception of the last failed background compaction
+        self._replaced_shards = None  # shard pool to respawn once the write lock is released
+
+    @property
+    def embeddings(self):
+        """(N, dim) float32 matrix of the stored, L2-normalised embeddings."""
+        if self._matrix is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._matrix[: len(self.chunks)]
+
+    def _append_vectors(self, vectors):
+        """Normalise and append a (n, dim) block of embeddings to the matrix."""
+        vectors = normalize_rows(np.atleast_2d(np.asarray(vectors, dtype=np.float32)))
+        size, count = len(self.chunks), len(vectors)
+
+        if self._matrix is None or (size == 0 and self._matrix.shape[1] != vectors.shape[1]):
+            capacity = max(count, 16)
+            self._matrix = np.zeros((capacity, vectors.shape[1]), dtype=np.float32)
+        elif vectors.shape[1] != self._matrix.shape[1]:
+            raise ValueError(
+                f"Embedding dimension {vectors.shape[1]} does not match "
+                f"store dimension {self._matrix.shape[1]}"
+            )
+        elif size + count > len(self._matrix):
+            capacity = max(size + count, 2 * len(self._matrix))
+            grown = np.zeros((capacity, self._matrix.shape[1]), dtype=np.float32)
+            grown[:size] = self._matrix[:size]
+            self._matrix = grown
+
+        self._matrix[size : size + count] = vectors
+        if self.ann is not None:
+            self.ann.add(vectors)
+        if self.quantizer is not None:
+            self.codes = np.concatenate([self.codes, self.quantizer.encode(vectors)])
+
+    def embedder_params(self):
+        """Manifest params of the embedder in use (see lib.embedders)."""
+        return embedder_params(self.embedder)
+
+    def _embed_texts(self, texts, **options):
+        if self.embedder is None:
+            return get_embeddings(texts, **options)
+        return self.embedder.embed(texts, **options)
+
+    async def _aembed_texts(self, texts):
+        if self.embedder is None:
+            return await aget_embeddings(texts)
+        return await self.embedder.aembed(texts)
+
+    def embed_query(self, text):
+        """Embed ``text`` the way this store's chunks were embedded."""
+        with tracing.span("embed", texts=1):
+            if self.embedder is None:
+                return get_embedding(text)
+            return self.embedder.embed_one(text)
+
+    def embed_queries(self, texts):
+        """Embed a batch of query ``texts`` with one embedding call."""
+        with tracing.span("embed", texts=len(texts)):
+            return self._embed_texts(texts)
+
+    async def aembed_query(self, text):
+        """Async embed_query()."""
+        with tracing.span("embed", texts=1):
+            if self.embedder is None:
+                return await aget_embedding(text)
+            return await self.embedder.aembed_one(text)
+
+    def _make_writable(self):
+        """Swap memory-mapped chunk/metadata/id tables for lists before changing them."""
+        if not isinstance(self.chunks, list):
+            self.chunks = list(self.chunks)
+        if not isinstance(self.metadata, list):
+            self.metadata = list(self.metadata)
+        if self.ids is None:
+            self.ids = [str(i) for i in range(len(self.chunks))]
+        elif not isinstance(self.ids, list):
+            self.ids = list(self.ids)
+
+    def _chunk_id(self, row):
+        return self.ids[row] if self.ids is not None else str(row)
+
+    def _id_rows(self):
+        """{chunk id: row} of the live chunks."""
+        if self._row_of is None:
+            ids = self.ids if self.ids is not None else map(str, range(len(self.chunks)))
+            deleted = self.deleted if self.tombstones else None
+            self._row_of = {
+                cid: row
+                for row, cid in enumerate(ids)
+                if deleted is None or not deleted[row]
+            }
+        return self._row_of
+
+    def _new_ids(self, ids, count):
+        """Validated ids for ``count`` new chunks (random ones if ``ids`` is None)."""
+        if ids is None:
+            return [uuid.uuid4().hex for _ in range(count)]
+        ids = [str(i) for i in ids]
+        if len(ids) != count:
+            raise ValueError("ids must have one entry per text")
+        if len(set(ids)) != len(ids):
+            raise ValueError("ids must be unique")
+        existing = next((cid for cid in ids if cid in self._id_rows()), None)
+        if existing is not None:
+            raise ValueError(f"Chunk id {existing!r} already exists; use upsert() to replace it")
+        return ids
+
+    def _append(self, texts, metadatas, embeddings, ids):
+        """Append rows (the caller holds the write lock)."""
+        self._make_writable()
+        start = len(self.chunks)
+        self._append_vectors(embeddings)
+        if self.lexical is not None:
+            self.lexical.add(texts)
+        if self.filters is not None:
+            self.filters.add(metadatas)
+        self.chunks.extend(texts)
+        self.metadata.extend(metadatas)
+        self.ids.extend(ids)
+        if self.deleted is not None:
+            self.deleted = np.concatenate([self.deleted, np.zeros(len(texts), dtype=bool)])
+        if self._row_of is not None:
+            self._row_of.update(zip(ids, range(start, start + len(ids))))
 
     def add_text(self, text, metadata=None):
         """
@@ -24,75 +227,1041 @@ class SimpleVectorStore:
             text: String to add
             metadata: Optional dict like {"source": "doc1.txt"}
         """
-        print(f"Adding: {text[:50]}...")
+        tracing.log(f"Adding: {text[:50]}...")
 
         # Get embedding for this text
-        embedding = get_embedding(text)
+        embedding = self.embed_query(text)
 
         # Store everything
-        self.chunks.append(text)
-        self.embeddings.append(embedding)
-        self.metadata.append(metadata or {})
+        with self._rw.write():
+            self._append([text], [metadata or {}], embedding, self._new_ids(None, 1))
+            self._unsaved = True
+
+    def add_texts(self, texts, metadatas=None, batch_size=64, embeddings=None, ids=None):
+        """
+        Add many text chunks to the store using batched embedding requests.
+
+        Unlike upsert(), this is not logged: save() persists it.
+
+        Args:
+            texts: List of strings to add
+            metadatas: Optional list of metadata dicts, one per text
+            batch_size: Maximum number of texts per embedding request
+            embeddings: Optional precomputed (n, dim) embeddings of ``texts``;
+                skips the embedding requests
+            ids: Optional stable chunk ids, one per text (default: random);
+                ids already in the store are rejected
+        """
+        texts = list(texts)
+        if not texts:
+            return
+        metadatas = list(metadatas) if metadatas is not None else [None] * len(texts)
+        if len(metadatas) != len(texts):
+            raise ValueError("metadatas must have one entry per text")
+        ids = self._new_ids(ids, len(texts))
+
+        if embeddings is None:
+            tracing.log(f"Adding {len(texts)} chunks...")
+            with tracing.span("embed", texts=len(texts)):
+                embeddings = self._embed_texts(texts, batch_size=batch_size)
+        elif len(embeddings) != len(texts):
+            raise ValueError("embeddings must have one row per text")
+
+        with self._rw.write():
+            self._append(texts, [m or {} for m in metadatas], embeddings, ids)
+            self._unsaved = True
+
+    def upsert(self, ids, texts, metadatas=None, batch_size=64, embeddings=None):
+        """
+        Insert chunks, or replace the chunks that already have these ids.
+
+        New versions are appended and the rows they replace become
+        tombstones, masked out of every search until compaction drops them.
+        A store attached to an index directory (see load() and save()) first
+        appends the change to the index's write-ahead log, so it survives a
+        restart without rewriting the index.
+
+        Args:
+            ids: Stable chunk ids, one per text (the last one wins if repeated)
+            texts: Chunk texts
+            metadatas: Optional metadata dicts, one per text
+            batch_size: Maximum number of texts per embedding request
+            embeddings: Optional precomputed (n, dim) embeddings of ``texts``
+
+        Returns:
+            int: Number of existing chunks replaced
+        """
+        ids, texts = [str(i) for i in ids], list(texts)
+        metadatas = list(metadatas) if metadatas is not None else [None] * len(texts)
+        if not len(ids) == len(texts) == len(metadatas):
+            raise ValueError("ids, texts and metadatas must have the same length")
+        if not texts:
+            return 0
+        metadatas = [m or {} for m in metadatas]
+        if embeddings is None:
+            with tracing.span("embed", texts=len(texts)):
+                embeddings = self._embed_texts(texts, batch_size=batch_size)
+        vectors = normalize_rows(np.atleast_2d(np.asarray(embeddings, dtype=np.float32)))
+        if len(vectors) != len(texts):
+            raise ValueError("embeddings must have one row per text")
+
+        with self._rw.write():
+            # Reject a wrong dimension before it reaches the log
+            if len(self) and vectors.shape[1] != self.embeddings.shape[1]:
+                raise ValueError(
+                    f"Embedding dimension {vectors.shape[1]} does not match "
+                    f"store dimension {self.embeddings.shape[1]}"
+                )
+            records = [
+                {
+                    "op": "upsert",
+                    "id": cid,
+                    "text": text,
+                    "metadata": metadata,
+                    "vector": encode_vector(vector),
+                }
+                for cid, text, metadata, vector in zip(ids, texts, metadatas, vectors)
+            ]
+            self._log_changes(records)
+            replaced = self._apply_upsert(ids, texts, metadatas, vectors)
+        self._respawn_shards()
+        self._maybe_compact()
+        return replaced
+
+    def delete(self, ids):
+        """
+        Delete the chunks with these ids (unknown ids are ignored).
+
+        The rows become tombstones, logged like upsert().
+
+        Returns:
+            int: Number of chunks deleted
+        """
+        with self._rw.write():
+            present = [cid for cid in dict.fromkeys(map(str, ids)) if cid in self._id_rows()]
+            self._log_changes([{"op": "delete", "id": cid} for cid in present])
+            self._apply_delete(present)
+        self._respawn_shards()
+        if present:
+            self._maybe_compact()
+        return len(present)
+
+    def _log_changes(self, records):
+        """
+        Append records to the log before they are applied (write lock held).
+
+        If other writers (other processes, or other stores on the index)
+        logged records since this store last looked, those are applied
+        first, so this store ends up where a fresh load would.
+        """
+        if self.log is None or not records:
+            return
+        if self._unsaved:
+            self._check_base()  # before logging a change that could not be applied
+        last = self.log.append(records, after=self._log_seq)
+        first = last - len(records) + 1
+        if first > self._log_seq + 1:
+            if self._check_base():
+                # Compacted or rebuilt meanwhile: the new base must be in place
+                # before these records, so it is loaded here, and the shard
+                # workers are respawned once the lock is released
+                copy, _ = self._loaded_copy(log_until=first - 1, shards=False)
+                self._adopt(copy)
+                self._replaced_shards = self._replaced_shards or copy.shards
+            else:
+                self._replay(until=first - 1)
+        self._log_seq = max(last, self._log_seq)
+
+    def _check_base(self):
+        """
+        True if another writer rewrote this store's index since it loaded it.
+
+        Raises:
+            RuntimeError: It did, and this store holds unsaved changes that
+                loading the new index would discard
+        """
+        rebuilt = read_manifest(self.path).get("build_id") != self.manifest.get("build_id")
+        if rebuilt and self._unsaved:
+            raise self._unsaved_error()
+        return rebuilt
+
+    def _unsaved_error(self):
+        return RuntimeError(
+            f"{self.path} was rewritten by another writer, and this store has changes "
+            "that are not in its log (add_texts, remove_where or a built index); "
+            "save() them or load() the index again"
+        )
+
+    def _respawn_shards(self):
+        """Replace shard workers of a base swapped in under the write lock (lock released)."""
+        pool, self._replaced_shards = self._replaced_shards, None
+        if pool is not None:
+            count = pool.shards
+            pool.close()
+            if self.shards is None:
+                self.shard(count)
+
+    def get(self, chunk_id):
+        """
+        The live chunk with this id.
+
+        Returns:
+            dict {"id", "chunk_id", "text", "metadata"}, or None
+        """
+        self._index_ids()
+        with self._rw.read():
+            row = self._id_rows().get(str(chunk_id))
+            if row is None:
+                return None
+            return {
+                "id": row,
+                "chunk_id": self._chunk_id(row),
+                "text": self.chunks[row],
+                "metadata": self.metadata[row],
+            }
+
+    def embeddings_of(self, chunk_ids):
+        """
+        Stored embeddings of live chunks, looked up by id.
+
+        Rows are renumbered by compaction and remove_where(), so callers
+        holding earlier search results should use this rather than index
+        ``embeddings`` with their row ids.
+
+        Returns:
+            (n, dim) float32 copy, or None if any of the chunks is gone
+        """
+        self._index_ids()
+        with self._rw.read():
+            row_of = self._id_rows()
+            rows = [row_of.get(str(cid)) for cid in chunk_ids]
+            if any(row is None for row in rows):
+                return None
+            return np.array(self.embeddings[rows])
+
+    def _index_ids(self):
+        """Build the id -> row map under the write lock before a reader needs it."""
+        if self._row_of is None:
+            with self._rw.write():
+                self._id_rows()
+
+    def _apply_upsert(self, ids, texts, metadatas, vectors):
+        row_of = self._id_rows()
+        replaced = [row_of.pop(cid) for cid in dict.fromkeys(ids) if cid in row_of]
+        start = len(self)
+        self._append(texts, metadatas, vectors, ids)
+        # An id repeated within the batch keeps only its last row
+        repeated = [start + i for i, cid in enumerate(ids) if row_of[cid] != start + i]
+        self._tombstone(replaced + repeated)
+        return len(replaced)
+
+    def _apply_delete(self, ids):
+        row_of = self._id_rows()
+        self._tombstone([row_of.pop(cid) for cid in ids if cid in row_of])
+
+    def _tombstone(self, rows):
+        if not rows:
+            return
+        if self.deleted is None:
+            self.deleted = np.zeros(len(self), dtype=bool)
+        self.deleted[rows] = True
+        self.tombstones = int(self.deleted.sum())
+
+    def _live(self):
+        """Boolean mask of the rows that are not tombstones (None if all are live)."""
+        return ~self.deleted if self.tombstones else None
+
+    def _keep_rows(self, keep):
+        """Physically drop the rows where ``keep`` is False (renumbers rows)."""
+        self.unshard()
+        self._make_writable()
+        self._matrix = np.ascontiguousarray(self.embeddings[keep])
+        if self.ann is not None:
+            self.ann.keep(keep)
+        if self.quantizer is not None:
+            self.codes = self.codes[keep]
+        if self.lexical is not None:
+            self.lexical.keep(keep)
+        if self.filters is not None:
+            self.filters.keep(keep)
+        self.chunks = [c for c, k in zip(self.chunks, keep) if k]
+        self.metadata = [m for m, k in zip(self.metadata, keep) if k]
+        self.ids = [i for i, k in zip(self.ids, keep) if k]
+        if self.deleted is not None:
+            self.deleted = self.deleted[keep]
+            self.tombstones = int(self.deleted.sum())
+        self._row_of = None
+
+    def remove_where(self, predicate):
+        """
+        Drop every chunk whose metadata matches ``predicate``.
+
+        Unlike delete(), rows are removed at once (renumbering the rest) and
+        the change is not logged: save() persists it.
+
+        Args:
+            predicate: Callable taking a metadata dict, True to remove
+
+        Returns:
+            int: Number of chunks removed
+        """
+        with self._rw.write():
+            keep = np.array([not predicate(m) for m in self.metadata], dtype=bool)
+            live = self._live()
+            removed = int(np.count_nonzero(~keep if live is None else ~keep & live))
+            if not keep.all():
+                self._keep_rows(keep)
+                self._unsaved = True
+        return removed
+
+    def build_ann(self, nlist=None, nprobe=8, iterations=20, seed=0):
+        """
+        Build an approximate (IVF) index over the current embeddings.
+
+        Later searches only score the ``nprobe`` closest of ``nlist``
+        k-means partitions instead of every chunk. Chunks added afterwards
+        are assigned to their nearest partition; the index is saved and
+        loaded together with the store.
+
+        Args:
+            nlist: Number of partitions (default: about sqrt(N))
+            nprobe: Partitions scanned per query (recall/latency knob)
+            iterations: Maximum k-means iterations
+            seed: Random seed for training
+        """
+        ann = IVFIndex(nlist=nlist, nprobe=nprobe, seed=seed)
+        ann.train(self.embeddings, iterations=iterations)
+        self.ann = ann
+        self._unsaved = True
+        tracing.log(f"Built IVF index with {ann.nlist} lists (nprobe={ann.nprobe})")
+
+    def build_lexical(self, k1=1.5, b=0.75):
+        """
+        Build a BM25 inverted index over the stored chunks.
+
+        Enables ``mode="lexical"`` (no embedding call) and ``mode="hybrid"``
+        searches. Chunks added or removed later keep the index up to date,
+        and it is saved and loaded together with the store.
+
+        Args:
+            k1: BM25 term-frequency saturation
+            b: BM25 document-length normalisation
+        """
+        lexical = BM25Index(k1=k1, b=b)
+        lexical.add(self.chunks)
+        self.lexical = lexical
+        self._unsaved = True
+        tracing.log(f"Built BM25 index over {len(lexical)} chunks ({len(lexical.terms)} terms)")
+
+    def build_filters(self, fields=None):
+        """
+        Index metadata fields for ``where=`` filters (see lib.filters).
+
+        Searches build the index on first use if needed; building it
+        up front means it is saved with the store and loads instantly.
+
+        Args:
+            fields: Fields to index (default: every str/number field)
+        """
+        filters = self._index_filters(fields)
+        self._unsaved = True
+        names = sorted({field for field, _ in filters.columns})
+        tracing.log(f"Indexed metadata fields for filtering: {', '.join(names) or '(none)'}")
+
+    def shard(self, shards=None):
+        """
+        Score dense searches across worker processes (see lib.sharding).
+
+        The matrix is split into ``shards`` contiguous row ranges, each
+        scored by its own process, and every query block is scattered to
+        all of them with the partial top-k lists merged. A store loaded from
+        a float32 index has its workers map the index file directly; any
+        other matrix is placed once in shared memory. ANN and quantized
+        searches still run in this process. Chunks added later are scored
+        here and merged with the workers' results; removing chunks (or
+        loading) stops the workers (call shard() again afterwards).
+
+        Args:
+            shards: Number of worker processes (default: one per core, with
+                at least lib.sharding.MIN_SHARD_ROWS rows each)
+        """
+        from .sharding import ShardPool
+
+        self.unshard()
+        matrix = self.embeddings
+        path = None
+        if isinstance(self._matrix, np.memmap) and self._matrix.filename:
+            path = self._matrix.filename
+        self.shards = ShardPool(matrix, shards, path=path)
+        tracing.log(
+            f"Sharded {len(self)} vectors across {self.shards.shards} worker processes "
+            f"({'memory-mapped file' if path else 'shared memory'})"
+        )
 
-    def search(self, query, top_k=3):
+    def unshard(self):
+        """Stop the shard workers, if any; searches score in this process again."""
+        if self.shards is not None:
+            self.shards.close()
+            self.shards = None
+            tracing.log("Stopped shard workers")
+
+    def _index_filters(self, fields=None):
+        """Build the metadata index under the write lock, so no search sees it half-built."""
+        with self._rw.write():
+            filters = AttributeIndex(fields)
+            filters.add(self.metadata)
+            self.filters = filters
+        return filters
+
+    def evaluate_ann(self, query_vectors=None, top_k=10, nprobe=None, sample=100, seed=0):
+        """
+        Measure ANN recall@k and latency against exact search.
+
+        Args:
+            query_vectors: (q, dim) query embeddings; by default ``sample``
+                stored embeddings perturbed with noise are used
+            top_k: k for recall@k
+            nprobe: Partitions scanned per query (default: the index's)
+            sample: Number of synthetic queries when none are given
+            seed: Random seed for the synthetic queries
+
+        Returns:
+            dict: {"recall@k": ..., "exact_ms": ..., "ann_ms": ..., "nprobe": ...}
+        """
+        if self.ann is None:
+            raise ValueError("No ANN index; call build_ann() first")
+        if query_vectors is None:
+            rng = np.random.default_rng(seed)
+            rows = rng.choice(len(self), size=min(sample, len(self)), replace=False)
+            base = self.embeddings[np.sort(rows)]
+            query_vectors = base + rng.normal(scale=0.5 / np.sqrt(base.shape[1]), size=base.shape)
+        queries = normalize_rows(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        return evaluate_recall(self.ann, self.embeddings, queries, top_k, nprobe)
+
+    def quantize(self, method="int8", rerank=4, seed=0, **options):
+        """
+        Compress the stored vectors and score searches on the codes.
+
+        "int8" keeps one signed byte per dimension (4x smaller than float32);
+        "pq" keeps one byte per sub-vector (``m`` bytes per row, up to 32x
+        smaller). Searches score the codes, then re-rank the best
+        ``rerank * top_k`` candidates exactly against the float matrix.
+        Once saved and re-loaded, that matrix stays memory-mapped on disk,
+        so only the re-ranked rows are ever paged in.
+
+        Args:
+            method: "int8" (scalar) or "pq" (product quantization)
+            rerank: Candidate multiplier for exact re-ranking (0 disables)
+            seed: Random seed for PQ training
+            **options: Passed to the quantizer, e.g. m=192 for "pq"
+        """
+        quantizer = make_quantizer(method, **options)
+        quantizer.train(self.embeddings, seed=seed)
+        self.codes = quantizer.encode(self.embeddings)
+        self.quantizer = quantizer
+        self.rerank = rerank
+        self._unsaved = True
+        ratio = self.embeddings.nbytes / max(self.codes.nbytes, 1)
+        tracing.log(f"Quantized {len(self)} vectors with {method} ({ratio:.1f}x smaller)")
+
+    def _score_rows(self, queries, rows, use_codes):
+        """(q, n) scores against ``rows`` (all rows if None)."""
+        if use_codes:
+            codes = self.codes if rows is None else self.codes[rows]
+            return self.quantizer.score(codes, queries)
+        matrix = self.embeddings if rows is None else self.embeddings[rows]
+        return queries @ matrix.T
+
+    def _dense_hits(
+        self, query_vectors, top_k, nprobe=None, exact=False, rerank=None, allowed=None
+    ):
+        """
+        Score a (q, dim) block of query embeddings against the store.
+
+        Without an ANN index or quantizer (or with ``exact=True``) all
+        queries are scored against every chunk with one matrix-matrix
+        product, split across the worker processes after shard(). An ANN
+        index narrows the rows scored; a quantizer scores compressed codes
+        and re-ranks the best candidates exactly. An ``allowed`` row mask
+        restricts scoring to the rows it selects.
+
+        Returns:
+            List (one per query row) of (rows, scores) arrays, best first
+        """
+        queries = normalize_rows(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        if queries.shape[1] != self.embeddings.shape[1]:
+            raise ValueError(
+                f"Query embedding dimension {queries.shape[1]} does not match store "
+                f"dimension {self.embeddings.shape[1]} (embedded with "
+                f"{describe(self.embedder_params())})"
+            )
+        use_codes = self.quantizer is not None and not exact
+        rerank = self.rerank if rerank is None else rerank
+        keep = top_k * rerank if use_codes and rerank else top_k
+
+        eligible = None if allowed is None else np.flatnonzero(allowed)
+        use_ann = self.ann is not None and not exact
+        if use_ann and eligible is not None:
+            # Scan a selective filter's rows directly when that is cheaper
+            # than the lists the ANN index would probe
+            probed = len(self) * min(nprobe or self.ann.nprobe, self.ann.nlist) / self.ann.nlist
+            use_ann = len(eligible) > probed
+
+        use_shards = self.shards is not None and not use_ann and not use_codes
+
+        with tracing.span("score", queries=len(queries), ann=use_ann, codes=use_codes):
+            if use_shards:
+                # Workers return each query's merged top-k directly; rows
+                # appended since shard() are scored here and merged in
+                from .sharding import score_shard
+
+                sharded, extra = self.shards.rows, []
+                if len(self) > sharded:
+                    tail = None if allowed is None else allowed[sharded:]
+                    if tail is None or tail.any():
+                        matrix = self.embeddings[sharded:]
+                        extra.append(score_shard(matrix, queries, top_k, sharded, tail))
+                mask = None if allowed is None else allowed[:sharded]
+                return self.shards.search(queries, top_k, mask, extra)
+            if use_ann:
+                candidates = self.ann.candidates(queries, nprobe)
+                if allowed is not None:
+                    candidates = [rows[allowed[rows]] for rows in candidates]
+                scored = [
+                    (rows, self._score_rows(query[None, :], rows, use_codes)[0])
+                    for query, rows in zip(queries, candidates)
+                ]
+            else:
+                scored = [(eligible, row) for row in self._score_rows(queries, eligible, use_codes)]
+
+        hits = []
+        with tracing.span("top_k", k=top_k):
+            for query, (rows, scores) in zip(queries, scored):
+                top = top_k_indices(scores, keep)
+                picked, picked_scores = (top if rows is None else rows[top]), scores[top]
+                if keep != top_k:
+                    # Exact re-rank of the code-scored candidates
+                    picked_scores = self.embeddings[picked] @ query
+                    order = top_k_indices(picked_scores, top_k)
+                    picked, picked_scores = picked[order], picked_scores[order]
+                hits.append((picked, picked_scores))
+        return hits
+
+    def _check_mode(self, mode):
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode {mode!r}; choose from {SEARCH_MODES}")
+        if mode != "dense" and self.lexical is None:
+            raise ValueError(f"{mode!r} search needs a lexical index; call build_lexical() first")
+
+    def _search(
+        self, queries, query_vectors, top_k, nprobe=None, exact=False, mode="dense", where=None
+    ):
+        """
+        Rank chunks for a batch of queries.
+
+        "dense" scores ``query_vectors``; "lexical" scores ``queries`` with
+        BM25 (``query_vectors`` is unused); "hybrid" fuses both rankings
+        with reciprocal rank fusion. Rows not matching ``where`` and
+        tombstones are never scored.
+
+        Returns:
+            List (one per query) of result lists, best match first
+        """
+        if where is not None and self.filters is None:
+            # First filtered search: index metadata before taking the read
+            # lock (readers cannot upgrade), unless another search just did
+            with self._rw.write():
+                if self.filters is None:
+                    self._index_filters()
+        with self._rw.read():
+            allowed = self._live()
+            if where is not None:
+                with tracing.span("filter"):
+                    matching = self.filters.mask(where)
+                allowed = matching if allowed is None else matching & allowed
+            if allowed is not None and not allowed.any():
+                return [[] for _ in queries]
+            return self._rank(queries, query_vectors, top_k, nprobe, exact, mode, allowed)
+
+    def _rank(self, queries, query_vectors, top_k, nprobe, exact, mode, allowed):
+        if mode == "dense":
+            hits = self._dense_hits(query_vectors, top_k, nprobe, exact, allowed=allowed)
+        elif mode == "lexical":
+            with tracing.span("lexical", queries=len(queries)):
+                hits = [self.lexical.search(query, top_k, allowed) for query in queries]
+        else:
+            depth = top_k * HYBRID_DEPTH
+            dense = self._dense_hits(query_vectors, depth, nprobe, exact, allowed=allowed)
+            with tracing.span("lexical", queries=len(queries)):
+                hits = [
+                    reciprocal_rank_fusion(
+                        [rows, self.lexical.search(query, depth, allowed)[0]], top_k
+                    )
+                    for query, (rows, _) in zip(queries, dense)
+                ]
+
+        # Only materialise dicts for the winning rows
+        return [
+            [
+                {
+                    "id": int(i),
+                    "chunk_id": self._chunk_id(i),
+                    "text": self.chunks[i],
+                    "score": float(score),
+                    "metadata": self.metadata[i],
+                }
+                for i, score in zip(rows, scores)
+            ]
+            for rows, scores in hits
+        ]
+
+    def search(
+        self, query, top_k=3, nprobe=None, exact=False, mode="dense", query_vector=None, where=None
+    ):
         """
         Find the most relevant chunks for a query.
 
         Args:
             query: Search string
             top_k: Number of results to return
+            nprobe: ANN partitions to scan (only used with an ANN index)
+            exact: Force brute-force scoring even if an ANN index exists
+            mode: "dense" (embeddings), "lexical" (BM25, no embedding call)
+                or "hybrid" (reciprocal rank fusion of both); the last two
+                need build_lexical()
+            query_vector: The query's embedding, if already computed
+            where: Metadata filter, e.g. {"source": "doc1.txt"} or
+                {"year": {"$gte": 2023}}; only matching chunks are scored
+                (see lib.filters)
 
         Returns:
-            List of dicts: [{'text': ..., 'score': ..., 'metadata': ...}, ...]
+            List of dicts: [{'id': ..., 'chunk_id': ..., 'text': ..., 'score': ...,
+            'metadata': ...}, ...] where 'id' is the chunk's row in the store
+            and 'chunk_id' its stable id
         """
-        if not self.chunks:
+        self._check_mode(mode)
+        if not self.chunks or top_k <= 0:
             return []
 
-        print(f"\nSearching for: '{query}'")
+        tracing.log(f"\nSearching for: '{query}'")
 
         # Convert query to embedding
-        query_embedding = get_embedding(query)
-
-        # Calculate similarity with all chunks
-        similarities = []
-        for i, chunk_embedding in enumerate(self.embeddings):
-            score = cosine_similarity(query_embedding, chunk_embedding)
-            similarities.append(
-                {"text": self.chunks[i], "score": score, "metadata": self.metadata[i]}
-            )
+        if mode != "lexical" and query_vector is None:
+            query_vector = self.embed_query(query)
+        results = self._search([query], query_vector, top_k, nprobe, exact, mode, where)[0]
 
-        # Sort by score (highest first)
-        similarities.sort(key=lambda x: x["score"], reverse=True)
+        if tracing.is_verbose():  # only format the listing when it is shown
+            tracing.log(f"Found {len(results)} results:")
+            for i, r in enumerate(results, 1):
+                tracing.log(f"  {i}. Score: {r['score']:.3f} - {r['text'][:60]}...")
 
-        # Return top k
-        results = similarities[:top_k]
+        return results
 
-        print(f"Found {len(results)} results:")
-        for i, r in enumerate(results, 1):
-            print(f"  {i}. Score: {r['score']:.3f} - {r['text'][:60]}...")
+    def search_batch(
+        self,
+        queries,
+        top_k=3,
+        nprobe=None,
+        exact=False,
+        mode="dense",
+        where=None,
+        query_vectors=None,
+    ):
+        """
+        Find the most relevant chunks for many queries at once.
 
-        return results
+        All queries are embedded in one request and scored together, which
+        is much cheaper than calling search() in a loop.
+
+        Args:
+            queries: List of search strings
+            top_k: Number of results to return per query
+            nprobe: ANN partitions to scan (only used with an ANN index)
+            exact: Force brute-force scoring even if an ANN index exists
+            mode: "dense", "lexical" or "hybrid" (see search())
+            where: Metadata filter applied to every query (see search())
+            query_vectors: The queries' (q, dim) embeddings, if already computed
+
+        Returns:
+            List of result lists, in the same order as ``queries``
+        """
+        self._check_mode(mode)
+        queries = list(queries)
+        if not queries:
+            return []
+        if not self.chunks or top_k <= 0:
+            return [[] for _ in queries]
+
+        tracing.log(f"\nSearching for {len(queries)} queries")
+
+        query_embeddings = query_vectors
+        if mode != "lexical" and query_embeddings is None:
+            query_embeddings = self.embed_queries(queries)
+        return self._search(queries, query_embeddings, top_k, nprobe, exact, mode, where)
+
+    async def asearch(
+        self, query, top_k=3, nprobe=None, exact=False, mode="dense", query_vector=None, where=None
+    ):
+        """Async search(): the query embedding is awaited, scoring is local."""
+        self._check_mode(mode)
+        if not self.chunks or top_k <= 0:
+            return []
+        if mode != "lexical" and query_vector is None:
+            query_vector = await self.aembed_query(query)
+        return self._search([query], query_vector, top_k, nprobe, exact, mode, where)[0]
 
-    def save(self, filepath):
-        """Save to disk."""
-        data = {
-            "chunks": self.chunks,
-            "embeddings": [emb.tolist() for emb in self.embeddings],
-            "metadata": self.metadata,
-        }
-        with open(filepath, "wb") as f:
-            pickle.dump(data, f)
-        print(f"Saved to {filepath}")
-
-    def load(self, filepath):
-        """Load from disk."""
-        with open(filepath, "rb") as f:
-            data = pickle.load(f)
-
-        self.chunks = data["chunks"]
-        self.embeddings = [np.array(emb) for emb in data["embeddings"]]
-        self.metadata = data["metadata"]
-        print(f"Loaded {len(self.chunks)} chunks from {filepath}")
+    async def asearch_batch(
+        self,
+        queries,
+        top_k=3,
+        nprobe=None,
+        exact=False,
+        mode="dense",
+        where=None,
+        query_vectors=None,
+    ):
+        """Async search_batch(): batches are embedded concurrently."""
+        self._check_mode(mode)
+        queries = list(queries)
+        if not queries:
+            return []
+        if not self.chunks or top_k <= 0:
+            return [[] for _ in queries]
+        query_embeddings = query_vectors
+        if mode != "lexical" and query_embeddings is None:
+            with tracing.span("embed", texts=len(queries)):
+                query_embeddings = await self._aembed_texts(queries)
+        return self._search(queries, query_embeddings, top_k, nprobe, exact, mode, where)
+
+    def save(self, filepath, dtype="float32", extra=None):
+        """
+        Save to disk as a memory-mappable index directory.
+
+        Tombstones are dropped first (renumbering rows), and the index's
+        write-ahead log is reset: everything it held is now in the index.
+        The store then logs later upserts and deletes to ``filepath``.
+
+        Args:
+            filepath: Index directory to write (replaced if it exists)
+            dtype: On-disk embedding dtype, "float32" or "float16"
+            extra: Optional dict of additional manifest fields
+        """
+        with self._rw.write():
+            if self.tombstones:
+                self._keep_rows(~self.deleted)
+            self._write(filepath, dtype, extra)
+        tracing.log(f"Saved to {filepath}")
+
+    def _write(self, filepath, dtype, extra):
+        """Write the index and trim its log to the records this store has not seen."""
+        extra, arrays = dict(extra or {}), {}
+        extra["embedder"], arrays["embedder"] = (
+            self.embedder.state() if self.embedder is not None else (embedder_params(None), {})
+        )
+        if self.ann is not None:
+            extra["ann"], arrays["ann"] = self.ann.state()
+        if self.quantizer is not None:
+            extra["quantization"], arrays["quant"] = self.quantizer.state()
+            extra["quantization"]["rerank"] = self.rerank
+            arrays["quant"]["codes"] = self.codes
+        if self.lexical is not None:
+            extra["lexical"], arrays["lexical"] = self.lexical.state()
+        if self.filters is not None:
+            extra["filters"], arrays["filters"] = self.filters.state()
+
+        log = open_log(filepath)
+        # Records of this index this store has applied are folded in; a
+        # store from elsewhere supersedes the whole log of ``filepath``
+        seq = self._log_seq if log is self.log else log.last_seq
+        extra["wal_seq"] = seq
+        self.manifest = write_index(
+            filepath,
+            self.chunks,
+            self.embeddings,
+            self.metadata,
+            dtype=dtype,
+            extra=extra,
+            arrays=arrays,
+            ids=self.ids if self.ids is not None else [str(i) for i in range(len(self))],
+        )
+        log.truncate(seq)
+        self.path, self.log, self._log_seq = filepath, log, seq
+        self._unsaved = False
+
+    def load(self, filepath, import_embedder=False):
+        """
+        Load from disk.
+
+        Index directories are memory-mapped rather than read, so this is
+        near-instant and processes loading the same index share its pages.
+        Upserts and deletes logged since the index was written are replayed.
+        A legacy ``rag_store.pkl`` file is still read (and can be converted
+        with ``save``).
+
+        Args:
+            filepath: Index directory (or legacy pickle)
+            import_embedder: Import the module of an unregistered
+                "package.module:Class" embedder the index names (see
+                lib.embedders); only for trusted indexes
+        """
+        with self._rw.write():
+            replayed = self._load(filepath, import_embedder=import_embedder)
+        logged = f" (+{replayed} logged changes)" if replayed else ""
+        tracing.log(f"Loaded {len(self.chunks)} chunks from {filepath}{logged}")
+
+    def _load(self, filepath, log_until=None, import_embedder=False):
+        """Load ``filepath`` and replay its log up to ``log_until``; returns records replayed."""
+        self.unshard()
+        self.deleted, self.tombstones, self._row_of = None, 0, None
+        self._unsaved = False
+        if os.path.isdir(filepath):
+            with pinned_version(filepath) as version:  # read every file from one version
+                self.manifest, matrix, self.chunks, self.metadata = read_index(version)
+                self.ids = read_ids(version, self.manifest)
+                arrays = read_arrays(version, self.manifest)
+            if matrix.dtype != np.float32:
+                # float16 halves disk and page cache use; score in float32
+                matrix = matrix.astype(np.float32)
+            self._matrix = matrix
+            self._use_recorded_embedder(arrays.get("embedder", {}), import_embedder)
+            self.ann = None
+            if "ann" in arrays:
+                self.ann = IVFIndex.from_state(self.manifest["ann"], arrays["ann"])
+            self.quantizer, self.codes, self.rerank = None, None, 0
+            if "quant" in arrays:
+                params = self.manifest["quantization"]
+                self.quantizer = quantizer_from_state(params, arrays["quant"])
+                self.codes, self.rerank = arrays["quant"]["codes"], params["rerank"]
+            self.lexical = None
+            if "lexical" in arrays:
+                self.lexical = BM25Index.from_state(self.manifest["lexical"], arrays["lexical"])
+            self.filters = None
+            if "filters" in self.manifest:
+                self.filters = AttributeIndex.from_state(
+                    self.manifest["filters"], arrays.get("filters", {}), len(self.chunks)
+                )
+            self.path, self.log = filepath, open_log(filepath)
+            self._log_seq = self.manifest.get("wal_seq", 0)
+            return self._replay(log_until)
+
+        chunks, embeddings, metadata = read_legacy_pickle(filepath)
+        self.chunks, self.metadata, self.manifest = [], [], {}
+        self._matrix, self.ann = None, None
+        self.quantizer, self.codes, self.rerank = None, None, 0
+        self.lexical, self.filters = None, None
+        self.embedder = self._chosen_embedder
+        if len(embeddings):
+            self._append_vectors(embeddings)
+        self.chunks, self.metadata, self.ids = chunks, metadata, None
+        self.path, self.log, self._log_seq = None, None, 0
+        return 0
+
+    def _replay(self, until=None):
+        """Apply this index's logged changes newer than the loaded state."""
+        records = self.log.records(after=self._log_seq, until=until)
+        for op, run in itertools.groupby(records, key=lambda record: record["op"]):
+            run = list(run)
+            if op == "upsert":
+                self._apply_upsert(
+                    [r["id"] for r in run],
+                    [r["text"] for r in run],
+                    [r["metadata"] for r in run],
+                    np.stack([decode_vector(r["vector"]) for r in run]),
+                )
+            elif op == "delete":
+                self._apply_delete([r["id"] for r in run])
+            else:
+                raise ValueError(f"Unknown operation {op!r} in {self.log.path}")
+        if records:
+            self._log_seq = records[-1]["seq"]
+        return len(records)
+
+    def refresh(self):
+        """
+        Catch up with changes another process made to this store's index.
+
+        Records logged since this store loaded (or last refreshed) are
+        replayed; if the index itself was rewritten (compacted or rebuilt),
+        it is loaded again.
+
+        Returns:
+            int: Log records applied
+
+        Raises:
+            RuntimeError: The index was rewritten, and this store has unsaved
+                changes (see compact()) that loading it would discard
+        """
+        if self.path is None:
+            return 0
+        with self._rw.write():
+            if not self._check_base():
+                return self._replay()
+        return self._reload()
+
+    def _reload(self, write_unsaved=False):
+        """
+        Switch to a fresh load of this store's index; returns records replayed.
+
+        The copy is loaded, and sharded like this store, without holding the
+        lock, so searches only wait for the switch and the replay of changes
+        logged meanwhile. Unsaved changes made in memory are written over
+        the index if ``write_unsaved``, else they raise RuntimeError.
+        """
+        while True:
+            copy, replayed = self._loaded_copy()
+            try:
+                with self._rw.write():
+                    if self._unsaved and not write_unsaved:
+                        raise self._unsaved_error()
+                    current = read_manifest(self.path).get("build_id")
+                    if not self._unsaved and copy.manifest.get("build_id") == current:
+                        self._adopt(copy)
+                        return replayed + self._replay()
+            finally:
+                copy.unshard()  # the workers no longer in use, old or unneeded
+            if self._unsaved:
+                self._compact_in_place()
+                return 0
+            # Otherwise the index was rewritten again while loading: retry
+
+    def _loaded_copy(self, log_until=None, shards=True):
+        """(store, records replayed): a new load of this index, sharded like this store."""
+        copy = SimpleVectorStore(self._chosen_embedder)
+        replayed = copy._load(self.path, log_until)
+        if shards and self.shards is not None:
+            copy.shard(self.shards.shards)
+        return copy, replayed
+
+    def _adopt(self, copy):
+        """Take over ``copy``'s state (write lock held); ``copy`` gets the old shard pool."""
+        shards = self.shards
+        for name, value in vars(copy).items():
+            if name not in _OWN_STATE:
+                setattr(self, name, value)
+        copy.shards = shards
+
+    def compact(self, wait=True):
+        """
+        Fold the write-ahead log and the tombstones into a new base index.
+
+        A second copy of the base is loaded, the logged changes are replayed
+        onto it, tombstones are dropped and the result replaces the index
+        directory; the log is trimmed and this store switches to the new
+        base. Only that switch takes the write lock, so searches, upserts
+        and deletes go on during the rebuild (changes made meanwhile stay in
+        the log). Runs automatically in the background once
+        ``compact_after`` changes are logged.
+
+        Changes that are not logged (add_texts(), remove_where(), and
+        indexes built with build_ann(), build_lexical(), build_filters() or
+        quantize()) exist only in memory until save(). A store holding any
+        of them is written out as save() would, under the write lock,
+        rather than rebuilt from disk without them.
+
+        Args:
+            wait: Compact before returning; False compacts in a background
+                thread (or joins the one already running)
+
+        Returns:
+            threading.Thread: The background compaction (None when ``wait``)
+        """
+        if self.path is None or not os.path.isdir(self.path):
+            raise ValueError("Only a store loaded from or saved to an index can be compacted")
+        with self._compaction_start:
+            running = self._compaction is not None and self._compaction.is_alive()
+            if not wait and not running:
+                self._compaction = threading.Thread(
+                    target=self._compact_in_background, name="rag-compaction", daemon=True
+                )
+                self._compaction.start()
+            thread = self._compaction if running or not wait else None
+        if not wait:
+            return thread
+        if thread is not None:
+            thread.join()
+        self._compact()
+        return None
+
+    def _compact_in_background(self):
+        try:
+            self._compact()
+        except Exception as e:  # the log still holds every change; the next run retries
+            self.compaction_error = e
+            tracing.count("compaction_failures")
+            tracing.log(f"Background compaction of {self.path} failed: {type(e).__name__}: {e}")
+
+    def _compact(self):
+        with self._compacting:
+            if self._unsaved:
+                self._compact_in_place()
+                return
+            with self._rw.read():
+                path, upto = self.path, self._log_seq
+                folded = upto - self.manifest.get("wal_seq", 0)
+                if not folded and not self.tombstones:
+                    return
+                dtype = self.manifest.get("dtype", "float32")
+            start = time.perf_counter()
+
+            base = SimpleVectorStore(self._chosen_embedder)
+            base._load(path, log_until=upto)
+            dropped = base.tombstones
+            if dropped:
+                base._keep_rows(~base.deleted)
+            extra = {k: v for k, v in base.manifest.items() if k not in _DERIVED_FIELDS}
+            base._write(path, dtype, extra)
+            self.compaction_error = None
+
+            self._reload(write_unsaved=True)  # unless changed in memory meanwhile
+            tracing.log(
+                f"Compacted {path}: {len(base)} chunks, {folded} logged changes folded in, "
+                f"{dropped} tombstones dropped ({time.perf_counter() - start:.2f}s)"
+            )
+
+    def _compact_in_place(self):
+        """Compact by writing this store's in-memory state over its index."""
+        start = time.perf_counter()
+        shards = self.shards.shards if self.shards is not None else None
+        with self._rw.write():
+            self._write_in_place()
+        self.compaction_error = None
+        if shards and self.shards is None:
+            self.shard(shards)
+        tracing.log(
+            f"Compacted {self.path} from memory: {len(self)} chunks "
+            f"({time.perf_counter() - start:.2f}s)"
+        )
+
+    def _write_in_place(self):
+        """save() this store over its own index, keeping the manifest's extra fields."""
+        if self.tombstones:
+            self._keep_rows(~self.deleted)
+        extra = {k: v for k, v in self.manifest.items() if k not in _DERIVED_FIELDS}
+        self._write(self.path, self.manifest.get("dtype", "float32"), extra)
+
+    def _maybe_compact(self):
+        """Start a background compaction once ``compact_after`` changes are logged."""
+        pending = self._log_seq - self.manifest.get("wal_seq", 0)
+        if self.log is not None and self.compact_after and pending >= self.compact_after:
+            self.compact(wait=False)
+
+    def _use_recorded_embedder(self, arrays, import_embedder=False):
+        """Adopt the loaded index's embedder, or check the chosen one matches it."""
+        recorded = self.manifest.get("embedder")
+        if recorded is None:  # written before embedders were recorded
+            self.embedder = self._chosen_embedder
+            return
+        if self._chosen_embedder is None:
+            self.embedder = embedder_from_state(recorded, arrays, import_embedder)
+            return
+        chosen = embedder_params(self._chosen_embedder)
+        dim = getattr(self._chosen_embedder, "dim", None)
+        if not same_embedder(chosen, recorded) or dim not in (None, self.manifest["dim"]):
+            raise ValueError(
+                f"Index was embedded with {describe(recorded)} (dim={self.manifest['dim']}), "
+                f"not {describe(chosen)}"
+            )
+        self.embedder = self._chosen_embedder
 
     def __len__(self):
         return len(self.chunks)
@@ -0,0 +1,237 @@
+"""
+Append-only write-ahead log of chunk upserts and deletes.
+
+A SimpleVectorStore attached to an index directory logs every upsert() and
+delete() to ``<index>.wal`` next to it before applying the change in
+memory, so a change costs one appended line instead of a rewrite of the
+index. Each line is a JSON record:
+
+    {"seq": 7, "op": "upsert", "id": ..., "text": ..., "metadata": {...},
+     "vector": "<base64 little-endian float32>"}
+    {"seq": 8, "op": "delete", "id": ...}
+
+``seq`` increases by one per record. An index's manifest records the last
+sequence number folded into it (``wal_seq``); loading replays the newer
+records, and compaction or save() writes a new base and trims the log.
+
+Appends and trims hold an exclusive ``flock`` on ``<index>.wal.lock``,
+which also keeps the highest sequence number handed out, so writers in
+different processes never reuse a number, even after the log was trimmed
+empty. (Without ``fcntl``, on Windows, only threads are serialised.)
+"""
+
+import base64
+import contextlib
+import json
+import os
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def log_path(index_path):
+    """Path of the write-ahead log belonging to an index directory."""
+    return os.fspath(index_path).rstrip("/\\") + ".wal"
+
+
+def open_log(index_path):
+    """
+    The WriteAheadLog of an index directory.
+
+    There is one instance per log file and process, so every store on the
+    same index (and its compaction) shares it.
+    """
+    path = os.path.abspath(log_path(index_path))
+    with _logs_lock:
+        if path not in _logs:
+            _logs[path] = WriteAheadLog(path)
+        return _logs[path]
+
+
+def remove_log(index_path):
+    """Delete the log of an index directory being removed, and its lock file."""
+    path = os.path.abspath(log_path(index_path))
+    with _logs_lock:
+        _logs.pop(path, None)
+    for name in (path, f"{path}.lock"):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(name)
+
+
+def encode_vector(vector):
+    return base64.b64encode(np.asarray(vector, dtype="<f4").tobytes()).decode("ascii")
+
+
+def decode_vector(text):
+    return np.frombuffer(base64.b64decode(text), dtype="<f4").astype(np.float32)
+
+
+class WriteAheadLog:
+    """
+    JSON-lines log file of store changes.
+
+    Args:
+        path: Log file (created on the first append)
+        sync: fsync every append, so acknowledged changes survive a crash
+    """
+
+    def __init__(self, path, sync=True):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self.sync = sync
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Hold the log exclusively (threads and processes); yields the lock file's fd."""
+        with self._lock:
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                yield fd
+            finally:
+                os.close(fd)  # releases the flock
+
+    def _lines(self):
+        """Complete lines of the file; a torn last line (crash, write in flight) is skipped."""
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        return data[: data.rfind(b"\n") + 1].splitlines()
+
+    def records(self, after=0, until=None):
+        """
+        The records with ``after < seq <= until``, oldest first.
+
+        Args:
+            after: Skip records up to this sequence number
+            until: Stop after this sequence number (default: read to the end)
+
+        Returns:
+            list of record dicts
+        """
+        records = []
+        for line in self._lines():
+            record = json.loads(line)
+            if record["seq"] > after and (until is None or record["seq"] <= until):
+                records.append(record)
+        return records
+
+    @property
+    def last_seq(self):
+        """Highest sequence number handed out (0 if none)."""
+        with self._locked() as fd:
+            return self._current_seq(fd)
+
+    def _tail_seq(self):
+        """Sequence number of the file's last complete record, reading only its end."""
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return 0
+        with f:
+            pos, data = f.seek(0, os.SEEK_END), b""
+            while pos > 0:
+                step = min(1 << 16, pos)
+                pos -= step
+                f.seek(pos)
+                data = f.read(step) + data
+                complete = data[: data.rfind(b"\n") + 1].rstrip(b"\n")
+                lines = complete.rsplit(b"\n", 1)
+                if complete and (len(lines) == 2 or pos == 0):
+                    return json.loads(lines[-1])["seq"]
+        return 0
+
+    def _current_seq(self, fd):
+        """Highest sequence number so far, from the lock file and the log (lock held)."""
+        os.lseek(fd, 0, os.SEEK_SET)
+        mark = os.read(fd, 32).strip()
+        return max(int(mark) if mark else 0, self._tail_seq())
+
+    def _set_seq(self, fd, seq):
+        os.ftruncate(fd, 0)
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.write(fd, str(seq).encode("ascii"))
+
+    def _repair(self):
+        """Cut a torn last line left by a crash, so new records start on a line of their own."""
+        try:
+            with open(self.path, "rb+") as f:
+                if f.seek(0, os.SEEK_END) == 0:
+                    return
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.seek(0)
+                    data = f.read()
+                    f.truncate(data.rfind(b"\n") + 1)
+        except FileNotFoundError:
+            pass
+
+    def append(self, records, after=0):
+        """
+        Durably append records, numbering them.
+
+        Records other writers appended since the caller last looked get
+        lower numbers; a caller finding a gap before its first record
+        should replay it (see SimpleVectorStore).
+
+        Args:
+            records: Record dicts without "seq"
+            after: Lowest sequence number the new records must follow (the
+                base index's, in case the log was trimmed empty)
+
+        Returns:
+            int: Sequence number of the last record appended
+        """
+        with self._locked() as fd:
+            self._repair()
+            seq = max(self._current_seq(fd), after)
+            lines = []
+            for record in records:
+                seq += 1
+                line = {"seq": seq}
+                line.update(record)
+                lines.append(json.dumps(line, separators=(",", ":")) + "\n")
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(lines))
+                f.flush()
+                if self.sync:
+                    os.fsync(f.fileno())
+            self._set_seq(fd, seq)
+            return seq
+
+    def truncate(self, upto):
+        """
+        Drop the records with ``seq <= upto`` (they were folded into the base).
+
+        The remaining records are rewritten to a temporary file that replaces
+        the log atomically; an empty log is removed.
+        """
+        with self._locked() as fd:
+            last = max(self._current_seq(fd), upto)
+            kept = [line for line in self._lines() if json.loads(line)["seq"] > upto]
+            if not kept:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+            else:
+                tmp = f"{self.path}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(b"\n".join(kept) + b"\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+            self._set_seq(fd, last)
+
+    def __len__(self):
+        return len(self._lines())
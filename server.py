@@ -0,0 +1,263 @@
+"""
+Local HTTP query server with dynamic request micro-batching.
+
+Concurrent requests are coalesced by lib.batching.QueryBatcher: requests
+arriving within --max-wait-ms of each other (up to --max-batch) are
+embedded with one batched embedding call and scored with one matrix
+multiply, and each caller gets its own results. /query then builds the
+prompt and calls the LLM per request. At most --max-queue searches wait;
+beyond that requests are refused with 503 and a Retry-After header.
+
+/upsert and /delete change chunks online: each change is appended to the
+index's write-ahead log and applied in memory, searches keep running, and
+the log is compacted into the index in the background.
+
+Endpoints:
+    POST /search  {"query": ..., "top_k": 3, "mode": "dense", "where": {...}}
+                  -> {"results": [{"id", "chunk_id", "text", "score", "metadata"}, ...]}
+    POST /query   {"question": ..., "top_k": 3, "where": {...}} -> {"answer": ...}
+    POST /upsert  {"chunks": [{"id": ..., "text": ..., "metadata": {...}}, ...]}
+                  -> {"upserted": N, "replaced": M}
+    POST /delete  {"ids": [...]} -> {"deleted": N}
+    GET  /stats   batching, queue, latency and throughput statistics
+    GET  /health  {"status": "ok", "chunks": N}
+
+Usage:
+    python server.py                                    # http://127.0.0.1:8000
+    python server.py --port 9000 --max-batch 64 --max-wait-ms 10 --shards auto
+"""
+
+import argparse
+import json
+import sys
+from concurrent.futures import TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from lib import settings, tracing
+from lib.batching import (
+    DEFAULT_MAX_BATCH,
+    DEFAULT_MAX_QUEUE,
+    DEFAULT_MAX_WAIT_MS,
+    DEFAULT_TIMEOUT,
+    Overloaded,
+    QueryBatcher,
+)
+from lib.rag_system import DEFAULT_STORE_PATH, RAGSystem
+
+# Seconds a refused client is asked to wait before retrying
+RETRY_AFTER = 1
+# Largest request body accepted, in bytes
+MAX_BODY = 1 << 20
+
+
+class BadRequest(ValueError):
+    """The request body is missing, malformed or invalid."""
+
+
+def _field(body, name, kind, default=None):
+    value = body.get(name, default)
+    if value is not None and (isinstance(value, bool) or not isinstance(value, kind)):
+        raise BadRequest(f"{name!r} must be {kind.__name__}")
+    return value
+
+
+def make_server(rag, host="127.0.0.1", port=8000, batcher=None):
+    """
+    Create (without starting) a threaded HTTP server answering for ``rag``.
+
+    The store is loaded now, and ``batcher`` (default: a QueryBatcher with
+    default settings) is attached to ``rag`` so /query retrieves through it
+    too. Call ``serve_forever()`` on the result, then ``shutdown()``,
+    ``server_close()`` and ``batcher.close()``.
+
+    Returns:
+        ThreadingHTTPServer with ``rag`` and ``batcher`` attributes
+    """
+    store = rag.load()
+    if batcher is None:
+        batcher = QueryBatcher(store, mode=rag.search_mode)
+    rag.batcher = batcher
+
+    class QueryHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path == "/health":
+                self._send(200, {"status": "ok", "chunks": len(store) - store.tombstones})
+            elif path == "/stats":
+                self._send(
+                    200,
+                    {
+                        "chunks": len(store) - store.tombstones,
+                        "tombstones": store.tombstones,
+                        "batcher": batcher.stats(),
+                    },
+                )
+            else:
+                self._send(404, {"error": f"Not found: {path}"})
+
+        def do_POST(self):
+            path = self.path.split("?")[0]
+            handler = {
+                "/search": self._search,
+                "/query": self._query,
+                "/upsert": self._upsert,
+                "/delete": self._delete,
+            }.get(path)
+            if handler is None:
+                self._send(404, {"error": f"Not found: {path}"})
+                return
+            try:
+                self._send(200, handler(self._body()))
+            except Overloaded as e:
+                self._send(503, {"error": str(e)}, {"Retry-After": str(RETRY_AFTER)})
+            except FutureTimeout:
+                self._send(504, {"error": "Timed out waiting for the search"})
+            except ValueError as e:  # BadRequest, bad modes or filters
+                self._send(400, {"error": str(e)})
+            except Exception as e:
+                self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+        def _body(self):
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                length = -1
+            # An unread body would be parsed as the next request: hang up instead
+            if length < 0:
+                self.close_connection = True
+                raise BadRequest("Content-Length must be a non-negative integer")
+            if length > MAX_BODY:
+                self.close_connection = True
+                raise BadRequest(f"Request body larger than {MAX_BODY} bytes")
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except (UnicodeDecodeError, json.JSONDecodeError) as e:
+                raise BadRequest(f"Invalid JSON: {e}") from None
+            if not isinstance(body, dict):
+                raise BadRequest("Request body must be a JSON object")
+            return body
+
+        def _search(self, body):
+            query = _field(body, "query", str)
+            if not query:
+                raise BadRequest("'query' is required")
+            results, _ = batcher.search(
+                query,
+                top_k=_field(body, "top_k", int, 3),
+                mode=_field(body, "mode", str),
+                where=_field(body, "where", dict),
+            )
+            return {"results": results}
+
+        def _query(self, body):
+            question = _field(body, "question", str)
+            if not question:
+                raise BadRequest("'question' is required")
+            answer = rag.query(
+                question, top_k=_field(body, "top_k", int, 3), where=_field(body, "where", dict)
+            )
+            return {"answer": answer}
+
+        def _upsert(self, body):
+            chunks = _field(body, "chunks", list)
+            if not chunks or not all(isinstance(c, dict) for c in chunks):
+                raise BadRequest("'chunks' must be a non-empty list of objects")
+            ids = [_field(c, "id", str) for c in chunks]
+            texts = [_field(c, "text", str) for c in chunks]
+            if not all(ids) or not all(texts):
+                raise BadRequest("Every chunk needs an 'id' and a 'text'")
+            metadatas = [_field(c, "metadata", dict) for c in chunks]
+            replaced = store.upsert(ids, texts, metadatas)
+            return {"upserted": len(chunks), "replaced": replaced}
+
+        def _delete(self, body):
+            ids = _field(body, "ids", list)
+            if ids is None or not all(isinstance(i, str) for i in ids):
+                raise BadRequest("'ids' must be a list of strings")
+            return {"deleted": store.delete(ids)}
+
+        def _send(self, status, payload, headers=None):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            if self.close_connection:
+                self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            tracing.log(f"{self.address_string()} {format % args}")
+
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    server.daemon_threads = True
+    server.rag, server.batcher = rag, batcher
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--index", default=DEFAULT_STORE_PATH, help="Index directory")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
+    parser.add_argument(
+        "--max-batch", type=int, default=DEFAULT_MAX_BATCH, help="Most requests per batch"
+    )
+    parser.add_argument(
+        "--max-wait-ms",
+        type=float,
+        default=DEFAULT_MAX_WAIT_MS,
+        help="Longest a batch waits for more requests",
+    )
+    parser.add_argument(
+        "--max-queue",
+        type=int,
+        default=DEFAULT_MAX_QUEUE,
+        help="Requests allowed to wait before new ones get 503",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=DEFAULT_TIMEOUT, help="Seconds a request may wait"
+    )
+    parser.add_argument(
+        "--shards", help="Shard worker processes for scoring ('auto', a count, or 0)"
+    )
+    args = parser.parse_args(argv)
+
+    if not settings.api_key():
+        print("Warning: OPENROUTER_API_KEY not set; remote embedding and /query will fail")
+    shards = None
+    if args.shards is not None:
+        shards = "auto" if args.shards == "auto" else int(args.shards) or False
+    rag = RAGSystem(args.index, shards=shards)
+    batcher = QueryBatcher(
+        rag.load(),
+        max_batch=args.max_batch,
+        max_wait_ms=args.max_wait_ms,
+        max_queue=args.max_queue,
+        mode=rag.search_mode,
+        timeout=args.timeout,
+    )
+    server = make_server(rag, args.host, args.port, batcher)
+    print(
+        f"Serving {len(rag.store)} chunks at http://{args.host}:{server.server_port} "
+        f"(batches of up to {args.max_batch}, {args.max_wait_ms} ms wait, "
+        f"{args.max_queue} queued)"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+        if rag.store.shards is not None:
+            rag.store.unshard()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
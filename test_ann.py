@@ -0,0 +1,83 @@
+"""
+Tests for the IVF approximate nearest-neighbour index (offline).
+"""
+
+import numpy as np
+import pytest
+
+import lib.vector_store as vector_store
+from lib.ann import IVFIndex, kmeans, recall_at_k
+from lib.vector_store import SimpleVectorStore
+
+DIM = 24
+
+
+@pytest.fixture
+def vectors():
+    """Clustered data: 40 blobs of 25 points each."""
+    rng = np.random.default_rng(1)
+    centers = rng.normal(size=(40, DIM))
+    return np.repeat(centers, 25, axis=0) + rng.normal(scale=0.15, size=(1000, DIM))
+
+
+@pytest.fixture
+def store(vectors, monkeypatch):
+    lookup = {f"row {i}": v for i, v in enumerate(vectors)}
+    monkeypatch.setattr(vector_store, "get_embeddings", lambda texts, **kw: np.array([lookup[t] for t in texts]))
+    monkeypatch.setattr(vector_store, "get_embedding", lambda text: lookup[text])
+
+    s = SimpleVectorStore()
+    s.add_texts(list(lookup), metadatas=[{"row": i} for i in range(len(vectors))])
+    return s
+
+
+def test_kmeans_centroids_are_unit_length(vectors):
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    centroids = kmeans(unit.astype(np.float32), 10)
+    assert centroids.shape == (10, DIM)
+    np.testing.assert_allclose(np.linalg.norm(centroids, axis=1), 1.0, rtol=1e-5)
+
+
+def test_ivf_search_high_recall(store):
+    store.build_ann(nlist=40, nprobe=4)
+    report = store.evaluate_ann(top_k=10)
+    assert report["recall@10"] >= 0.9
+    assert report["nprobe"] == 4
+
+
+def test_full_probe_is_exact(store):
+    store.build_ann(nlist=20, nprobe=20)
+    for text in ["row 3", "row 517", "row 999"]:
+        approx = store.search(text, top_k=5)
+        exact = store.search(text, top_k=5, exact=True)
+        assert [r["text"] for r in approx] == [r["text"] for r in exact]
+
+
+def test_nprobe_trades_recall(store):
+    store.build_ann(nlist=100, nprobe=1)
+    low = store.evaluate_ann(top_k=20, nprobe=1)["recall@20"]
+    high = store.evaluate_ann(top_k=20, nprobe=30)["recall@20"]
+    assert high >= low
+    assert high > 0.95
+
+
+def test_ann_persisted_and_maintained(store, tmp_path, monkeypatch):
+    store.build_ann(nlist=40, nprobe=4)
+    store.save(tmp_path / "index")
+
+    loaded = SimpleVectorStore()
+    loaded.load(tmp_path / "index")
+    assert isinstance(loaded.ann, IVFIndex)
+    np.testing.assert_array_equal(loaded.ann.assignments, store.ann.assignments)
+    assert loaded.search("row 42", top_k=1)[0]["metadata"] == {"row": 42}
+
+    # Appends are assigned to lists, removals drop their assignments
+    monkeypatch.setattr(vector_store, "get_embeddings", lambda texts, **kw: np.ones((len(texts), DIM)))
+    loaded.add_texts(["new"], metadatas=[{"row": "new"}])
+    assert len(loaded.ann.assignments) == 1001
+    loaded.remove_where(lambda m: m["row"] in (0, 1, 2))
+    assert len(loaded.ann.assignments) == len(loaded) == 998
+
+
+def test_recall_at_k():
+    assert recall_at_k([[1, 2, 3, 4]], [[4, 3, 9, 8]]) == 0.5
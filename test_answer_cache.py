@@ -0,0 +1,165 @@
+"""
+Tests for the semantic answer cache and its use in RAGSystem.query.
+"""
+
+import asyncio
+
+import numpy as np
+import pytest
+
+import lib.answer_cache as answer_cache
+from lib.answer_cache import AnswerCache
+from lib.http_client import AsyncHTTPClient, HTTPClient, set_async_client, set_client
+from lib.rag_system import RAGSystem
+from lib.vector_store import SimpleVectorStore
+from test_streaming import PIECES, StreamingHandler
+
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_hit_needs_similar_question_and_same_chunks():
+    cache = AnswerCache(threshold=0.9)
+    cache.store(unit(1, 0, 0), [3, 1], "answer", latency=2.0)
+
+    assert cache.lookup(unit(1, 0.1, 0), [3, 1]) == "answer"
+    assert cache.lookup(unit(0, 1, 0), [3, 1]) is None  # different question
+    assert cache.lookup(unit(1, 0, 0), [1, 3]) is None  # different context
+    assert cache.lookup(unit(1, 0, 0), [3, 1], namespace="gpt-4") is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 3
+    assert stats["hit_rate"] == pytest.approx(0.25)
+    assert stats["latency_saved"] == pytest.approx(2.0)
+
+
+def test_best_match_wins():
+    cache = AnswerCache(threshold=0.5)
+    cache.store(unit(1, 1, 0), [0], "near")
+    cache.store(unit(1, 0.1, 0), [0], "nearest")
+
+    assert cache.lookup(unit(1, 0, 0), [0]) == "nearest"
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache = AnswerCache(ttl=60)
+    cache.store(unit(1, 0), [0], "answer")
+
+    now[0] += 30
+    assert cache.lookup(unit(1, 0), [0]) == "answer"
+    now[0] += 31
+    assert cache.lookup(unit(1, 0), [0]) is None
+    assert cache.stats()["expirations"] == 1
+    assert len(cache) == 0
+
+
+def test_lru_eviction():
+    cache = AnswerCache(max_entries=2)
+    cache.store(unit(1, 0), [0], "a")
+    cache.store(unit(1, 0), [1], "b")
+    cache.lookup(unit(1, 0), [0])  # "a" is now the most recently used
+    cache.store(unit(1, 0), [2], "c")
+
+    assert cache.lookup(unit(1, 0), [1]) is None
+    assert cache.lookup(unit(1, 0), [0]) == "a"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_new_build_invalidates():
+    cache = AnswerCache()
+    cache.store(unit(1, 0), [0], "answer", build_id="build-1")
+
+    assert cache.lookup(unit(1, 0), [0], build_id="build-1") == "answer"
+    assert cache.lookup(unit(1, 0), [0], build_id="build-2") is None
+    assert len(cache) == 0
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.delenv("RAG_ANSWER_CACHE", raising=False)
+    assert answer_cache.answer_cache_from_env() is None
+
+    monkeypatch.setenv("RAG_ANSWER_CACHE", "on")
+    monkeypatch.setenv("RAG_ANSWER_CACHE_THRESHOLD", "0.8")
+    cache = answer_cache.answer_cache_from_env()
+    assert cache.threshold == 0.8
+
+
+@pytest.fixture
+def rag(http_server, tmp_path):
+    server = http_server(StreamingHandler)
+    set_client(HTTPClient(base_url=server.base_url, api_key="test"))
+    store = SimpleVectorStore()
+    store.add_texts(["Embeddings are vectors.", "Chunking splits documents."])
+    store.save(str(tmp_path / "index"))
+
+    rag = RAGSystem(str(tmp_path / "index"), answer_cache=AnswerCache(threshold=0.99))
+    rag.server = server
+    yield rag
+    set_client(None)
+
+
+def llm_calls(rag):
+    return sum("messages" in body for body in rag.server.requests)
+
+
+def test_query_reuses_cached_answer(rag):
+    first = rag.query("What are embeddings?")
+    second = rag.query("What are embeddings?")
+
+    assert first == second == "".join(PIECES)
+    assert llm_calls(rag) == 1
+    assert rag.answer_cache.stats()["hits"] == 1
+    assert rag.answer_cache.stats()["latency_saved"] > 0
+
+
+def test_cached_answers_follow_chunks_not_rows(rag):
+    store = rag.store
+    rag.query("What are embeddings?")
+    vectors = np.array(store.embeddings)
+
+    # Same id, new text
+    store.upsert([store.ids[0]], ["Embeddings are lists of numbers."], embeddings=vectors[:1])
+    rag.query("What are embeddings?")
+    assert llm_calls(rag) == 2
+
+    # Same rows and build id, different chunks
+    store.remove_where(lambda m: True)
+    store.add_texts(["Embeddings are points.", "Chunking cuts documents."], embeddings=vectors)
+    rag.query("What are embeddings?")
+    rag.query("What are embeddings?")
+    assert llm_calls(rag) == 3 and rag.answer_cache.stats()["hits"] == 1
+
+
+def test_streamed_answer_is_cached(rag):
+    assert list(rag.query("What are embeddings?", stream=True)) == PIECES
+    assert list(rag.query("What are embeddings?", stream=True)) == ["".join(PIECES)]
+    assert rag.query("What are embeddings?") == "".join(PIECES)
+    assert llm_calls(rag) == 1
+
+
+def test_cache_disabled(rag):
+    rag.answer_cache = None
+    rag.query("What are embeddings?")
+    rag.query("What are embeddings?")
+    assert llm_calls(rag) == 2
+
+
+def test_aquery_reuses_cached_answer(rag):
+    async def main():
+        client = AsyncHTTPClient(base_url=rag.server.base_url, api_key="test")
+        set_async_client(client)
+        try:
+            first = await rag.aquery("What are embeddings?")
+            streamed = [p async for p in await rag.aquery("What are embeddings?", stream=True)]
+            return first, streamed
+        finally:
+            await client.aclose()
+
+    first, streamed = asyncio.run(main())
+    assert first == "".join(PIECES)
+    assert streamed == [first]
+    assert llm_calls(rag) == 1
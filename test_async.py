@@ -0,0 +1,149 @@
+"""
+Tests for the asyncio pipeline (aget_embeddings, asearch, aquery, acompare)
+against a local stub of the OpenRouter API.
+"""
+
+import asyncio
+import json
+import time
+from http.server import BaseHTTPRequestHandler
+
+import numpy as np
+import pytest
+
+import lib.embedding as embedding
+from lib.http_client import APIError, AsyncHTTPClient, HTTPClient, set_async_client, set_client
+from lib.rag_system import RAGSystem
+from lib.vector_store import SimpleVectorStore
+from test_embedding import stub_vector
+
+LLM_DELAY = 0.3
+
+
+class StubAPIHandler(BaseHTTPRequestHandler):
+    """/embeddings returns stub vectors; /chat/completions answers slowly."""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((self.path, body))
+
+        if self.path.endswith("/embeddings"):
+            inputs = body["input"]
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            data = [{"index": i, "embedding": stub_vector(t)} for i, t in enumerate(inputs)]
+            payload = {"data": data[::-1]}
+        else:
+            time.sleep(LLM_DELAY)
+            prompt = body["messages"][-1]["content"]
+            payload = {"choices": [{"message": {"content": f"{len(prompt)} chars"}}]}
+
+        raw = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, *args):
+        pass
+
+
+class FlakyHandler(StubAPIHandler):
+    """Fails the first request with 503, then behaves like StubAPIHandler."""
+
+    def do_POST(self):
+        if not getattr(self.server, "failed", False):
+            self.server.failed = True
+            self.rfile.read(int(self.headers["Content-Length"]))
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        super().do_POST()
+
+
+def run(server, coro_fn):
+    """Run ``coro_fn()`` on a fresh loop whose async client targets ``server``."""
+
+    async def main():
+        client = AsyncHTTPClient(base_url=server.base_url, api_key="test", backoff_base=0.01)
+        set_async_client(client)
+        try:
+            return await coro_fn()
+        finally:
+            await client.aclose()
+
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def api_server(http_server):
+    server = http_server(StubAPIHandler)
+    set_client(HTTPClient(base_url=server.base_url, api_key="test", backoff_base=0.01))
+    yield server
+    set_client(None)
+
+
+def test_aget_embeddings_keeps_order_across_batches(api_server):
+    texts = [f"text {i}" for i in range(10)]
+    vectors = run(api_server, lambda: embedding.aget_embeddings(texts, batch_size=3))
+
+    assert vectors.shape == (10, 8)
+    np.testing.assert_allclose(vectors, [stub_vector(t) for t in texts])
+    assert len(api_server.requests) == 4
+
+
+def test_aget_embedding_retries(http_server):
+    server = http_server(FlakyHandler)
+    vector = run(server, lambda: embedding.aget_embedding("hello"))
+
+    np.testing.assert_allclose(vector, stub_vector("hello"))
+    assert len(server.requests) == 1  # the 503 is not recorded
+
+
+def test_async_client_raises_api_error(http_server):
+    from test_embedding import FailingHandler
+
+    server = http_server(FailingHandler)
+
+    async def call():
+        client = AsyncHTTPClient(base_url=server.base_url, max_retries=1, backoff_base=0.01)
+        try:
+            await client.post_json("/embeddings", {"input": "x"})
+        finally:
+            await client.aclose()
+
+    with pytest.raises(APIError) as info:
+        asyncio.run(call())
+    assert info.value.status == 503
+
+
+def test_asearch_matches_search(api_server):
+    store = SimpleVectorStore()
+    store.add_texts(["alpha", "beta", "gamma", "delta"])
+
+    expected = store.search("alpha", top_k=2)
+    found = run(api_server, lambda: store.asearch("alpha", top_k=2))
+    batch = run(api_server, lambda: store.asearch_batch(["alpha", "gamma"], top_k=2))
+
+    assert [r["text"] for r in found] == [r["text"] for r in expected]
+    assert [r["text"] for r in batch[0]] == [r["text"] for r in expected]
+    assert batch[1][0]["text"] == "gamma"
+
+
+def test_acompare_runs_both_answers_concurrently(api_server, tmp_path, capsys):
+    store = SimpleVectorStore()
+    store.add_texts(["alpha", "beta", "gamma"])
+    store.save(str(tmp_path / "index"))
+    rag = RAGSystem(str(tmp_path / "index"))
+
+    start = time.perf_counter()
+    without, with_rag = run(api_server, lambda: rag.acompare("alpha?", top_k=2))
+    elapsed = time.perf_counter() - start
+
+    question_len = len("alpha?")
+    assert without == f"{question_len} chars"
+    assert int(with_rag.split()[0]) > question_len  # the prompt carries context
+    assert elapsed < 2 * LLM_DELAY
+    assert "WITH RAG" in capsys.readouterr().out
@@ -0,0 +1,83 @@
+"""
+Tests for the offline benchmark harness.
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+import benchmark
+from benchmark import FakeEmbedder, compare, parse_size
+from lib.index_format import read_manifest
+from lib.vector_store import SimpleVectorStore
+
+
+def test_parse_size():
+    assert [parse_size(s) for s in ["1k", "100K", "1m", "2500", " 1.5k"]] == [
+        1000, 100_000, 1_000_000, 2500, 1500,
+    ]
+
+
+def test_fake_embedder_is_deterministic_and_similarity_aware():
+    a, b = FakeEmbedder(dim=64), FakeEmbedder(dim=64)
+    texts = ["alpha beta gamma", "alpha beta delta", "omega psi chi", ""]
+    vectors = a.embed(texts)
+
+    np.testing.assert_array_equal(vectors, b.embed(texts))
+    assert vectors.shape == (4, 64) and not vectors[3].any()
+    unit = vectors[:3] / np.linalg.norm(vectors[:3], axis=1, keepdims=True)
+    assert unit[0] @ unit[1] > unit[0] @ unit[2]
+
+
+def test_synthetic_paragraphs_become_one_chunk_each():
+    paragraphs, topics = benchmark.synthetic_paragraphs(1200)
+    lengths = [len(p) for p in paragraphs]
+    assert len(paragraphs) == len(topics) == 1200
+    assert max(lengths) <= benchmark.CHUNK_SIZE < 2 * min(lengths)
+    assert paragraphs == benchmark.synthetic_paragraphs(1200)[0]
+
+
+def test_run_size_reports_every_backend(tmp_path):
+    report = benchmark.run_size(
+        300, str(tmp_path), dim=32, n_queries=20, startup_runs=0, shards=2
+    )
+
+    assert report["chunks"] == 300
+    assert report["build"]["chunks_per_s"] > 0 and report["build"]["index_mb"] > 0
+    assert set(report["search"]) == set(benchmark.BACKENDS) | {"lexical", "hybrid", "sharded"}
+    for name, stats in report["search"].items():
+        assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"]
+        assert stats["qps"] > 0 and stats["batch_qps"] > 0
+    assert 0 < report["search"]["ivf"]["recall"] <= 1
+    assert report["search"]["int8"]["recall"] > 0.9
+    assert report["search"]["sharded"]["recall"] == 1
+    assert report["search"]["sharded"]["shards"] == 2
+    json.dumps(report)
+
+    # The index records the fake embedder, so it reloads without being told
+    saved = str(tmp_path / "saved")
+    assert read_manifest(saved)["embedder"] == {"backend": "benchmark:FakeEmbedder", "dim": 32}
+    store = SimpleVectorStore()
+    store.load(saved)
+    assert type(store.embedder).__name__ == "FakeEmbedder" and store.embedder.dim == 32
+
+
+def test_compare_flags_regressions_in_the_right_direction():
+    baseline = {"1k": {"build": {"seconds": 10.0, "chunks_per_s": 100.0},
+                       "search": {"exact": {"p95_ms": 2.0, "qps": 500.0, "recall": 1.0}}}}
+    same = json.loads(json.dumps(baseline))
+    assert compare(same, baseline) == []
+
+    worse = json.loads(json.dumps(baseline))
+    worse["1k"]["build"]["seconds"] = 20.0
+    worse["1k"]["search"]["exact"]["qps"] = 100.0
+    worse["1k"]["search"]["exact"]["p95_ms"] = 2.3  # within the noise floor
+    assert [name for name, _, _ in compare(worse, baseline, tolerance=0.25)] == [
+        "1k.build.seconds", "1k.search.exact.qps",
+    ]
+
+    better = json.loads(json.dumps(baseline))
+    better["1k"]["build"]["seconds"] = 1.0
+    better["1k"]["search"]["exact"]["qps"] = 5000.0
+    assert compare(better, baseline) == []
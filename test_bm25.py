@@ -0,0 +1,129 @@
+"""
+Tests for BM25 lexical search and hybrid retrieval (offline).
+"""
+
+import numpy as np
+import pytest
+
+import lib.vector_store as vector_store
+from lib.bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+from lib.vector_store import SimpleVectorStore
+
+
+DOCS = [
+    "The connection failed with error ERR_CONN-503 after a timeout.",
+    "Embeddings map text to vectors that capture meaning.",
+    "Vector databases index embeddings for fast similarity search.",
+    "Chunking splits long documents into overlapping pieces.",
+    "Retry the request when the server returns HTTP 503.",
+]
+
+
+@pytest.fixture
+def store(fake_embedder):
+    s = SimpleVectorStore()
+    s.add_texts(DOCS, metadatas=[{"source": f"doc{i}.txt"} for i in range(len(DOCS))])
+    s.build_lexical()
+    return s
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    """Fail the test if anything tries to embed."""
+
+    def no_network(*args, **kwargs):
+        raise AssertionError("lexical search must not embed the query")
+
+    monkeypatch.setattr(vector_store, "get_embedding", no_network)
+    monkeypatch.setattr(vector_store, "get_embeddings", no_network)
+
+
+def test_tokenize_keeps_compounds_and_parts():
+    assert tokenize("Got ERR_CONN-503, see v1.2") == [
+        "got", "err_conn-503", "err", "conn", "503", "see", "v1.2", "v1", "2",
+    ]
+
+
+def test_bm25_ranks_rare_exact_terms_first():
+    index = BM25Index()
+    index.add(DOCS)
+
+    rows, scores = index.search("err_conn-503", top_k=3)
+    assert rows[0] == 0
+    assert list(scores) == sorted(scores, reverse=True)
+
+    rows, _ = index.search("503", top_k=5)
+    assert set(rows) == {0, 4}
+    assert len(index.search("nothing matches", top_k=3)[0]) == 0
+
+
+def test_bm25_scores_match_formula():
+    index = BM25Index(k1=1.2, b=0.5)
+    index.add(["a b", "a a c", "c"])
+
+    n, avg = 3, 2.0
+    idf = np.log(1 + (n - 2 + 0.5) / (2 + 0.5))
+    expected = [
+        idf * 1 * 2.2 / (1 + 1.2 * (1 - 0.5 + 0.5 * 2 / avg)),
+        idf * 2 * 2.2 / (2 + 1.2 * (1 - 0.5 + 0.5 * 3 / avg)),
+        0.0,
+    ]
+    np.testing.assert_allclose(index.scores("a"), expected, rtol=1e-5)
+
+
+def test_lexical_search_needs_no_embedding(store, offline):
+    results = store.search("ERR_CONN-503 timeout", top_k=2, mode="lexical")
+    assert results[0]["metadata"]["source"] == "doc0.txt"
+    assert results[0]["id"] == 0
+
+    batch = store.search_batch(["embeddings", "chunking documents"], top_k=1, mode="lexical")
+    assert [r[0]["id"] for r in batch] == [1, 3]
+
+
+def test_hybrid_fuses_dense_and_lexical(store):
+    dense = store.search(DOCS[2], top_k=3)
+    lexical = store.search("503", top_k=3, mode="lexical")
+    hybrid = store.search("503", top_k=3, mode="hybrid")
+
+    assert dense[0]["id"] == 2
+    assert {r["id"] for r in lexical} == {0, 4}
+    assert {0, 4} <= {r["id"] for r in hybrid}
+    assert all(r["score"] <= 2 / 61 for r in hybrid)
+
+
+def test_reciprocal_rank_fusion():
+    rows, scores = reciprocal_rank_fusion([np.array([1, 2, 3]), np.array([3, 1])], top_k=2, k=60)
+    assert list(rows) == [1, 3]
+    assert scores[0] == pytest.approx(1 / 61 + 1 / 62)
+
+
+def test_modes_need_lexical_index(fake_embedder):
+    s = SimpleVectorStore()
+    s.add_texts(DOCS)
+    with pytest.raises(ValueError, match="build_lexical"):
+        s.search("503", mode="lexical")
+    with pytest.raises(ValueError, match="Unknown search mode"):
+        s.search("503", mode="fuzzy")
+
+
+def test_lexical_index_follows_adds_and_removals(store, offline, fake_embedder, monkeypatch):
+    monkeypatch.setattr(vector_store, "get_embeddings", fake_embedder)
+    store.add_texts(["Quantization compresses vectors to int8."], metadatas=[{"source": "new.txt"}])
+    assert store.search("int8", top_k=1, mode="lexical")[0]["metadata"]["source"] == "new.txt"
+
+    store.remove_where(lambda m: m["source"] in ("doc0.txt", "doc1.txt"))
+    results = store.search("503", top_k=5, mode="lexical")
+    assert [r["metadata"]["source"] for r in results] == ["doc4.txt"]
+    assert store.chunks[results[0]["id"]] == DOCS[4]
+
+
+def test_lexical_index_is_saved_and_loaded(store, tmp_path, offline):
+    store.save(str(tmp_path / "index"))
+
+    loaded = SimpleVectorStore()
+    loaded.load(str(tmp_path / "index"))
+
+    assert loaded.lexical is not None
+    for query in ["503", "embeddings search", "ERR_CONN-503"]:
+        expected = store.search(query, top_k=3, mode="lexical")
+        assert loaded.search(query, top_k=3, mode="lexical") == expected
@@ -0,0 +1,164 @@
+"""
+Offline tests for build_index (embeddings are faked, no network).
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+import lib.vector_store as vector_store
+from build_index import build_index
+from lib.vector_store import SimpleVectorStore
+
+
+@pytest.fixture
+def embedded(monkeypatch):
+    """Fake get_embeddings that records every text it is asked to embed."""
+    calls = []
+
+    def fake_embeddings(texts, model=None, batch_size=64):
+        calls.extend(texts)
+        rows = []
+        for text in texts:
+            seed = sum(ord(c) * (i + 1) for i, c in enumerate(text)) % (2**32)
+            rows.append(np.random.default_rng(seed).normal(size=16))
+        return np.array(rows)
+
+    monkeypatch.setattr(vector_store, "get_embeddings", fake_embeddings)
+    monkeypatch.setattr("build_index.get_embeddings", fake_embeddings)
+    monkeypatch.setattr(vector_store, "get_embedding", lambda text: fake_embeddings([text])[0])
+    return calls
+
+
+@pytest.fixture
+def kb(tmp_path):
+    kb = tmp_path / "kb"
+    kb.mkdir()
+    for name, text in [("a.txt", "alpha document"), ("b.txt", "beta document"), ("c.txt", "gamma")]:
+        (kb / name).write_text(text, encoding="utf-8")
+    return kb
+
+
+def sources(store):
+    return sorted(m["source"] for m in store.metadata)
+
+
+def test_full_build_records_fingerprints(kb, tmp_path, embedded):
+    store = build_index(kb, tmp_path / "index")
+
+    assert sources(store) == ["a.txt", "b.txt", "c.txt"]
+    assert set(store.manifest["files"]) == {"a.txt", "b.txt", "c.txt"}
+    assert store.manifest["files"]["a.txt"]["size"] == len("alpha document")
+    assert store.manifest["changes"]["added"] == ["a.txt", "b.txt", "c.txt"]
+    assert store.search("beta", top_k=1, mode="lexical")[0]["metadata"]["source"] == "b.txt"
+
+
+def test_incremental_build_only_embeds_changes(kb, tmp_path, embedded):
+    index = tmp_path / "index"
+    build_index(kb, index)
+    embedded.clear()
+
+    (kb / "b.txt").write_text("beta document, revised", encoding="utf-8")
+    os.remove(kb / "c.txt")
+    (kb / "d.txt").write_text("delta document", encoding="utf-8")
+    os.utime(kb / "a.txt")  # touched but not changed
+
+    store = build_index(kb, index, incremental=True)
+
+    assert sorted(embedded) == ["beta document, revised", "delta document"]
+    assert store.manifest["changes"] == {
+        "added": ["d.txt"],
+        "modified": ["b.txt"],
+        "deleted": ["c.txt"],
+        "unchanged": ["a.txt"],
+    }
+
+    reloaded = SimpleVectorStore()
+    reloaded.load(index)
+    assert sources(reloaded) == ["a.txt", "b.txt", "d.txt"]
+    assert "beta document, revised" in list(reloaded.chunks)
+    embedded.clear()
+    assert reloaded.search("delta document", top_k=1)[0]["metadata"]["source"] == "d.txt"
+
+
+def test_incremental_build_noop(kb, tmp_path, embedded):
+    index = tmp_path / "index"
+    build_index(kb, index)
+    build_id = SimpleVectorStore()
+    build_id.load(index)
+    embedded.clear()
+
+    store = build_index(kb, index, incremental=True)
+
+    assert embedded == []
+    assert store.manifest["build_id"] == build_id.manifest["build_id"]
+    assert store.manifest["changes"]["unchanged"] == ["a.txt", "b.txt", "c.txt"]
+
+
+def test_build_chunks_documents_with_offsets(kb, tmp_path, embedded):
+    text = " ".join(f"Sentence number {i} is here." for i in range(40))
+    (kb / "long.txt").write_text(text, encoding="utf-8")
+
+    store = build_index(kb, tmp_path / "index", chunk_strategy="sentence", chunk_size=120, chunk_overlap=30)
+
+    long_chunks = [(c, m) for c, m in zip(store.chunks, store.metadata) if m["source"] == "long.txt"]
+    assert len(long_chunks) > 1
+    assert [m["chunk"] for _, m in long_chunks] == list(range(len(long_chunks)))
+    for chunk, meta in long_chunks:
+        assert len(chunk) <= 120
+        assert text[meta["start"] : meta["end"]] == chunk
+
+
+def test_incremental_rebuilds_when_chunking_changes(kb, tmp_path, embedded):
+    index = tmp_path / "index"
+    build_index(kb, index, chunk_size=1000)
+    embedded.clear()
+
+    store = build_index(kb, index, incremental=True, chunk_size=500)
+
+    assert len(embedded) == 3
+    assert store.manifest["chunking"]["chunk_size"] == 500
+
+
+def test_parallel_build_matches_sequential(kb, tmp_path, embedded):
+    for i in range(6):
+        text = " ".join(f"Document {i} sentence {j}." for j in range(30))
+        (kb / f"doc{i}.txt").write_text(text, encoding="utf-8")
+
+    sequential = build_index(kb, tmp_path / "seq", chunk_size=100, chunk_overlap=20, batch_size=4)
+    parallel = build_index(
+        kb, tmp_path / "par", chunk_size=100, chunk_overlap=20, batch_size=4, workers=2, concurrency=3
+    )
+
+    assert list(parallel.chunks) == list(sequential.chunks)
+    assert list(parallel.metadata) == list(sequential.metadata)
+    np.testing.assert_array_equal(parallel.embeddings, sequential.embeddings)
+    assert parallel.manifest["throughput"]["docs"] == 9
+    assert parallel.manifest["throughput"]["tokens_per_s"] > 0
+
+
+def test_interrupted_build_resumes_from_checkpoint(kb, tmp_path, embedded, monkeypatch):
+    index = tmp_path / "index"
+    real = build_index.__globals__["get_embeddings"]
+
+    def crash_on_gamma(texts, model=None, batch_size=64):
+        if "gamma" in texts:
+            raise RuntimeError("connection lost")
+        return real(texts, batch_size=batch_size)
+
+    monkeypatch.setattr("build_index.get_embeddings", crash_on_gamma)
+    with pytest.raises(RuntimeError):
+        build_index(kb, index, batch_size=1, checkpoint_every=0)
+    assert os.path.isdir(f"{index}.partial")
+    assert not os.path.exists(index)
+
+    monkeypatch.setattr("build_index.get_embeddings", real)
+    embedded.clear()
+    store = build_index(kb, index, batch_size=1, checkpoint_every=0)
+
+    assert embedded == ["gamma"]
+    assert sources(store) == ["a.txt", "b.txt", "c.txt"]
+    assert set(store.manifest["files"]) == {"a.txt", "b.txt", "c.txt"}
+    assert not os.path.exists(f"{index}.partial")
+    assert sorted(os.listdir(tmp_path)) == ["index", "index.wal.lock", "kb"]
@@ -0,0 +1,83 @@
+"""
+Tests for lib.chunking.
+"""
+
+import pytest
+
+from lib.chunking import STRATEGIES, chunk_text, iter_chunks
+
+TEXT = (
+    "Chunking splits documents. It keeps chunks small!\n"
+    "Overlap preserves context across boundaries? Yes.\n\n"
+    "A second paragraph follows here, with a much longer sentence that goes on "
+    "for quite a while so that it has to be split on words instead of sentences.\n"
+) * 3
+
+
+@pytest.mark.parametrize("strategy", sorted(STRATEGIES))
+def test_chunks_respect_size_and_offsets(strategy):
+    chunks = list(chunk_text(TEXT, strategy, chunk_size=80, overlap=20))
+
+    assert len(chunks) > 3
+    for chunk in chunks:
+        assert 0 < len(chunk.text) <= 80
+        assert TEXT[chunk.start : chunk.end] == chunk.text
+        assert chunk.text == chunk.text.strip()
+    # Chunks move forward through the document and cover all of it
+    starts = [c.start for c in chunks]
+    assert starts == sorted(starts)
+    assert chunks[-1].end == len(TEXT.rstrip())
+
+
+def test_fixed_size_overlap():
+    text = "".join(chr(ord("a") + i % 26) for i in range(100))
+    chunks = list(chunk_text(text, "fixed", chunk_size=30, overlap=10))
+
+    assert [c.start for c in chunks] == [0, 20, 40, 60, 80]
+    assert chunks[0].text[-10:] == chunks[1].text[:10]
+
+
+def test_sentence_chunks_keep_sentences_whole():
+    text = "One two three. Four five six. Seven eight nine. Ten eleven twelve."
+    chunks = [c.text for c in chunk_text(text, "sentence", chunk_size=40, overlap=17)]
+
+    assert chunks == [
+        "One two three. Four five six.",
+        "Four five six. Seven eight nine.",
+        "Seven eight nine. Ten eleven twelve.",
+    ]
+
+
+def test_recursive_prefers_paragraph_boundaries():
+    text = "First paragraph is short.\n\nSecond paragraph is also short."
+    chunks = [c.text for c in chunk_text(text, "recursive", chunk_size=40, overlap=0)]
+
+    assert chunks == ["First paragraph is short.", "Second paragraph is also short."]
+
+
+def test_small_document_is_one_chunk():
+    assert [c.text for c in chunk_text("  tiny doc \n", "recursive")] == ["tiny doc"]
+
+
+def test_iter_chunks_is_lazy_and_adds_metadata():
+    def documents():
+        yield "a.txt", "Alpha text."
+        raise AssertionError("second document should not be read yet")
+
+    text, metadata = next(iter_chunks(documents()))
+    assert text == "Alpha text."
+    assert metadata == {"source": "a.txt", "chunk": 0, "start": 0, "end": 11}
+
+
+def test_invalid_settings():
+    with pytest.raises(ValueError):
+        list(chunk_text("text", "nope"))
+    with pytest.raises(ValueError):
+        list(chunk_text("text", "fixed", chunk_size=10, overlap=10))
+
+
+@pytest.mark.parametrize("strategy", sorted(STRATEGIES))
+@pytest.mark.parametrize("overlap", [10, 25])
+def test_overlap_must_be_smaller_than_chunk_size(strategy, overlap):
+    with pytest.raises(ValueError, match="overlap must be smaller"):
+        list(chunk_text(TEXT, strategy, chunk_size=10, overlap=overlap))
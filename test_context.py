@@ -0,0 +1,127 @@
+"""
+Tests for token-budgeted context assembly (offline).
+"""
+
+import numpy as np
+import pytest
+
+import lib.context as context
+from lib.context import ContextBuilder, count_tokens, truncate_to_tokens
+from lib.http_client import HTTPClient, set_client
+from lib.rag_system import RAGSystem
+from lib.vector_store import SimpleVectorStore
+from test_streaming import StreamingHandler
+
+
+def result(i, text, score=1.0):
+    return {"id": i, "text": text, "score": score, "metadata": {"source": f"doc{i}.txt"}}
+
+
+def test_count_tokens_approximation():
+    assert count_tokens("") == 0
+    assert count_tokens("The cat sat.") == 4
+    assert count_tokens("tokenization") == 3
+    assert count_tokens("word " * 100) == 100
+
+
+def test_truncate_to_tokens():
+    text = "one two three four five"
+    assert truncate_to_tokens(text, 4) == "one two three"  # "three" is 2 tokens
+    assert truncate_to_tokens(text, 100) == text
+    assert count_tokens(truncate_to_tokens("x " * 500, 40)) == 40
+
+
+def test_budget_is_filled_in_rank_order():
+    results = [result(i, "word " * 100) for i in range(5)]
+    builder = ContextBuilder(max_tokens=250, dedup_threshold=None)
+
+    selected, report = builder.build(results, top_k=5)
+
+    assert [r["id"] for r in selected] == [0, 1, 2]
+    assert selected[2]["truncated"] and count_tokens(selected[2]["text"]) == 50
+    assert "truncated" not in selected[0]
+    assert report.tokens_sent == 250
+    assert report.tokens_saved == 250
+    assert builder.stats() == {"tokens_sent": 250, "tokens_saved": 250}
+
+
+def test_small_remainder_is_not_truncated_into():
+    results = [result(0, "word " * 90), result(1, "word " * 100), result(2, "short text")]
+    selected, report = ContextBuilder(max_tokens=100, dedup_threshold=None).build(results, top_k=3)
+
+    # 10 tokens left: too few for part of chunk 1, but chunk 2 fits whole
+    assert [r["id"] for r in selected] == [0, 2]
+    assert report.truncated == 0
+
+
+def test_near_duplicates_are_dropped():
+    results = [
+        result(0, "Embeddings map text to vectors."),
+        result(1, "Embeddings map text to vectors!"),
+        result(2, "Chunking splits long documents."),
+    ]
+    embeddings = np.array([[1, 0], [0.99, 0.05], [0, 1]], dtype=np.float32)
+
+    selected, report = ContextBuilder().build(results, top_k=2, embeddings=embeddings)
+    assert [r["id"] for r in selected] == [0, 2]
+    assert report.duplicates == 1
+
+    # Without embeddings the word overlap decides
+    selected, _ = ContextBuilder(dedup_threshold=0.9).build(results, top_k=2)
+    assert [r["id"] for r in selected] == [0, 2]
+
+
+def test_mmr_prefers_diverse_chunks():
+    results = [result(i, f"text {i}", score) for i, score in enumerate([0.9, 0.88, 0.7])]
+    embeddings = np.array([[1, 0.1], [1, 0.12], [0.2, 1]], dtype=np.float32)
+    query = np.array([1, 0.1], dtype=np.float32)
+
+    plain, _ = ContextBuilder(dedup_threshold=None).build(results, top_k=2, embeddings=embeddings)
+    assert [r["id"] for r in plain] == [0, 1]
+
+    mmr = ContextBuilder(dedup_threshold=None, mmr_lambda=0.3)
+    selected, _ = mmr.build(results, top_k=2, embeddings=embeddings, query_vector=query)
+    assert [r["id"] for r in selected] == [0, 2]
+
+    # Falls back to the retrieval scores for relevance
+    selected, _ = mmr.build(results, top_k=2, embeddings=embeddings)
+    assert [r["id"] for r in selected] == [0, 2]
+
+
+def test_builder_validation_and_env(monkeypatch):
+    with pytest.raises(ValueError):
+        ContextBuilder(max_tokens=0)
+    with pytest.raises(ValueError):
+        ContextBuilder(mmr_lambda=1.5)
+    assert ContextBuilder(dedup_threshold=None).fetch_k(3) == 3
+    assert ContextBuilder().fetch_k(3) == 6
+
+    monkeypatch.setenv("RAG_CONTEXT_TOKENS", "500")
+    monkeypatch.setenv("RAG_CONTEXT_DEDUP", "off")
+    monkeypatch.setenv("RAG_CONTEXT_MMR", "0.7")
+    builder = context.context_builder_from_env()
+    assert (builder.max_tokens, builder.dedup_threshold, builder.mmr_lambda) == (500, None, 0.7)
+
+
+def test_query_prompt_respects_budget(http_server, tmp_path):
+    server = http_server(StreamingHandler)
+    set_client(HTTPClient(base_url=server.base_url, api_key="test"))
+    try:
+        store = SimpleVectorStore()
+        store.add_texts(
+            ["Embeddings are vectors. " * 50, "Embeddings are vectors. " * 50, "Chunking. " * 10],
+            metadatas=[{"source": f"doc{i}.txt"} for i in range(3)],
+        )
+        store.save(str(tmp_path / "index"))
+
+        builder = ContextBuilder(max_tokens=120)
+        rag = RAGSystem(str(tmp_path / "index"), answer_cache=False, context=builder)
+        rag.query("What are embeddings?", top_k=2)
+    finally:
+        set_client(None)
+
+    prompt = [b for b in server.requests if "messages" in b][-1]["messages"][0]["content"]
+    assert prompt.count("[Source") == 2
+    assert "doc1.txt" not in prompt  # identical to doc0.txt
+    assert builder.tokens_sent <= 120
+    assert builder.tokens_saved > 0
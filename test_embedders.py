@@ -0,0 +1,164 @@
+"""
+Tests for the local embedding backends and how stores record them (no network).
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+import lib.embedders as embedders
+import lib.vector_store as vector_store
+from build_index import build_index
+from lib.embedders import (
+    Embedder,
+    HashingEmbedder,
+    PrecomputedEmbedder,
+    embedder_from_state,
+    make_embedder,
+    register_embedder,
+    save_precomputed,
+)
+from lib.vector_store import SimpleVectorStore
+
+TEXTS = [
+    "Chunking splits long documents into smaller pieces.",
+    "Overlapping chunks keep context across chunk boundaries.",
+    "Cats and dogs are popular pets for apartments.",
+]
+
+
+@pytest.fixture
+def kb(tmp_path):
+    kb = tmp_path / "kb"
+    kb.mkdir()
+    for name, text in [("a.txt", "alpha document"), ("b.txt", "beta document"), ("c.txt", "gamma")]:
+        (kb / name).write_text(text, encoding="utf-8")
+    return kb
+
+
+@pytest.fixture
+def no_network(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("the remote embedder was called")
+
+    for name in ("get_embedding", "get_embeddings", "aget_embedding", "aget_embeddings"):
+        monkeypatch.setattr(vector_store, name, fail)
+    monkeypatch.setattr("build_index.get_embeddings", fail)
+
+
+def test_hashing_embedder_is_deterministic_and_batch_independent():
+    embedder = HashingEmbedder(dim=64)
+    vectors = embedder.embed(TEXTS + [""])
+
+    assert vectors.shape == (4, 64) and vectors.dtype == np.float32
+    np.testing.assert_allclose(np.linalg.norm(vectors[:3], axis=1), 1, rtol=1e-5)
+    assert not vectors[3].any()
+    alone = HashingEmbedder(dim=64).embed(TEXTS[1:2])[0]
+    np.testing.assert_allclose(alone, vectors[1], atol=1e-6)
+    # Shared words and n-grams ("chunk"/"chunks", "apartment"/"apartments") decide the ranking
+    queries = embedder.embed(["chunk boundaries overlap", "pets in an apartment"])
+    assert (queries @ vectors[:3].T).argmax(axis=1).tolist() == [1, 2]
+
+
+def test_fitted_idf_round_trips_through_state():
+    embedder = HashingEmbedder(dim=32).fit(iter(TEXTS * 3))
+    params, arrays = embedder.state()
+    assert embedder.fitted and params["idf"]
+
+    restored = embedder_from_state(json.loads(json.dumps(params)), arrays)
+    np.testing.assert_array_equal(restored.embed(TEXTS), embedder.embed(TEXTS))
+    assert not np.allclose(HashingEmbedder(dim=32).embed(TEXTS), embedder.embed(TEXTS))
+
+
+@pytest.mark.parametrize("suffix", [".npz", ".jsonl"])
+def test_precomputed_embedder(tmp_path, suffix):
+    vectors = np.arange(6, dtype=np.float32).reshape(3, 2)
+    path = str(tmp_path / f"vectors{suffix}")
+    if suffix == ".npz":
+        save_precomputed(path, TEXTS, vectors, model="some-model")
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            for text, vector in zip(TEXTS, vectors):
+                f.write(json.dumps({"text": text, "embedding": vector.tolist()}) + "\n")
+
+    embedder = PrecomputedEmbedder(path)
+    np.testing.assert_array_equal(embedder.embed(TEXTS[::-1]), vectors[::-1])
+    assert embedder.dim == 2
+    with pytest.raises(LookupError, match="1 of 2 texts have no precomputed vector"):
+        embedder.embed([TEXTS[0], "unknown"])
+
+
+def test_make_embedder_rejects_unknown_backends():
+    assert isinstance(make_embedder("hashing", dim=8), HashingEmbedder)
+    with pytest.raises(ValueError, match="Unknown embedder 'nope'"):
+        make_embedder("nope")
+
+
+class PluginEmbedder(HashingEmbedder):
+    backend = "test_embedders:PluginEmbedder"
+
+
+def test_embedder_subclasses_must_implement_embed_and_state():
+    class Incomplete(Embedder):
+        backend = "incomplete"
+
+        def embed(self, texts, batch_size=64):
+            return np.zeros((len(texts), 2), dtype=np.float32)
+
+    with pytest.raises(TypeError, match="abstract"):
+        Incomplete()
+    with pytest.raises(TypeError, match="not an Embedder subclass"):
+        register_embedder(dict)
+
+
+def test_loading_creates_only_registered_embedders(tmp_path, monkeypatch, no_network):
+    monkeypatch.setattr(embedders, "EMBEDDERS", dict(embedders.EMBEDDERS))
+    path = str(tmp_path / "index")
+    store = SimpleVectorStore(embedder=PluginEmbedder(dim=16))
+    store.add_texts(TEXTS)
+    store.save(path)
+
+    with pytest.raises(ValueError, match="not registered"):
+        SimpleVectorStore().load(path)
+    with pytest.raises(ValueError, match="not an Embedder subclass"):
+        embedder_from_state({"backend": "os:system"}, {}, import_embedder=True)
+
+    # Opting in imports (and registers) the class the index names
+    loaded = SimpleVectorStore()
+    loaded.load(path, import_embedder=True)
+    assert type(loaded.embedder) is PluginEmbedder and loaded.embedder.dim == 16
+    SimpleVectorStore().load(path)  # registered now
+    assert isinstance(make_embedder(PluginEmbedder.backend, dim=8), PluginEmbedder)
+
+
+def test_store_records_and_reuses_its_embedder(tmp_path, no_network):
+    store = SimpleVectorStore(embedder="hashing")
+    store.add_texts(TEXTS)
+    store.save(str(tmp_path / "index"))
+    assert store.manifest["embedder"]["backend"] == "hashing" and store.manifest["dim"] == 256
+
+    loaded = SimpleVectorStore()
+    loaded.load(str(tmp_path / "index"))
+    assert isinstance(loaded.embedder, HashingEmbedder)
+    assert loaded.search("chunk overlap", top_k=1)[0]["id"] == 1
+
+    with pytest.raises(ValueError, match="embedded with hashing"):
+        SimpleVectorStore(embedder=HashingEmbedder(dim=128)).load(str(tmp_path / "index"))
+    with pytest.raises(ValueError, match="Query embedding dimension 3 does not match"):
+        loaded.search("anything", query_vector=np.ones(3))
+
+
+def test_build_index_with_local_embedder(kb, tmp_path, no_network):
+    index = tmp_path / "index"
+    store = build_index(kb, index, embedder="hashing")
+    assert store.embedder.fitted
+    assert store.search("gamma", top_k=1)[0]["metadata"]["source"] == "c.txt"
+
+    (kb / "d.txt").write_text("delta document", encoding="utf-8")
+    store = build_index(kb, index, incremental=True, embedder=HashingEmbedder())
+    assert store.manifest["changes"]["added"] == ["d.txt"]
+    assert store.manifest["changes"]["unchanged"] == ["a.txt", "b.txt", "c.txt"]
+
+    store = build_index(kb, index, incremental=True, embedder=HashingEmbedder(dim=64))
+    assert len(store.manifest["changes"]["added"]) == 4 and store.embeddings.shape[1] == 64
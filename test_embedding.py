@@ -0,0 +1,184 @@
+"""
+Tests for lib.embedding against a local stub of the /embeddings endpoint.
+"""
+
+import json
+import multiprocessing
+from http.server import BaseHTTPRequestHandler
+
+import numpy as np
+import pytest
+
+import lib.embedding as embedding
+import lib.vector_store as vector_store
+from lib.embedding_cache import EmbeddingCache
+from lib.http_client import APIError, HTTPClient, set_client
+from lib.vector_store import SimpleVectorStore
+
+DIM = 8
+
+
+def stub_vector(text):
+    """Deterministic vector the stub server returns for ``text``."""
+    seed = sum(ord(c) * (i + 1) for i, c in enumerate(text)) % (2**32)
+    return np.random.default_rng(seed).normal(size=DIM).tolist()
+
+
+class StubEmbeddingHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(body)
+
+        inputs = body["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        # Reply out of order so callers must map results back by "index"
+        data = [
+            {"object": "embedding", "index": i, "embedding": stub_vector(text)}
+            for i, text in enumerate(inputs)
+        ][::-1]
+
+        payload = json.dumps({"object": "list", "data": data}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class FailingHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(503)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def use_server(server):
+    set_client(HTTPClient(base_url=server.base_url, api_key="test", backoff_base=0.01))
+
+
+@pytest.fixture
+def stub_server(http_server):
+    server = http_server(StubEmbeddingHandler)
+    use_server(server)
+    yield server
+    set_client(None)
+
+
+def test_get_embedding_single(stub_server):
+    vec = embedding.get_embedding("hello")
+    np.testing.assert_allclose(vec, stub_vector("hello"))
+    assert stub_server.requests[0]["input"] == "hello"
+
+
+def test_get_embeddings_batches_and_maps_by_index(stub_server):
+    texts = [f"text {i}" for i in range(10)]
+    matrix = embedding.get_embeddings(texts, batch_size=4)
+
+    assert matrix.shape == (10, DIM)
+    for text, row in zip(texts, matrix):
+        np.testing.assert_allclose(row, stub_vector(text))
+    assert [len(r["input"]) for r in stub_server.requests] == [4, 4, 2]
+
+
+def test_get_embeddings_respects_char_budget(stub_server):
+    texts = ["a" * 40, "b" * 40, "c" * 40, "d" * 100]
+    embedding.get_embeddings(texts, batch_size=64, max_batch_chars=90)
+
+    # Oversized inputs still go out, alone in their own request
+    assert [r["input"] for r in stub_server.requests] == [
+        ["a" * 40, "b" * 40],
+        ["c" * 40],
+        ["d" * 100],
+    ]
+
+
+def test_failures_raise_instead_of_zero_vectors(http_server):
+    use_server(http_server(FailingHandler))
+    try:
+        with pytest.raises(APIError) as excinfo:
+            embedding.get_embedding("hello")
+        assert excinfo.value.status == 503
+        with pytest.raises(APIError):
+            embedding.get_embeddings(["a", "b"])
+    finally:
+        set_client(None)
+
+
+def test_get_embeddings_empty(stub_server):
+    assert embedding.get_embeddings([]).shape[0] == 0
+    assert stub_server.requests == []
+
+
+def test_add_texts_uses_batched_requests(stub_server, monkeypatch):
+    monkeypatch.setattr(vector_store, "get_embedding", embedding.get_embedding)
+    monkeypatch.setattr(vector_store, "get_embeddings", embedding.get_embeddings)
+
+    store = SimpleVectorStore()
+    texts = [f"chunk {i}" for i in range(5)]
+    store.add_texts(texts, metadatas=[{"source": f"{i}.txt"} for i in range(5)], batch_size=2)
+
+    assert len(store) == 5
+    assert len(stub_server.requests) == 3
+    assert store.metadata[3] == {"source": "3.txt"}
+
+    results = store.search("chunk 3", top_k=1)
+    assert results[0]["text"] == "chunk 3"
+    assert results[0]["score"] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_cache_skips_repeat_requests(stub_server, tmp_path):
+    cache = EmbeddingCache(tmp_path / "cache.sqlite")
+
+    first = embedding.get_embedding("hello", cache=cache)
+    second = embedding.get_embedding("hello", cache=cache)
+    np.testing.assert_allclose(first, second, rtol=1e-6)
+    assert len(stub_server.requests) == 1
+
+    # Batched calls only send the texts the cache has not seen
+    embedding.get_embeddings(["hello", "world", "world"], cache=cache)
+    assert stub_server.requests[-1]["input"] == ["world"]
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 3
+
+
+def test_cache_is_keyed_by_model(stub_server, tmp_path):
+    cache = EmbeddingCache(tmp_path / "cache.sqlite")
+    embedding.get_embedding("hello", model="model-a", cache=cache)
+    embedding.get_embedding("hello", model="model-b", cache=cache)
+    assert len(stub_server.requests) == 2
+
+
+def test_cache_lru_eviction(tmp_path):
+    cache = EmbeddingCache(tmp_path / "cache.sqlite", max_entries=2)
+    cache.put("m", "a", np.ones(4))
+    cache.put("m", "b", np.ones(4))
+    assert cache.get("m", "a") is not None  # "a" is now most recently used
+    cache.put("m", "c", np.ones(4))
+
+    assert len(cache) == 2
+    assert cache.get("m", "b") is None
+    assert cache.get("m", "a") is not None
+
+
+def _write_from_child(path):
+    EmbeddingCache(path).put("m", "from child", np.arange(4))
+
+
+def test_cache_shared_between_processes(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    cache = EmbeddingCache(path)
+
+    child = multiprocessing.get_context("spawn").Process(target=_write_from_child, args=(path,))
+    child.start()
+    child.join(timeout=30)
+
+    assert child.exitcode == 0
+    np.testing.assert_array_equal(cache.get("m", "from child"), np.arange(4))
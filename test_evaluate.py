@@ -0,0 +1,111 @@
+"""
+Tests for the offline retrieval-quality evaluation harness.
+"""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+import benchmark
+import evaluate
+from evaluate import (
+    CachedEmbedder,
+    load_labels,
+    ndcg_at_k,
+    pareto_front,
+    ranked_sources,
+    recall_at_k,
+    reciprocal_rank,
+)
+from lib.embedders import DEFAULT_MODEL
+from lib.embedding_cache import EmbeddingCache
+
+
+def test_metrics():
+    ranked = ["b.txt", "a.txt", "c.txt"]
+    assert recall_at_k(ranked, {"a.txt": 1, "d.txt": 1}) == 0.5
+    assert reciprocal_rank(ranked, {"a.txt": 1}) == 0.5
+    assert reciprocal_rank(ranked, {"z.txt": 1}) == 0.0
+
+    assert ndcg_at_k(["a.txt", "b.txt"], {"a.txt": 1}, k=2) == 1.0
+    assert ndcg_at_k(["b.txt", "a.txt"], {"a.txt": 1}, k=2) == pytest.approx(1 / np.log2(3))
+    graded = {"a.txt": 2, "b.txt": 1}
+    assert ndcg_at_k(["b.txt", "a.txt"], graded, k=2) < ndcg_at_k(["a.txt", "b.txt"], graded, 2)
+
+
+def test_ranked_sources_keeps_first_occurrence():
+    results = [{"metadata": {"source": s}} for s in ["a.txt", "a.txt", "b.txt", "a.txt"]]
+    assert ranked_sources(results) == ["a.txt", "b.txt"]
+
+
+def test_load_labels(tmp_path):
+    path = tmp_path / "labels.jsonl"
+    path.write_text(
+        '{"query": "q1", "relevant": ["a.txt", "b.txt"]}\n\n'
+        '{"query": "q2", "relevant": {"a.txt": 2}}\n'
+        '{"query": "q3", "relevant": "c.txt"}\n'
+    )
+    assert load_labels(path) == [
+        ("q1", {"a.txt": 1, "b.txt": 1}),
+        ("q2", {"a.txt": 2}),
+        ("q3", {"c.txt": 1}),
+    ]
+
+    path.write_text('{"query": "q1", "relevant": []}\n')
+    with pytest.raises(ValueError, match="no relevant sources"):
+        load_labels(path)
+
+
+def test_bundled_labels_name_knowledge_base_files():
+    sources = {source for _, relevant in load_labels("eval_queries.jsonl") for source in relevant}
+    assert sources <= set(os.listdir("knowledge_base"))
+
+
+def test_pareto_front():
+    rows = [
+        {"recall": 0.9, "p50_ms": 2.0},
+        {"recall": 0.8, "p50_ms": 1.0},
+        {"recall": 0.7, "p50_ms": 1.5},  # slower and worse than row 1
+        {"recall": 0.9, "p50_ms": 3.0},  # as good as row 0 but slower
+    ]
+    assert pareto_front(rows) == [0, 1]
+
+
+def test_cached_embedder_never_calls_the_api(tmp_path):
+    cache = EmbeddingCache(tmp_path / "cache.sqlite")
+    cache.put_many(DEFAULT_MODEL, ["known"], [np.ones(4, dtype=np.float32)])
+    embedder = CachedEmbedder(cache)
+
+    np.testing.assert_array_equal(embedder.embed_one("known"), np.ones(4))
+    with pytest.raises(LookupError, match="1 of 2 texts are not in the embedding cache"):
+        embedder.embed(["known", "unknown"])
+
+
+def test_synthetic_sweep(tmp_path):
+    embedder = benchmark.FakeEmbedder(dim=32)
+    paragraphs, _ = benchmark.synthetic_paragraphs(300)
+    benchmark.write_corpus(str(tmp_path / "kb"), paragraphs)
+    queries, rows = benchmark.sample_queries(paragraphs, 20)
+    labelled = [(q, {benchmark.document_name(r): 1}) for q, r in zip(queries, rows)]
+
+    results = evaluate.sweep(
+        str(tmp_path / "kb"),
+        labelled,
+        str(tmp_path),
+        chunk_sizes=(400,),
+        top_ks=(1, 5),
+        quantizations=(None, "int8"),
+        nprobes=(1,),
+        modes=("dense", "lexical"),
+        embedder=embedder,
+    )
+
+    configs = {(r["mode"], r["backend"], r["nprobe"], r["top_k"]) for r in results}
+    assert len(results) == len(configs) == 10  # 4 dense backends x 2 k + bm25 x 2 k
+    by_config = {(r["mode"], r["backend"], r["top_k"]): r for r in results if r["nprobe"] is None}
+    assert by_config[("lexical", "bm25", 5)]["recall"] > 0.9
+    assert by_config[("dense", "exact", 5)]["recall"] >= by_config[("dense", "exact", 1)]["recall"]
+    assert all(0 <= r["ndcg"] <= 1 and 0 <= r["mrr"] <= 1 for r in results)
+    json.dumps(results)
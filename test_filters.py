@@ -0,0 +1,147 @@
+"""
+Tests for metadata filters (where=) and their attribute indexes (offline).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from lib.filters import AttributeIndex
+from lib.vector_store import SimpleVectorStore
+
+METADATA = [
+    {"source": "a.txt", "tenant": "acme", "year": 2021},
+    {"source": "b.txt", "tenant": "acme", "year": 2023, "date": "2023-05-01"},
+    {"source": "c.txt", "tenant": "globex", "year": 2024, "date": "2024-02-10"},
+    {"source": "d.txt", "tenant": "globex", "year": 2022.5},
+    {"source": "e.txt", "tags": ["x"]},
+]
+
+
+def matches(index, where):
+    return list(np.flatnonzero(index.mask(where)))
+
+
+@pytest.fixture
+def index():
+    index = AttributeIndex()
+    index.add(METADATA)
+    return index
+
+
+def test_equality_and_membership(index):
+    assert matches(index, {"tenant": "acme"}) == [0, 1]
+    assert matches(index, {"tenant": {"$in": ["globex", "initech"]}}) == [2, 3]
+    assert matches(index, {"tenant": {"$ne": "acme"}}) == [2, 3]
+    assert matches(index, {"tenant": {"$nin": ["acme"]}}) == [2, 3]
+    assert matches(index, {"tenant": "initech"}) == []
+    assert matches(index, {"source": "a.txt", "tenant": "globex"}) == []
+
+
+def test_ranges(index):
+    assert matches(index, {"year": {"$gte": 2022, "$lt": 2024}}) == [1, 3]
+    assert matches(index, {"year": {"$gt": 2023}}) == [2]
+    assert matches(index, {"year": {"$lte": 2021}}) == [0]
+    assert matches(index, {"date": {"$gte": "2024-01-01"}}) == [2]
+    assert matches(index, {"year": {"$gt": "2020"}}) == []  # strings and numbers don't mix
+
+
+def test_boolean_combinations(index):
+    where = {"$or": [{"tenant": "acme", "year": {"$gt": 2022}}, {"source": "d.txt"}]}
+    assert matches(index, where) == [1, 3]
+    assert matches(index, {"$and": [{"tenant": "globex"}, {"year": {"$lt": 2023}}]}) == [3]
+
+
+def test_bad_filters(index):
+    with pytest.raises(ValueError, match="Unknown filter operator"):
+        index.mask({"year": {"$between": [1, 2]}})
+    with pytest.raises(ValueError, match="Cannot filter"):
+        index.mask({"tags": ["x"]})
+
+
+def test_add_recodes_and_keep(index):
+    index.add([{"tenant": "aaa", "year": 2025}])
+    assert matches(index, {"tenant": "acme"}) == [0, 1]
+    assert matches(index, {"tenant": "aaa"}) == [5]
+    assert matches(index, {"year": {"$gte": 2024}}) == [2, 5]
+
+    index.keep(np.array([False, True, True, True, True, True]))
+    assert matches(index, {"tenant": "acme"}) == [0]
+    assert matches(index, {"year": {"$gte": 2024}}) == [1, 4]
+
+
+@pytest.fixture
+def store(fake_embedder):
+    s = SimpleVectorStore()
+    texts = [f"chunk {i}" for i in range(200)]
+    metadata = [{"tenant": f"t{i % 4}", "n": i} for i in range(200)]
+    s.add_texts(texts, metadatas=metadata)
+    return s
+
+
+def test_filter_applies_before_top_k(store, fake_embedder):
+    # With post-filtering a rare tenant would usually vanish from the top 3
+    results = store.search("chunk 5", top_k=3, where={"tenant": "t3", "n": {"$lt": 20}})
+
+    assert len(results) == 3
+    assert all(r["metadata"]["tenant"] == "t3" and r["metadata"]["n"] < 20 for r in results)
+
+    q = fake_embedder(["chunk 5"])[0]
+    q = q / np.linalg.norm(q)
+    eligible = [i for i in range(200) if i % 4 == 3 and i < 20]
+    expected = sorted(eligible, key=lambda i: -(store.embeddings[i] @ q))[:3]
+    assert [r["id"] for r in results] == expected
+
+
+def test_filter_with_ann_and_quantization(store):
+    store.build_ann(nlist=8, nprobe=2)
+    store.quantize("int8")
+    for where in [{"tenant": "t1"}, {"n": 7}]:
+        results = store.search("chunk 7", top_k=5, where=where)
+        assert results
+        assert all(store.filters.mask(where)[r["id"]] for r in results)
+    assert store.search("chunk 7", where={"tenant": "nobody"}) == []
+
+
+def test_filter_batch_and_lexical(store):
+    store.build_lexical()
+    batch = store.search_batch(["chunk 1", "chunk 2"], top_k=2, where={"tenant": "t2"})
+    assert all(r["metadata"]["tenant"] == "t2" for results in batch for r in results)
+
+    results = store.search("chunk", top_k=10, mode="lexical", where={"n": {"$gte": 195}})
+    assert sorted(r["metadata"]["n"] for r in results) == [195, 196, 197, 198, 199]
+
+
+def test_filters_follow_updates_and_persist(store, tmp_path):
+    store.build_filters()
+    store.remove_where(lambda m: m["n"] < 100)
+    store.add_texts(["late chunk"], metadatas=[{"tenant": "t9", "n": 500}])
+    assert [r["text"] for r in store.search("late chunk", where={"tenant": "t9"})] == ["late chunk"]
+
+    store.save(str(tmp_path / "index"))
+    loaded = SimpleVectorStore()
+    loaded.load(str(tmp_path / "index"))
+
+    assert loaded.filters is not None
+    for where in [{"tenant": "t9"}, {"n": {"$gte": 150, "$lt": 160}}]:
+        np.testing.assert_array_equal(loaded.filters.mask(where), store.filters.mask(where))
+
+
+def test_concurrent_first_filtered_searches_build_the_index_once(store, monkeypatch, capsys):
+    built = []
+    index_filters = SimpleVectorStore._index_filters
+
+    def counting(self, fields=None):
+        built.append(fields)
+        return index_filters(self, fields)
+
+    monkeypatch.setattr(SimpleVectorStore, "_index_filters", counting)
+    with ThreadPoolExecutor(8) as pool:
+        results = list(
+            pool.map(lambda n: store.search("chunk", top_k=3, where={"n": n}), range(16))
+        )
+
+    assert built == [None] and store.filters is not None
+    assert [r[0]["metadata"]["n"] for r in results] == list(range(16))
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,111 @@
+"""
+Tests for lib.http_client against a local fake server.
+"""
+
+import json
+import time
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from lib.http_client import APIError, HTTPClient, RateLimiter
+
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    """Replies with the next (status, body) from the server's script."""
+
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests.append(
+            {"path": self.path, "json": json.loads(body), "client": self.client_address,
+             "auth": self.headers.get("Authorization")}
+        )
+        status, payload = self.server.script.pop(0) if self.server.script else (200, {"ok": True})
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(http_server):
+    s = http_server(ScriptedHandler)
+    s.script = []
+    return s
+
+
+def make_client(server, **kwargs):
+    kwargs.setdefault("backoff_base", 0.01)
+    return HTTPClient(base_url=server.base_url, api_key="secret", **kwargs)
+
+
+def test_post_json_and_auth_header(server):
+    client = make_client(server)
+    assert client.post_json("/echo", {"x": 1}) == {"ok": True}
+    assert server.requests[0]["path"] == "/echo"
+    assert server.requests[0]["json"] == {"x": 1}
+    assert server.requests[0]["auth"] == "Bearer secret"
+
+
+def test_connections_are_reused(server):
+    client = make_client(server)
+    for _ in range(5):
+        client.post_json("/echo", {})
+    assert len({r["client"] for r in server.requests}) == 1
+
+
+def test_retries_on_429_and_5xx(server):
+    server.script = [(429, {"error": "slow down"}), (502, {}), (200, {"value": 42})]
+    client = make_client(server, max_retries=3)
+    assert client.post_json("/echo", {}) == {"value": 42}
+    assert len(server.requests) == 3
+
+
+def test_gives_up_after_max_retries(server):
+    server.script = [(503, {})] * 3
+    client = make_client(server, max_retries=2)
+    with pytest.raises(APIError) as excinfo:
+        client.post_json("/echo", {})
+    assert excinfo.value.status == 503
+    assert len(server.requests) == 3
+
+
+def test_client_errors_are_not_retried(server):
+    server.script = [(400, {"error": "bad request"})]
+    client = make_client(server, max_retries=3)
+    with pytest.raises(APIError) as excinfo:
+        client.post_json("/echo", {})
+    assert excinfo.value.status == 400
+    assert "bad request" in excinfo.value.body
+    assert len(server.requests) == 1
+
+
+def test_connection_errors_raise_api_error():
+    client = HTTPClient(base_url="http://127.0.0.1:9", max_retries=1, backoff_base=0.01)
+    with pytest.raises(APIError):
+        client.post_json("/echo", {})
+
+
+def test_rate_limiter_spaces_requests():
+    limiter = RateLimiter(rate=50, burst=1)
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.acquire()
+    assert time.monotonic() - start >= 5 / 50 * 0.9
+
+
+def test_rate_limiter_allows_bursts():
+    limiter = RateLimiter(rate=1, burst=5)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+    assert time.monotonic() - start < 0.5
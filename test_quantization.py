@@ -0,0 +1,91 @@
+"""
+Tests for int8 scalar and product quantization (offline).
+"""
+
+import numpy as np
+import pytest
+
+import lib.vector_store as vector_store
+from lib.ann import recall_at_k
+from lib.quantization import ProductQuantizer, ScalarQuantizer, default_subspaces
+from lib.vector_store import SimpleVectorStore
+
+DIM = 32
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(7)
+    centers = rng.normal(size=(50, DIM))
+    data = np.repeat(centers, 20, axis=0) + rng.normal(scale=0.3, size=(1000, DIM))
+    return (data / np.linalg.norm(data, axis=1, keepdims=True)).astype(np.float32)
+
+
+@pytest.fixture
+def store(vectors, monkeypatch):
+    lookup = {f"row {i}": v for i, v in enumerate(vectors)}
+    monkeypatch.setattr(vector_store, "get_embeddings", lambda texts, **kw: np.array([lookup[t] for t in texts]))
+    monkeypatch.setattr(vector_store, "get_embedding", lambda text: lookup[text])
+
+    s = SimpleVectorStore()
+    s.add_texts(list(lookup), metadatas=[{"row": i} for i in range(len(vectors))])
+    return s
+
+
+def exact_top(vectors, queries, k):
+    return [np.argsort(-row)[:k] for row in queries @ vectors.T]
+
+
+@pytest.mark.parametrize("quantizer", [ScalarQuantizer(), ProductQuantizer(m=8)])
+def test_code_scores_approximate_inner_products(quantizer, vectors):
+    quantizer.train(vectors)
+    codes = quantizer.encode(vectors)
+    queries = vectors[:20]
+
+    approx = quantizer.score(codes, queries)
+    np.testing.assert_allclose(approx, queries @ quantizer.decode(codes).T, atol=1e-4)
+
+    found = [np.argsort(-row)[:10] for row in approx]
+    assert recall_at_k(exact_top(vectors, queries, 10), found) > 0.6
+
+
+def test_code_sizes(vectors):
+    int8, pq = ScalarQuantizer(), ProductQuantizer(m=4)
+    int8.train(vectors)
+    pq.train(vectors)
+    assert int8.encode(vectors).nbytes * 4 == vectors.nbytes
+    assert pq.encode(vectors).nbytes * 32 == vectors.nbytes
+
+
+def test_default_subspaces():
+    assert default_subspaces(1536) == 192
+    assert default_subspaces(100) == 10
+
+
+@pytest.mark.parametrize("method", ["int8", "pq"])
+def test_store_search_with_rerank_matches_exact(store, method):
+    store.quantize(method, rerank=10, **({"m": 8} if method == "pq" else {}))
+    for i in (0, 123, 999):
+        approx = store.search(f"row {i}", top_k=5)
+        exact = store.search(f"row {i}", top_k=5, exact=True)
+        assert approx[0]["metadata"] == {"row": i}
+        assert [r["text"] for r in approx] == [r["text"] for r in exact]
+        assert [r["score"] for r in approx] == pytest.approx([r["score"] for r in exact], abs=1e-5)
+
+
+def test_quantized_store_persists_and_combines_with_ann(store, tmp_path):
+    store.build_ann(nlist=25, nprobe=5)
+    store.quantize("pq", m=8, rerank=5)
+    store.save(tmp_path / "index")
+
+    loaded = SimpleVectorStore()
+    loaded.load(tmp_path / "index")
+    assert isinstance(loaded.quantizer, ProductQuantizer)
+    assert loaded.codes.dtype == np.uint8 and loaded.codes.shape == (1000, 8)
+    assert loaded.rerank == 5
+    assert loaded.search("row 500", top_k=3)[0]["metadata"] == {"row": 500}
+
+    loaded.add_texts(["row 1"], metadatas=[{"row": "copy"}])
+    assert loaded.codes.shape == (1001, 8)
+    loaded.remove_where(lambda m: m["row"] == "copy")
+    assert loaded.codes.shape == (1000, 8)
@@ -0,0 +1,214 @@
+"""
+Tests for request micro-batching (lib.batching) and the query server (no network).
+"""
+
+import json
+import socket
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import lib.rag_system as rag_system
+from lib.batching import Overloaded, QueryBatcher
+from lib.embedders import HashingEmbedder
+from lib.rag_system import RAGSystem
+from lib.vector_store import SimpleVectorStore
+from server import MAX_BODY, make_server
+
+TEXTS = [
+    "Embeddings map text to vectors.",
+    "Vector databases index embeddings for search.",
+    "Chunking splits documents into pieces.",
+    "Cats sleep most of the day.",
+]
+
+
+class CountingEmbedder(HashingEmbedder):
+    """Hashing embedder recording each embed() call; blocks while ``gate`` is clear."""
+
+    def __init__(self):
+        super().__init__(dim=64)
+        self.calls = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def embed(self, texts, batch_size=64):
+        self.gate.wait(5)
+        self.calls.append(list(texts))
+        return super().embed(texts, batch_size)
+
+
+@pytest.fixture
+def store():
+    s = SimpleVectorStore(embedder=CountingEmbedder())
+    s.add_texts(TEXTS, [{"topic": "pets" if "Cats" in t else "rag"} for t in TEXTS])
+    s.build_lexical()
+    s.embedder.calls.clear()
+    return s
+
+
+def test_concurrent_searches_share_one_embedding_call(store):
+    queries = ["what are embeddings", "vector database", "chunking documents", "cats"]
+    expected = [store.search(q, top_k=2) for q in queries]
+    store.embedder.calls.clear()
+
+    with QueryBatcher(store, max_batch=len(queries), max_wait_ms=1000) as batcher:
+        futures = [batcher.submit(q, top_k=2) for q in queries]
+        results = [future.result(5) for future in futures]
+        stats = batcher.stats()
+
+    assert store.embedder.calls == [queries]
+    assert [[r["id"] for r in hits] for hits, _ in results] == [
+        [r["id"] for r in hits] for hits in expected
+    ]
+    assert all(vector.shape == (64,) for _, vector in results)
+    assert stats["batches"] == 1 and stats["mean_batch_size"] == 4
+    assert stats["completed"] == 4 and stats["latency_ms"]["p50"] > 0
+
+
+def test_requests_are_grouped_by_mode_filter_and_top_k(store):
+    with QueryBatcher(store, max_batch=3, max_wait_ms=1000) as batcher:
+        lexical = batcher.submit("cats", top_k=1, mode="lexical")
+        filtered = batcher.submit("embeddings", top_k=3, where={"topic": "pets"})
+        plain = batcher.submit("embeddings", top_k=1)
+        lexical_hits, lexical_vector = lexical.result(5)
+        filtered_hits, _ = filtered.result(5)
+        plain_hits, _ = plain.result(5)
+
+    assert store.embedder.calls == [["embeddings", "embeddings"]]
+    assert lexical_vector is None and lexical_hits[0]["id"] == 3
+    assert [r["metadata"]["topic"] for r in filtered_hits] == ["pets"]
+    assert len(plain_hits) == 1 and plain_hits[0]["id"] == 0
+
+
+@pytest.mark.parametrize("mode", ["dense", "hybrid", "lexical"])
+def test_batched_results_equal_unbatched_for_any_top_k_mix(mode):
+    # Enough chunks that hybrid fusion's candidate depth depends on top_k
+    words = "vector search index embeddings chunk document cat dog sleep database".split()
+    words += "text model query rank fuse".split()
+    texts = [
+        " ".join(words[(7 * i + 3 * j) % len(words)] for j in range(1 + i % 5)) for i in range(40)
+    ]
+    store = SimpleVectorStore(embedder=HashingEmbedder(dim=64))
+    store.add_texts(texts)
+    store.build_lexical()
+
+    requests = [(q, k) for q in ["cat sleep", "query model rank", "vector search"] for k in (1, 8)]
+    expected = [store.search(q, top_k=k, mode=mode) for q, k in requests]
+    with QueryBatcher(store, max_batch=len(requests), max_wait_ms=1000) as batcher:
+        futures = [batcher.submit(q, top_k=k, mode=mode) for q, k in requests]
+        results = [future.result(5)[0] for future in futures]
+        assert batcher.stats()["batches"] == 1
+
+    assert [[r["id"] for r in hits] for hits in results] == [
+        [r["id"] for r in hits] for hits in expected
+    ]
+
+
+def test_full_queue_is_rejected_and_errors_reach_their_caller(store):
+    store.embedder.gate.clear()
+    batcher = QueryBatcher(store, max_batch=1, max_wait_ms=0, max_queue=2)
+    try:
+        first = batcher.submit("held by the embedder")
+        while batcher.stats()["queue_depth"]:  # wait until the batcher picked it up
+            pass
+        queued, bad = batcher.submit("one"), batcher.submit("bad mode", mode="fuzzy")
+        with pytest.raises(Overloaded, match="queue is full"):
+            batcher.submit("two")
+        assert batcher.stats()["rejected"] == 1
+
+        store.embedder.gate.set()
+        assert first.result(5)[0] and queued.result(5)[0]
+        with pytest.raises(ValueError, match="Unknown search mode"):
+            bad.result(5)
+    finally:
+        store.embedder.gate.set()
+        batcher.close()
+    assert batcher.stats()["failed"] == 1
+
+
+def _call(base_url, path, payload=None):
+    data = None if payload is None else json.dumps(payload).encode("utf-8")
+    request = urllib.request.Request(base_url + path, data=data)
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, json.loads(response.read()), response.headers
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read()), e.headers
+
+
+@pytest.fixture
+def server(store, tmp_path, monkeypatch):
+    store.save(str(tmp_path / "index"))
+    monkeypatch.setattr(
+        rag_system, "call_llm", lambda messages, model=None: f"Re: {messages[-1]['content']}"
+    )
+    rag = RAGSystem(str(tmp_path / "index"), answer_cache=False)
+    server = make_server(rag, port=0)
+    server.base_url = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    server.batcher.close()
+
+
+def test_server_search_query_and_stats(server):
+    status, body, _ = _call(server.base_url, "/search", {"query": "cats", "top_k": 1})
+    assert status == 200 and body["results"][0]["text"] == TEXTS[3]
+
+    status, body, _ = _call(server.base_url, "/query", {"question": "What are embeddings?"})
+    assert status == 200 and "Embeddings map text to vectors." in body["answer"]
+
+    status, body, _ = _call(server.base_url, "/stats")
+    assert status == 200 and body["chunks"] == 4
+    assert body["batcher"]["completed"] == 2 and body["batcher"]["rejected"] == 0
+    assert _call(server.base_url, "/health")[1] == {"status": "ok", "chunks": 4}
+
+
+def test_server_rejects_bad_requests_and_overload(server, monkeypatch):
+    assert _call(server.base_url, "/search", {"top_k": 1})[0] == 400
+    assert _call(server.base_url, "/search", {"query": "x", "top_k": "3"})[0] == 400
+    assert _call(server.base_url, "/search", {"query": "x", "mode": "fuzzy"})[0] == 400
+    assert _call(server.base_url, "/nope", {})[0] == 404
+
+    def overloaded(*args, **kwargs):
+        raise Overloaded("Query queue is full (256 requests waiting)")
+
+    monkeypatch.setattr(server.batcher, "submit", overloaded)
+    status, body, headers = _call(server.base_url, "/search", {"query": "cats"})
+    assert status == 503 and "queue is full" in body["error"]
+    assert headers["Retry-After"] == "1"
+
+
+@pytest.mark.parametrize("length", [str(MAX_BODY + 1), "-5", "lots"])
+def test_server_hangs_up_on_bodies_it_does_not_read(server, length):
+    # A second request pipelined behind the body must not be answered
+    follow_up = b"GET /health HTTP/1.1\r\nHost: x\r\n\r\n"
+    with socket.create_connection(("127.0.0.1", server.server_port), timeout=5) as conn:
+        conn.sendall(
+            f"POST /search HTTP/1.1\r\nHost: x\r\nContent-Length: {length}\r\n\r\n".encode()
+            + follow_up
+        )
+        response = b""
+        while chunk := conn.recv(65536):
+            response += chunk
+    head, _, body = response.partition(b"\r\n\r\n")
+    assert head.startswith(b"HTTP/1.1 400") and b"Connection: close" in head
+    assert b"HTTP/1.1" not in body  # only one response, then the server closed
+
+
+def test_server_upserts_and_deletes_online(server):
+    chunks = [{"id": "pets", "text": "Dogs love long walks.", "metadata": {"topic": "pets"}}]
+    status, body, _ = _call(server.base_url, "/upsert", {"chunks": chunks})
+    assert status == 200 and body == {"upserted": 1, "replaced": 0}
+    status, body, _ = _call(server.base_url, "/search", {"query": "dogs walks", "top_k": 1})
+    assert body["results"][0]["chunk_id"] == "pets"
+
+    assert _call(server.base_url, "/delete", {"ids": ["pets", "nope"]})[1] == {"deleted": 1}
+    assert _call(server.base_url, "/stats")[1]["tombstones"] == 1
+    assert _call(server.base_url, "/health")[1]["chunks"] == 4
+    assert _call(server.base_url, "/upsert", {"chunks": [{"id": "x"}]})[0] == 400
+    assert _call(server.base_url, "/delete", {"ids": [1]})[0] == 400
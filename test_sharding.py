@@ -0,0 +1,136 @@
+"""
+Tests for multi-process sharded search (lib.sharding); vectors are random, no network.
+"""
+
+import threading
+
+import numpy as np
+import pytest
+
+from lib.rag_system import RAGSystem
+from lib.sharding import merge_top_k, score_shard, shard_bounds
+from lib.vector_store import SimpleVectorStore
+
+DIM = 16
+
+
+def random_vectors(n, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(n, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def ids(results):
+    return [[r["id"] for r in hits] for hits in results]
+
+
+@pytest.fixture
+def store():
+    s = SimpleVectorStore()
+    vectors = random_vectors(500)
+    metadatas = [{"parity": i % 2} for i in range(len(vectors))]
+    s.add_texts([f"chunk {i}" for i in range(len(vectors))], metadatas, embeddings=vectors)
+    return s
+
+
+def test_shard_bounds_cover_every_row_once():
+    assert shard_bounds(10, 3) == [(0, 3), (3, 6), (6, 10)]
+    assert shard_bounds(2, 2) == [(0, 1), (1, 2)]
+
+
+def test_merged_shard_top_k_matches_exact_search():
+    matrix, queries = random_vectors(300), random_vectors(7, seed=1)
+    allowed = np.arange(300) % 3 == 0
+    for mask in (None, allowed):
+        parts = [
+            score_shard(matrix[a:b], queries, 5, a, None if mask is None else mask[a:b])
+            for a, b in shard_bounds(300, 4)
+        ]
+        scores = queries @ matrix.T
+        if mask is not None:
+            scores[:, ~mask] = -np.inf
+        expected = np.argsort(-scores, axis=1)[:, :5]
+        for (rows, row_scores), want in zip(merge_top_k(parts, 5), expected):
+            assert rows.tolist() == want.tolist()
+            assert np.all(np.diff(row_scores) <= 0)
+
+
+def test_sharded_store_matches_single_process(store):
+    queries = random_vectors(20, seed=2)
+    names = [f"q{i}" for i in range(len(queries))]
+    expected = store.search_batch(names, top_k=5, query_vectors=queries)
+    filtered = store.search_batch(names, top_k=5, query_vectors=queries, where={"parity": 1})
+
+    store.shard(3)
+    try:
+        assert store.shards.shards == 3 and store.shards.shared == "shm"
+        assert ids(store.search_batch(names, top_k=5, query_vectors=queries)) == ids(expected)
+        hits = store.search_batch(names, top_k=5, query_vectors=queries, where={"parity": 1})
+        assert ids(hits) == ids(filtered)
+        assert all(r["metadata"]["parity"] == 1 for r in hits[0])
+        single = store.search("q0", top_k=5, query_vector=queries[0])
+        assert ids([single]) == ids(expected[:1])
+        assert [r["score"] for r in single] == pytest.approx([r["score"] for r in expected[0]])
+
+        # Rows appended after shard() are scored here and merged in
+        store.add_texts(["new chunk"], [{"parity": 1}], embeddings=queries[:1])
+        assert store.shards is not None
+        assert store.search("q0", top_k=1, query_vector=queries[0])[0]["id"] == 500
+        hits = store.search("q0", top_k=1, query_vector=queries[0], where={"parity": 0})
+        assert hits[0]["id"] != 500
+
+        # Removing rows renumbers them, which stops the workers
+        store.remove_where(lambda m: m["parity"] == 0)
+        assert store.shards is None
+    finally:
+        store.unshard()
+
+
+def test_rag_system_shards_a_loaded_index_over_its_file(store, tmp_path):
+    path = str(tmp_path / "index")
+    store.save(path)
+    query = random_vectors(1, seed=3)[0]
+    expected = store.search("q", top_k=5, query_vector=query)
+
+    rag = RAGSystem(path, answer_cache=False, shards=2)
+    try:
+        assert rag.store.shards.shards == 2 and rag.store.shards.shared == "file"
+        assert ids([rag.store.search("q", top_k=5, query_vector=query)]) == ids([expected])
+    finally:
+        rag.store.unshard()
+
+
+def test_reload_respawns_workers_without_blocking_searches(store, tmp_path, monkeypatch):
+    path = str(tmp_path / "index")
+    store.save(path)
+    reader, writer = SimpleVectorStore(), SimpleVectorStore()
+    reader.load(path)
+    writer.load(path)
+    reader.shard(2)
+    old_pool = reader.shards
+    query = random_vectors(1, seed=4)[0]
+    writer.upsert(["0"], ["chunk 0 again"], embeddings=[query])
+    writer.compact()
+
+    spawning, release = threading.Event(), threading.Event()
+    shard = SimpleVectorStore.shard
+
+    def slow_shard(self, shards=None):
+        if self is not reader:  # the copy being loaded
+            spawning.set()
+            release.wait(5)
+        shard(self, shards)
+
+    monkeypatch.setattr(SimpleVectorStore, "shard", slow_shard)
+    refresh = threading.Thread(target=reader.refresh)
+    refresh.start()
+    try:
+        assert spawning.wait(5)
+        # The old workers keep serving while the new ones start
+        assert reader.search("q", top_k=1, query_vector=query)[0]["chunk_id"] != "0"
+        release.set()
+        refresh.join(5)
+        assert reader.shards is not old_pool and reader.shards.shards == 2
+        assert reader.search("q", top_k=1, query_vector=query)[0]["chunk_id"] == "0"
+    finally:
+        release.set()
+        reader.unshard()
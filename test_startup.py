@@ -0,0 +1,104 @@
+"""
+Tests for side-effect-free imports, deferred configuration and lazy store loading.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+import benchmark
+from lib import settings
+from lib.http_client import APIError, client_from_env
+from lib.rag_system import RAGSystem
+from lib.vector_store import SimpleVectorStore
+
+
+def _run_without_key(code):
+    env = {k: v for k, v in os.environ.items() if k != "OPENROUTER_API_KEY"}
+    return subprocess.run(
+        [sys.executable, "-c", code],
+        env=env,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+
+
+def test_importing_lib_loads_nothing_heavy():
+    result = _run_without_key(
+        "import sys, lib\n"
+        "print(sorted(m for m in ('numpy', 'requests', 'httpx', 'dotenv', 'lib.embedding')"
+        " if m in sys.modules))\n"
+        "print(lib.SimpleVectorStore.__name__, lib.tracing.__name__)"
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines() == ["[]", "SimpleVectorStore lib.tracing"]
+
+
+def test_http_client_and_tracing_import_without_numpy():
+    result = _run_without_key(
+        "import sys\n"
+        "from lib import http_client, tracing\n"
+        "print(sorted(m for m in ('numpy', 'requests', 'httpx') if m in sys.modules))\n"
+        "h = tracing.Histogram()\n"
+        "h.observe(1.0)\n"
+        "print(h.quantiles(), 'numpy' in sys.modules)"
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines() == ["[]", "[1.0, 1.0, 1.0] True"]
+
+
+def test_rag_system_imports_without_a_key():
+    result = _run_without_key(
+        "import sys\n"
+        "from lib.rag_system import RAGSystem\n"
+        "print('requests' in sys.modules, 'asyncio' in sys.modules)"
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == "False False\n"
+
+
+def test_unknown_attribute_raises():
+    import lib
+
+    with pytest.raises(AttributeError, match="no attribute 'nope'"):
+        lib.nope
+
+
+def test_client_from_env_needs_a_key(monkeypatch):
+    monkeypatch.setattr(settings, "_loaded", True)
+    monkeypatch.delenv("OPENROUTER_API_KEY")
+    with pytest.raises(APIError, match="OPENROUTER_API_KEY not set"):
+        client_from_env()
+
+
+@pytest.fixture
+def index_path(tmp_path, fake_embedder):
+    store = SimpleVectorStore()
+    store.add_texts(["Embeddings are vectors.", "Chunking splits documents."])
+    store.save(str(tmp_path / "index"))
+    return str(tmp_path / "index")
+
+
+def test_store_is_opened_on_first_use(tmp_path, index_path):
+    missing = RAGSystem(str(tmp_path / "missing"), answer_cache=False)
+    with pytest.raises(FileNotFoundError):
+        missing.store
+
+    rag = RAGSystem(index_path, answer_cache=False)
+    assert rag._store is None
+    assert len(rag.store) == 2
+    assert rag.load() is rag.store
+
+
+def test_preload_loads_in_the_background(index_path):
+    rag = RAGSystem(index_path, answer_cache=False, preload=True)
+    assert len(rag.store) == 2
+
+
+def test_measure_startup(index_path):
+    startup = benchmark.measure_startup(index_path, runs=1)
+    assert set(startup) == set(benchmark.STARTUP_SNIPPETS) | {"process_ms"}
+    assert 0 < startup["import_lib_ms"] < startup["import_rag_system_ms"]
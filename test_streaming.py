@@ -0,0 +1,130 @@
+"""
+Tests for streamed (server-sent events) LLM responses.
+"""
+
+import asyncio
+import json
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+import lib.rag_system as rag_system
+from lib.http_client import AsyncHTTPClient, HTTPClient, iter_sse_data, set_async_client, set_client
+from lib.rag_system import RAGSystem
+from lib.vector_store import SimpleVectorStore
+from test_embedding import stub_vector
+
+PIECES = ["Embeddings ", "are ", "vectors", "."]
+
+
+class StreamingHandler(BaseHTTPRequestHandler):
+    """Streams PIECES as chat-completion chunks; /embeddings returns stub vectors."""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(body)
+
+        if self.path.endswith("/embeddings"):
+            inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            raw = json.dumps(
+                {"data": [{"index": i, "embedding": stub_vector(t)} for i, t in enumerate(inputs)]}
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+            return
+
+        if not body.get("stream"):
+            raw = json.dumps({"choices": [{"message": {"content": "".join(PIECES)}}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        self.wfile.write(b": keep-alive\n\n")
+        self.wfile.write(b'data: {"choices": [{"delta": {"role": "assistant"}}]}\n\n')
+        for piece in PIECES:
+            event = {"choices": [{"delta": {"content": piece}}]}
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, *args):
+        pass
+
+
+class UnavailableHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(400)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(http_server):
+    server = http_server(StreamingHandler)
+    set_client(HTTPClient(base_url=server.base_url, api_key="test", backoff_base=0.01))
+    yield server
+    set_client(None)
+
+
+@pytest.fixture
+def rag(server, tmp_path):
+    store = SimpleVectorStore()
+    store.add_texts(["Embeddings are vectors.", "Chunking splits documents."])
+    store.save(str(tmp_path / "index"))
+    return RAGSystem(str(tmp_path / "index"))
+
+
+def test_iter_sse_data():
+    lines = [b"data: one", b": comment", b"", "event: x", "data: two", "data: lines", "", "data: [DONE]", "", "data: after"]
+    assert list(iter_sse_data(lines)) == ["one", "two\nlines"]
+
+
+def test_query_stream_yields_pieces(rag, server):
+    pieces = list(rag.query("What are embeddings?", stream=True))
+
+    assert pieces == PIECES
+    assert server.requests[-1]["stream"] is True
+    assert "Context:" in server.requests[-1]["messages"][0]["content"]
+
+
+def test_query_without_stream_is_unchanged(rag):
+    assert rag.query("What are embeddings?") == "".join(PIECES)
+
+
+def test_stream_error_is_yielded(http_server):
+    server = http_server(UnavailableHandler)
+    set_client(HTTPClient(base_url=server.base_url, api_key="test"))
+    try:
+        pieces = list(rag_system.call_llm_stream([{"role": "user", "content": "hi"}]))
+    finally:
+        set_client(None)
+
+    assert len(pieces) == 1 and pieces[0].startswith("Error:")
+
+
+def test_print_stream_returns_text(capsys):
+    assert rag_system.print_stream(iter(PIECES)) == "".join(PIECES)
+    assert capsys.readouterr().out == "".join(PIECES) + "\n\n"
+
+
+def test_aquery_stream_yields_pieces(rag, server):
+    async def main():
+        client = AsyncHTTPClient(base_url=server.base_url, api_key="test")
+        set_async_client(client)
+        try:
+            return [piece async for piece in await rag.aquery("What are embeddings?", stream=True)]
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(main()) == PIECES
@@ -0,0 +1,194 @@
+"""
+Tests for spans, latency histograms, sinks and the instrumented hot path (offline).
+"""
+
+import json
+import urllib.request
+
+import pytest
+
+from lib import settings, tracing
+from lib.context import count_tokens
+from lib.http_client import HTTPClient, set_client
+from lib.rag_system import RAGSystem
+from lib.tracing import JSONLinesSink, Tracer
+from lib.vector_store import SimpleVectorStore
+from test_streaming import PIECES, StreamingHandler
+
+
+class ListSink:
+    def __init__(self):
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_spans_nest_and_record_attributes():
+    sink = ListSink()
+    tracer = Tracer(sinks=[sink])
+
+    with tracer.span("query", top_k=3):
+        with tracer.span("embed") as span:
+            span.set(texts=2)
+        with pytest.raises(KeyError):
+            with tracer.span("score"):
+                raise KeyError("boom")
+
+    embed, score, query = sink.records
+    assert [r["span"] for r in sink.records] == ["embed", "score", "query"]
+    assert embed["parent"] == "query" and embed["texts"] == 2
+    assert score["error"] == "KeyError"
+    assert query["parent"] is None and query["top_k"] == 3
+    assert embed["trace"] == score["trace"] == query["trace"]
+    assert query["ms"] >= embed["ms"]
+
+
+def test_stats_percentiles_and_counters():
+    tracer = Tracer()
+    histogram = tracing.Histogram(window=100)
+    for ms in range(1, 101):
+        histogram.observe(ms / 1000)
+    tracer.histograms["score"] = histogram
+    tracer.count("prompt_tokens", 120)
+    tracer.count("prompt_tokens", 30)
+
+    stats = tracer.stats()
+    score = stats["spans"]["score"]
+    assert score["count"] == 100
+    assert score["mean_ms"] == pytest.approx(50.5)
+    assert score["p50_ms"] == pytest.approx(50.5)
+    assert score["p95_ms"] == pytest.approx(95.05)
+    assert score["p99_ms"] == pytest.approx(99.01)
+    assert stats["counters"] == {"prompt_tokens": 150}
+
+
+def test_disabled_tracer_is_a_noop():
+    sink = ListSink()
+    tracer = Tracer(sinks=[sink], enabled=False)
+
+    first, second = tracer.span("embed"), tracer.span("score", rows=10)
+    assert first is second
+    with first as span:
+        span.set(texts=1)
+    tracer.count("prompt_tokens", 5)
+
+    assert sink.records == []
+    assert tracer.stats() == {"spans": {}, "counters": {}}
+
+
+def test_jsonl_sink(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    tracer = Tracer(sinks=[JSONLinesSink(str(path))])
+    with tracer.span("embed", texts=4):
+        pass
+    with tracer.span("llm"):
+        pass
+    tracer.close()
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [r["span"] for r in records] == ["embed", "llm"]
+    assert records[0]["texts"] == 4
+
+
+def test_prometheus_text_and_endpoint():
+    tracer = Tracer()
+    with tracer.span("score"):
+        pass
+    tracer.count("http_bytes_sent", 512)
+
+    text = tracer.prometheus_text()
+    assert "# TYPE rag_span_seconds summary" in text
+    assert 'rag_span_seconds{span="score",quantile="0.99"}' in text
+    assert 'rag_span_seconds_count{span="score"} 1' in text
+    assert "rag_http_bytes_sent_total 512" in text
+
+    server = tracing.serve_metrics(tracer, port=0)
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert response.read().decode() == tracer.prometheus_text()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_tracer_from_env(monkeypatch, tmp_path):
+    monkeypatch.delenv("RAG_TRACE", raising=False)
+    monkeypatch.delenv("RAG_METRICS_PORT", raising=False)
+    assert not tracing.tracer_from_env().enabled
+
+    monkeypatch.setenv("RAG_TRACE", str(tmp_path / "trace.jsonl"))
+    tracer = tracing.tracer_from_env()
+    assert tracer.enabled and isinstance(tracer.sinks[0], JSONLinesSink)
+    tracer.close()
+
+
+@pytest.fixture
+def traced_rag(http_server, tmp_path):
+    server = http_server(StreamingHandler)
+    set_client(HTTPClient(base_url=server.base_url, api_key="test"))
+    store = SimpleVectorStore()
+    store.add_texts(["Embeddings are vectors.", "Chunking splits documents."])
+    store.save(str(tmp_path / "index"))
+    rag = RAGSystem(str(tmp_path / "index"), answer_cache=False)
+
+    sink = ListSink()
+    tracing.set_tracer(Tracer(sinks=[sink]))
+    yield rag, sink
+    tracing.set_tracer(None)
+    set_client(None)
+
+
+def test_query_is_traced_per_stage(traced_rag):
+    rag, sink = traced_rag
+    assert rag.query("What are embeddings?") == "".join(PIECES)
+
+    by_name = {r["span"]: r for r in sink.records}
+    assert {"query", "retrieve", "embed", "score", "top_k", "context", "prompt", "llm"} <= set(
+        by_name
+    )
+    assert len({r["trace"] for r in sink.records}) == 1
+    assert by_name["embed"]["parent"] == "retrieve"
+    assert by_name["llm"]["prompt_tokens"] > 0
+    assert by_name["llm"]["completion_tokens"] == count_tokens("".join(PIECES))
+
+    counters = tracing.get_tracer().stats()["counters"]
+    assert counters["completion_tokens"] == by_name["llm"]["completion_tokens"]
+    assert counters["http_bytes_sent"] > 0 and counters["http_bytes_received"] > 0
+
+
+def test_streamed_llm_span_records_first_token(traced_rag):
+    rag, sink = traced_rag
+    assert list(rag.query("What are embeddings?", stream=True)) == PIECES
+
+    llm = [r for r in sink.records if r["span"] == "llm"][-1]
+    assert llm["stream"] is True
+    assert 0 <= llm["first_token_ms"] <= llm["ms"]
+    assert llm["completion_tokens"] == count_tokens("".join(PIECES))
+
+
+def test_hot_path_is_quiet_unless_verbose(traced_rag, capsys):
+    rag, _ = traced_rag
+    rag.store.search("embeddings")
+    rag.query("What are embeddings?")
+    assert capsys.readouterr().out == ""
+
+    tracing.set_verbose(True)
+    try:
+        rag.store.search("embeddings")
+    finally:
+        tracing.set_verbose(None)
+    assert "Found 2 results" in capsys.readouterr().out
+
+
+def test_verbose_mode_is_read_after_env_files(monkeypatch):
+    # RAG_VERBOSE may come from .env, which is only loaded on first use
+    monkeypatch.delenv("RAG_VERBOSE", raising=False)
+    monkeypatch.setattr(settings, "load_env", lambda: monkeypatch.setenv("RAG_VERBOSE", "on"))
+    tracing.set_verbose(None)
+    try:
+        assert tracing.is_verbose()
+    finally:
+        monkeypatch.undo()
+        tracing.set_verbose(None)
@@ -0,0 +1,202 @@
+"""
+Offline tests for SimpleVectorStore (embeddings are faked, no network).
+"""
+
+import os
+import pickle
+import shutil
+import threading
+
+import numpy as np
+import pytest
+
+from lib.embedding import cosine_similarity
+from lib.index_format import current_dir, migrate_pickle, read_index, read_manifest
+from lib.vector_store import SimpleVectorStore
+
+
+@pytest.fixture
+def store(fake_embedder):
+    s = SimpleVectorStore()
+    for i in range(50):
+        s.add_text(f"document number {i}", metadata={"source": f"doc{i}.txt"})
+    return s
+
+
+def test_matrix_is_contiguous_normalized_float32(store):
+    emb = store.embeddings
+    assert emb.shape == (50, 32)
+    assert emb.dtype == np.float32
+    assert emb.flags["C_CONTIGUOUS"]
+    np.testing.assert_allclose(np.linalg.norm(emb, axis=1), 1.0, rtol=1e-5)
+
+
+def test_search_matches_bruteforce_cosine(store, fake_embedder):
+    query = "document number 7"
+    results = store.search(query, top_k=5)
+
+    q = fake_embedder([query])[0]
+    vectors = fake_embedder(store.chunks)
+    expected = sorted(
+        range(len(store)),
+        key=lambda i: cosine_similarity(q, vectors[i]),
+        reverse=True,
+    )[:5]
+
+    assert [r["text"] for r in results] == [store.chunks[i] for i in expected]
+    assert results[0]["text"] == query
+    assert results[0]["score"] == pytest.approx(1.0, abs=1e-5)
+    assert set(results[0]) == {"id", "chunk_id", "text", "score", "metadata"}
+    assert [r["id"] for r in results] == expected
+    assert results[0]["metadata"] == {"source": "doc7.txt"}
+
+
+def test_search_top_k_larger_than_store(store):
+    results = store.search("anything", top_k=500)
+    assert len(results) == 50
+    scores = [r["score"] for r in results]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_search_batch_matches_single_search(store):
+    queries = ["document number 3", "document number 41", "unrelated words"]
+    batched = store.search_batch(queries, top_k=4)
+
+    assert len(batched) == len(queries)
+    for query, results in zip(queries, batched):
+        single = store.search(query, top_k=4)
+        assert [r["text"] for r in results] == [r["text"] for r in single]
+        for a, b in zip(results, single):
+            assert a["score"] == pytest.approx(b["score"], abs=1e-6)
+
+
+def test_search_batch_empty_inputs(store):
+    assert store.search_batch([], top_k=3) == []
+    assert SimpleVectorStore().search_batch(["q1", "q2"]) == [[], []]
+
+
+def test_save_load_roundtrip(store, tmp_path):
+    path = tmp_path / "index"
+    store.save(path)
+
+    loaded = SimpleVectorStore()
+    loaded.load(path)
+
+    assert isinstance(loaded.embeddings, np.memmap)
+    assert list(loaded.chunks) == store.chunks
+    assert list(loaded.metadata) == store.metadata
+    np.testing.assert_allclose(loaded.embeddings, store.embeddings, rtol=1e-6)
+    assert loaded.manifest["count"] == 50
+    assert loaded.search("document number 9", top_k=1)[0]["text"] == "document number 9"
+
+
+def test_float16_index(store, tmp_path):
+    path = tmp_path / "index"
+    store.save(path, dtype="float16")
+    assert os.path.getsize(os.path.join(current_dir(path), "embeddings.bin")) == 50 * 32 * 2
+
+    loaded = SimpleVectorStore()
+    loaded.load(path)
+    assert loaded.embeddings.dtype == np.float32
+    np.testing.assert_allclose(loaded.embeddings, store.embeddings, atol=1e-3)
+
+
+def test_rewrites_swap_the_index_atomically(store, tmp_path):
+    path = str(tmp_path / "index")
+    store.save(path)
+    errors, done = [], threading.Event()
+
+    def read():
+        while not done.is_set():
+            try:
+                assert read_manifest(path)["count"] == 50
+                manifest, _, chunks, _ = read_index(path)
+                assert len(chunks) == manifest["count"]
+            except Exception as e:
+                errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(2)]
+    [reader.start() for reader in readers]
+    for _ in range(50):
+        store.save(path)
+    done.set()
+    [reader.join() for reader in readers]
+    assert errors == []
+    # Once no reader is busy, only the live version and the one before it are kept
+    store.save(path)
+    assert sorted(os.listdir(path)) == sorted(
+        [".lock", ".readers", "CURRENT", os.path.basename(current_dir(path)), *_previous(path)]
+    )
+
+
+def _previous(path):
+    versions = [name for name in os.listdir(path) if name.startswith("v-")]
+    return [name for name in versions if name != os.path.basename(current_dir(path))]
+
+
+def test_unversioned_index_is_read_and_replaced(store, tmp_path):
+    path = tmp_path / "index"
+    store.save(path)
+    version = current_dir(path)
+    for name in os.listdir(version):  # the layout before versioned directories
+        shutil.move(os.path.join(version, name), path)
+    os.rmdir(version)
+    os.remove(path / "CURRENT")
+
+    loaded = SimpleVectorStore()
+    loaded.load(path)
+    assert len(loaded) == 50
+    loaded.save(path)
+    loaded.save(path)
+    assert not (path / "manifest.json").exists() and len(_previous(path)) == 1
+
+
+def test_loaded_index_accepts_new_chunks(store, tmp_path):
+    store.save(tmp_path / "index")
+    loaded = SimpleVectorStore()
+    loaded.load(tmp_path / "index")
+
+    loaded.add_text("a brand new chunk", metadata={"source": "new.txt"})
+    assert len(loaded) == 51
+    assert loaded.search("a brand new chunk", top_k=1)[0]["metadata"] == {"source": "new.txt"}
+
+    # The saved index on disk is untouched until the next save
+    reloaded = SimpleVectorStore()
+    reloaded.load(tmp_path / "index")
+    assert len(reloaded) == 50
+
+
+def test_legacy_pickle_is_readable_and_migrates(store, fake_embedder, tmp_path):
+    legacy = tmp_path / "rag_store.pkl"
+    with open(legacy, "wb") as f:
+        pickle.dump(
+            {
+                "chunks": store.chunks,
+                "embeddings": fake_embedder(store.chunks).tolist(),
+                "metadata": store.metadata,
+            },
+            f,
+        )
+
+    loaded = SimpleVectorStore()
+    loaded.load(legacy)
+    np.testing.assert_allclose(loaded.embeddings, store.embeddings, rtol=1e-5)
+
+    migrate_pickle(legacy, tmp_path / "index")
+    migrated = SimpleVectorStore()
+    migrated.load(tmp_path / "index")
+    assert list(migrated.chunks) == store.chunks
+    np.testing.assert_allclose(migrated.embeddings, store.embeddings, rtol=1e-5)
+    assert migrated.manifest["migrated_from"] == "rag_store.pkl"
+
+
+def test_empty_store_roundtrip(tmp_path, fake_embedder):
+    SimpleVectorStore().save(tmp_path / "index")
+
+    loaded = SimpleVectorStore()
+    loaded.load(tmp_path / "index")
+    assert len(loaded) == 0
+    assert loaded.search("anything") == []
+
+    loaded.add_text("first chunk")
+    assert loaded.search("first chunk", top_k=1)[0]["text"] == "first chunk"
@@ -0,0 +1,255 @@
+"""
+Tests for online upserts/deletes, the write-ahead log (lib.wal) and compaction (no network).
+"""
+
+import json
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from lib import tracing
+from lib.embedders import HashingEmbedder
+from lib.index_format import read_manifest
+from lib.tracing import Tracer
+from lib.vector_store import SimpleVectorStore
+from lib.wal import WriteAheadLog, log_path
+
+TEXTS = {
+    "a": "Embeddings map text to vectors.",
+    "b": "Vector databases index embeddings for search.",
+    "c": "Chunking splits documents into pieces.",
+}
+
+
+def make_store():
+    return SimpleVectorStore(embedder=HashingEmbedder(dim=64))
+
+
+@pytest.fixture
+def index(tmp_path):
+    store = make_store()
+    store.add_texts(list(TEXTS.values()), [{"topic": "rag"}] * 3, ids=list(TEXTS))
+    path = str(tmp_path / "index")
+    store.save(path, extra={"files": {"kb.txt": "abc"}})
+    return path
+
+
+def chunk_ids(results):
+    return [r["chunk_id"] for r in results]
+
+
+def test_upsert_replaces_and_delete_masks_chunks():
+    store = make_store()
+    store.add_texts(list(TEXTS.values()), ids=list(TEXTS))
+    with pytest.raises(ValueError, match="already exists"):
+        store.add_texts(["again"], ids=["a"])
+
+    assert store.upsert(["a", "d"], ["Cats sleep all day.", "Dogs bark."]) == 1
+    assert store.get("a")["text"] == "Cats sleep all day."
+    assert len(store) == 5 and store.tombstones == 1
+    assert TEXTS["a"] not in [r["text"] for r in store.search("embeddings text", top_k=5)]
+
+    assert store.delete(["b", "b", "missing"]) == 1
+    assert store.get("b") is None
+    assert sorted(chunk_ids(store.search("vector", top_k=10))) == ["a", "c", "d"]
+    assert chunk_ids(store.search("vector", top_k=10, where={"nope": 1})) == []
+
+    # An id repeated within one upsert keeps its last version
+    store.upsert(["e", "e"], ["first", "second"])
+    assert store.get("e")["text"] == "second" and store.tombstones == 3
+
+
+def test_changes_are_logged_and_replayed_on_load(index):
+    store = make_store()
+    store.load(index)
+    store.upsert(["b"], ["Vector indexes speed up search."], [{"topic": "rag"}])
+    store.delete(["c"])
+    assert len(open(log_path(index)).readlines()) == 2
+
+    reloaded = make_store()
+    reloaded.load(index)
+    assert reloaded.get("b")["text"] == "Vector indexes speed up search."
+    assert reloaded.get("c") is None and reloaded.tombstones == 2
+    assert sorted(chunk_ids(reloaded.search("search", top_k=5))) == ["a", "b"]
+
+    # A torn last line (crash mid-append) is ignored, then cut before the next append
+    with open(log_path(index), "a") as f:
+        f.write('{"seq": 3, "op": "del')
+    torn = make_store()
+    torn.load(index)
+    assert torn.get("c") is None and torn.get("a") is not None
+    torn.delete(["a"])
+    seqs = [json.loads(line)["seq"] for line in open(log_path(index))]
+    assert seqs == [1, 2, 3]
+
+
+def test_separate_log_instances_never_reuse_sequence_numbers(tmp_path):
+    # Two instances on one file stand in for two processes: only the file lock is shared
+    path = str(tmp_path / "index.wal")
+    first, second = WriteAheadLog(path), WriteAheadLog(path)
+    assert first.append([{"op": "delete", "id": "a"}]) == 1
+    assert second.last_seq == 1  # warm both views
+    assert second.append([{"op": "delete", "id": "b"}]) == 2
+    assert first.append([{"op": "delete", "id": "c"}]) == 3
+
+    def write(log):
+        for i in range(25):
+            log.append([{"op": "delete", "id": str(i)}] * 2)
+
+    threads = [threading.Thread(target=write, args=(log,)) for log in (first, second) * 2]
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+    assert [r["seq"] for r in first.records()] == list(range(1, 204))
+
+    # A trimmed-empty log keeps counting where it left off
+    second.truncate(203)
+    assert not os.path.exists(path)
+    assert first.append([{"op": "delete", "id": "d"}]) == 204
+
+
+def test_writer_catches_up_with_records_another_writer_logged(index):
+    first, second = make_store(), make_store()
+    first.load(index)
+    second.load(index)
+    second.log = WriteAheadLog(log_path(index))  # as if in another process
+    assert first.log.last_seq == second.log.last_seq == 0  # warm both views
+
+    second.upsert(["x"], ["Written by the other process."])
+    first.upsert(["c"], ["Chunking splits text."])
+    assert first.get("x")["text"] == "Written by the other process."
+    assert [r["seq"] for r in first.log.records()] == [1, 2]
+    assert second.refresh() == 1 and second.get("c")["text"] == "Chunking splits text."
+
+    # A base the other writer rewrote before logging more is loaded again
+    second.compact()
+    second.upsert(["y"], ["Also from the other process."])
+    first.delete(["a"])
+    assert first.manifest["build_id"] == second.manifest["build_id"]
+    assert sorted(first._id_rows()) == ["b", "c", "x", "y"]
+
+
+def test_save_and_compaction_fold_the_log_into_the_index(index):
+    store = make_store()
+    store.load(index)
+    store.upsert(["a"], ["Cats sleep all day."])
+    store.delete(["c"])
+
+    store.compact()
+    manifest = read_manifest(index)
+    assert not os.path.exists(log_path(index))
+    assert manifest["wal_seq"] == 2 and manifest["count"] == 2
+    assert manifest["files"] == {"kb.txt": "abc"}
+    assert store.tombstones == 0 and sorted(store.ids) == ["a", "b"]
+
+    store.upsert(["d"], ["Dogs bark."])
+    assert json.loads(open(log_path(index)).readline())["seq"] == 3
+    store.save(index)
+    assert not os.path.exists(log_path(index)) and read_manifest(index)["wal_seq"] == 3
+    reloaded = make_store()
+    reloaded.load(index)
+    assert sorted(reloaded.ids) == ["a", "b", "d"] and reloaded.get("a")["id"] < 3
+
+
+def test_compaction_keeps_changes_that_are_only_in_memory(index):
+    store = make_store()
+    store.load(index)
+    store.add_texts(["Dogs bark at strangers."], ids=["d"])  # not logged
+    store.build_lexical()
+    store.upsert(["a"], ["Cats sleep all day."])
+
+    store.compact()
+    assert len(store) == 4 and store.get("d")["text"] == "Dogs bark at strangers."
+    assert chunk_ids(store.search("dogs bark", top_k=1, mode="lexical")) == ["d"]
+    reloaded = make_store()
+    reloaded.load(index)
+    assert sorted(reloaded._id_rows()) == ["a", "b", "c", "d"] and reloaded.lexical is not None
+    assert not os.path.exists(log_path(index))
+
+    # Another writer's rewrite is not loaded over changes that exist only here
+    reloaded.remove_where(lambda m: True)
+    store.upsert(["e"], ["Eels swim."])
+    store.compact()
+    with pytest.raises(RuntimeError, match="rewritten by another writer"):
+        reloaded.refresh()
+    assert len(reloaded) == 0
+
+
+def test_searches_and_writes_continue_during_background_compaction(index, monkeypatch):
+    store = make_store()
+    store.load(index)
+    store.upsert(["a"], ["Cats sleep all day."])
+
+    writing, release = threading.Event(), threading.Event()
+    write = SimpleVectorStore._write
+
+    def slow_write(self, *args):
+        if self is not store:  # the compaction's copy of the index
+            writing.set()
+            release.wait(5)
+        write(self, *args)
+
+    monkeypatch.setattr(SimpleVectorStore, "_write", slow_write)
+    thread = store.compact(wait=False)
+    assert writing.wait(5)
+    assert store.compact(wait=False) is thread  # one compaction at a time
+
+    # The rebuild holds no lock: reads and logged writes still go through
+    assert chunk_ids(store.search("cats sleep", top_k=1)) == ["a"]
+    store.upsert(["d"], ["Dogs bark."])
+    release.set()
+    thread.join(5)
+
+    assert read_manifest(index)["wal_seq"] == 1
+    assert [r["id"] for r in map(json.loads, open(log_path(index)))] == ["d"]
+    assert store.tombstones == 0 and store.get("d")["text"] == "Dogs bark."
+    assert chunk_ids(store.search("dogs bark", top_k=1)) == ["d"]
+
+
+def test_store_compacts_itself_after_enough_logged_changes(index):
+    store = make_store()
+    store.load(index)
+    store.compact_after = 3
+    store.upsert(["a", "b"], ["one", "two"])
+    assert store._compaction is None
+    store.delete(["c"])
+    store._compaction.join(5)
+    assert read_manifest(index)["wal_seq"] == 3 and len(store) == 2
+
+
+def test_failed_background_compaction_is_counted_and_retried(index, monkeypatch, capsys):
+    store = make_store()
+    store.load(index)
+    store.upsert(["a"], ["Cats sleep all day."])
+
+    def failing_write(self, *args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(SimpleVectorStore, "_write", failing_write)
+    tracing.set_tracer(Tracer())
+    try:
+        store.compact(wait=False).join(5)
+        assert tracing.get_tracer().stats()["counters"] == {"compaction_failures": 1}
+    finally:
+        tracing.set_tracer(None)
+    assert isinstance(store.compaction_error, OSError)
+    assert capsys.readouterr().out == ""  # quiet unless verbose
+
+    monkeypatch.undo()
+    store.compact()  # the log kept the change
+    assert store.compaction_error is None and read_manifest(index)["wal_seq"] == 1
+
+
+def test_embeddings_of_earlier_results_survive_renumbering(index):
+    store = make_store()
+    store.load(index)
+    results = store.search("vector search", top_k=3)
+    expected = store.embeddings[[r["id"] for r in results]].copy()
+
+    store.delete(["a"])
+    store.compact()  # drops row 0: every other row moves up
+    ids = [r["chunk_id"] for r in results]
+    assert store.embeddings_of(ids) is None  # "a" is gone
+    kept = [i for i, cid in enumerate(ids) if cid != "a"]
+    np.testing.assert_array_equal(store.embeddings_of([ids[i] for i in kept]), expected[kept])